@@ -1,6 +1,15 @@
 from django.contrib import admin
 
-from .models import Appointment, Doctor, Patient
+from .models import Appointment, Doctor, Notification, Owner, Patient
+from .pagination import EstimatedCountPaginator
+from .search import search_patients
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список без точного COUNT(*): ни для пагинации, ни для «всего N»."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Doctor)
@@ -9,13 +18,44 @@ class DoctorAdmin(admin.ModelAdmin):
     search_fields = ("full_name",)
 
 
+@admin.register(Owner)
+class OwnerAdmin(LargeTableAdmin):
+    list_display = ("name", "phone")
+    ordering = ("name", "pk")
+    # icontains по ФИО и номеру попадает в триграммные индексы Owner.
+    search_fields = ("name", "phone_digits")
+
+
 @admin.register(Patient)
-class PatientAdmin(admin.ModelAdmin):
-    list_display = ("name", "species", "owner_name")
+class PatientAdmin(LargeTableAdmin):
+    list_display = ("name", "species", "owner")
     list_filter = ("species",)
+    list_select_related = ("owner",)
+    ordering = ("name", "pk")
+    autocomplete_fields = ("owner",)
+    search_fields = ("name", "owner__name", "owner__phone_digits")
+
+    def get_search_results(self, request, queryset, search_term):
+        # Тот же поиск по триграммным индексам, что и на странице пациентов;
+        # через него работает и автодополнение в форме записи.
+        if not search_term.strip():
+            return queryset, False
+        found = search_patients(search_term, queryset).values("pk")
+        return queryset.filter(pk__in=found), False
 
 
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
+class AppointmentAdmin(LargeTableAdmin):
     list_display = ("date_time", "patient", "doctor", "status")
     list_filter = ("status", "date_time")
+    list_select_related = ("patient__owner", "doctor")
+    autocomplete_fields = ("doctor", "patient")
+    # icontains по кличке и владельцу попадает в триграммные индексы
+    # Patient и Owner.
+    search_fields = ("patient__name", "patient__owner__name")
+
+
+@admin.register(Notification)
+class NotificationAdmin(LargeTableAdmin):
+    list_display = ("created_at", "chat_id", "status", "attempts", "next_attempt_at")
+    list_filter = ("status",)
@@ -0,0 +1,172 @@
+import datetime
+import statistics
+import time
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import pdf
+from .models import Appointment, Patient
+
+SEARCH_QUERIES = ["Барсик", "Петров", "Мар", "999 12", "Несуществующий"]
+
+# Сколько пациентов с самой длинной историей открывать по очереди.
+DETAIL_PATIENTS = 20
+
+# Записи бенчмарка ставятся так далеко в будущее, чтобы не задеть данные.
+BOOKING_OFFSET_DAYS = 3 * 365
+
+# Успешная запись отвечает редиректом, остальные сценарии — 200.
+EXPECTED_STATUS = {"booking": 302}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(timings, queries, errors):
+    return {
+        "requests": len(timings),
+        "errors": errors,
+        "p50_ms": round(percentile(timings, 0.5), 2),
+        "p90_ms": round(percentile(timings, 0.9), 2),
+        "p99_ms": round(percentile(timings, 0.99), 2),
+        "mean_ms": round(statistics.fmean(timings), 2),
+        "max_ms": round(max(timings), 2),
+        "queries_p50": statistics.median(queries),
+        "queries_max": max(queries),
+    }
+
+
+class Benchmark:
+    """Сценарии на текущих данных, запросы идут через тестовый клиент Django.
+
+    Каждый сценарий — функция, которая по номеру итерации отдаёт
+    (метод, путь, данные). Первый запрос прогревочный и не считается.
+    """
+
+    def __init__(self, repeat=30):
+        self.repeat = repeat
+        self.client = Client()
+        self.patient_ids = list(
+            Appointment.objects.values("patient")
+            .annotate(visits=Count("pk"))
+            .order_by("-visits", "patient")
+            .values_list("patient", flat=True)[:DETAIL_PATIENTS]
+        )
+        busiest = (
+            Appointment.objects.values("doctor")
+            .annotate(visits=Count("pk"))
+            .order_by("-visits", "doctor")
+            .first()
+        )
+        if not self.patient_ids or busiest is None:
+            raise ValueError("В базе нет записей, сначала generate_clinic_data")
+        self.doctor_id = busiest["doctor"]
+
+    def scenarios(self):
+        return {
+            "doctor_dashboard": self.doctor_dashboard,
+            "free_slots": self.free_slots,
+            "patient_search": self.patient_search,
+            "patient_detail": self.patient_detail,
+            "booking": self.booking,
+            "patient_pdf": self.patient_pdf,
+        }
+
+    def run(self, names=None):
+        results = {}
+        for name, scenario in self.scenarios().items():
+            if names and name not in names:
+                continue
+            requests = scenario()
+            self.request(*requests(0))
+            timings, queries, errors = [], [], 0
+            for i in range(1, self.repeat + 1):
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    status = self.request(*requests(i))
+                    timings.append((time.perf_counter() - start) * 1000)
+                queries.append(len(captured))
+                errors += status != EXPECTED_STATUS.get(name, 200)
+            results[name] = summarize(timings, queries, errors)
+        return results
+
+    def request(self, method, path, data=None):
+        return getattr(self.client, method)(path, data).status_code
+
+    def doctor_dashboard(self):
+        self.client.get(reverse("set_doctor", args=[self.doctor_id]))
+        return lambda i: ("get", reverse("doctor_dashboard"), None)
+
+    def free_slots(self):
+        # Каждый раз другая неделя, чтобы не попадать в кэш занятых слотов.
+        today = timezone.localdate()
+
+        def request(i):
+            start = today - datetime.timedelta(weeks=i)
+            return (
+                "get",
+                reverse("free_slots"),
+                {
+                    "doctor": self.doctor_id,
+                    "start": start.isoformat(),
+                    "end": (start + datetime.timedelta(days=6)).isoformat(),
+                },
+            )
+
+        return request
+
+    def patient_search(self):
+        return lambda i: (
+            "get",
+            reverse("patient_list"),
+            {"q": SEARCH_QUERIES[i % len(SEARCH_QUERIES)]},
+        )
+
+    def patient_detail(self):
+        return lambda i: (
+            "get",
+            reverse(
+                "patient_detail", args=[self.patient_ids[i % len(self.patient_ids)]]
+            ),
+            None,
+        )
+
+    def booking(self):
+        first_day = timezone.localdate() + datetime.timedelta(days=BOOKING_OFFSET_DAYS)
+
+        def request(i):
+            day = first_day + datetime.timedelta(days=i)
+            return (
+                "post",
+                reverse("home"),
+                {
+                    "owner_name": "Бенчмарк Тестович",
+                    "owner_phone": "+7 (999) 000-00-00",
+                    "pet_species": "Кошка",
+                    "pet_name": f"Бенч {i}",
+                    "doctor": self.doctor_id,
+                    "date": day.isoformat(),
+                    "time_slot": "08:30",
+                    "complaint": "Осмотр",
+                },
+            )
+
+        return request
+
+    def patient_pdf(self):
+        # Замеряется отдача готовой карты, поэтому она рисуется заранее.
+        patient = Patient.objects.select_related("owner").get(pk=self.patient_ids[0])
+        path = pdf.card_path(pdf.card_version(patient))
+        if not default_storage.exists(path):
+            html = pdf.render_card_html(patient)
+            default_storage.save(path, ContentFile(pdf.write_pdf(html)))
+        return lambda i: ("get", reverse("patient_pdf", args=[patient.pk]), None)
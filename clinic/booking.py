@@ -0,0 +1,43 @@
+from django.db import transaction
+
+from .models import Owner, Patient
+from .notifications import enqueue_telegram_message
+
+
+def book_appointment(form):
+    """Создаёт запись и уведомление врачу в одной транзакции.
+
+    Если слот уже занят, уникальный индекс appointment_unique_doctor_slot
+    выбрасывает IntegrityError.
+    """
+    owner_name = form.cleaned_data["owner_name"]
+    owner_phone = form.cleaned_data["owner_phone"]
+    pet_species = form.cleaned_data["pet_species"]
+    pet_name = form.cleaned_data["pet_name"]
+
+    with transaction.atomic():
+        # Владелец находится по номеру, как бы тот ни был записан, а питомец
+        # — по кличке среди его питомцев.
+        owner = Owner.objects.resolve(owner_name, owner_phone)
+        patient = (
+            owner.pets.filter(name__iexact=pet_name.strip()).order_by("pk").first()
+        )
+        if patient is None:
+            patient = Patient.objects.create(
+                name=pet_name, species=pet_species, owner=owner
+            )
+
+        appointment = form.save(commit=False)
+        appointment.patient = patient
+        appointment.save()
+
+        tg_msg = (
+            f"⚡ Новая запись к Вам!\n"
+            f"📅 {appointment.date_time.strftime('%d.%m %H:%M')}\n"
+            f"👤 {owner_name} ({owner_phone})\n"
+            f"🐾 {pet_name} ({pet_species})"
+        )
+
+        enqueue_telegram_message(appointment.doctor.telegram_id, tg_msg)
+
+    return appointment
@@ -0,0 +1,67 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+REPLICA_ALIAS = "replica"
+
+# Сколько секунд после записи читать из основной базы, чтобы пользователь
+# сразу видел свои изменения, даже если реплика отстаёт.
+PRIMARY_PIN_SECONDS = 5
+
+PRIMARY_PIN_KEY = "db_primary_until"
+
+_use_replica = contextvars.ContextVar("clinic_use_replica", default=False)
+
+
+@contextmanager
+def use_replica():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def pin_primary(request):
+    request.session[PRIMARY_PIN_KEY] = time.time() + PRIMARY_PIN_SECONDS
+
+
+class ReadReplicaRouter:
+    """Чтения внутри use_replica() идут на реплику, всё остальное — в default.
+
+    Без настроенной реплики (DB_REPLICA_HOST) роутер ничего не меняет.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and REPLICA_ALIAS in settings.DATABASES:
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+class ReplicaMixin:
+    """Отдаёт страницу только на чтение с реплики.
+
+    Ответ рендерится внутри, чтобы ленивые запросы из шаблона тоже ушли
+    на реплику.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.session.get(PRIMARY_PIN_KEY, 0) > time.time():
+            return super().dispatch(request, *args, **kwargs)
+
+        with use_replica():
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, "render"):
+                response.render()
+        return response
@@ -0,0 +1,54 @@
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import Upper
+
+from .history import bump_patient_versions
+from .models import Appointment, Patient
+from .stats import appointment_days, schedule_refresh
+
+# Поля, которые старший пациент берёт у дублей, если у него они пустые.
+FILLABLE_FIELDS = ["breed", "birth_date"]
+
+
+def duplicate_groups():
+    """Списки pk пациентов с одним ключом (владелец, кличка), старший первым.
+
+    Ключ тот же, что у Patient.objects.matching, группировка идёт по индексу
+    patient_owner_name_idx.
+    """
+    return (
+        Patient.objects.values("owner_id", upper_name=Upper("name"))
+        .annotate(ids=ArrayAgg("pk", ordering="pk"), total=Count("pk"))
+        .filter(total__gt=1)
+        .order_by()
+        .values_list("ids", flat=True)
+    )
+
+
+def merge_patients(ids):
+    """Переносит историю дублей на старшего пациента ids[0] и удаляет дубли.
+
+    Возвращает число перенесённых записей.
+    """
+    duplicate_ids = ids[1:]
+    with transaction.atomic():
+        patients = list(
+            Patient.objects.select_for_update().filter(pk__in=ids).order_by("pk")
+        )
+        keeper, duplicates = patients[0], patients[1:]
+        for field in FILLABLE_FIELDS:
+            if not getattr(keeper, field):
+                values = [getattr(p, field) for p in duplicates if getattr(p, field)]
+                if values:
+                    setattr(keeper, field, values[0])
+
+        moved = Appointment.objects.filter(patient__in=duplicate_ids)
+        # У дублей мог быть записан другой вид: статистика этих дней меняется.
+        schedule_refresh(appointment_days(moved))
+        count = moved.update(patient=keeper)
+        keeper.save()
+        Patient.objects.filter(pk__in=duplicate_ids).delete()
+        # update() не шлёт сигналов, историю старшего сбрасываем сами.
+        transaction.on_commit(lambda: bump_patient_versions(ids))
+    return count
@@ -0,0 +1,114 @@
+import datetime
+import random
+
+from django.utils import timezone
+
+from .constants import SPECIES_CHOICES, TIME_CHOICES
+from .models import Appointment, Doctor, Owner, Patient
+from .phones import phone_digits
+
+PET_NAMES = ["Барсик", "Шарик", "Мурка", "Рекс", "Кеша", "Пушок", "Лорд", "Жужа"]
+FIRST_NAMES = ["Иван", "Мария", "Пётр", "Анна", "Олег", "Ольга", "Сергей", "Елена"]
+LAST_NAMES = ["Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Соколов"]
+SPECIALIZATIONS = ["Терапевт", "Хирург", "Дерматолог", "Кардиолог", "Офтальмолог"]
+COMPLAINTS = ["Не ест", "Хромает", "Чешется", "Вялость", "Рвота", "Плановый осмотр"]
+DIAGNOSES = ["Гастрит", "Ушиб лапы", "Дерматит", "Отит", "Здоров"]
+PRESCRIPTIONS = ["Диета 7 дней", "Покой, мазь 2 раза в день", "Капли в уши", ""]
+
+SLOT_TIMES = [datetime.time.fromisoformat(value) for value, _ in TIME_CHOICES]
+
+# Насколько вперёд от сегодня уходят запланированные визиты.
+FUTURE_DAYS = 30
+
+# В среднем питомцев на владельца.
+PETS_PER_OWNER = 1.5
+
+# Номер владельца n — 79 и n * PHONE_STEP (mod 10⁹) с фиксированным сдвигом:
+# шаг взаимно прост с 10⁹, поэтому номера не повторяются.
+PHONE_STEP = 7919
+
+
+class FakeClinic:
+    """Синтетические врачи, пациенты и записи для замеров.
+
+    С одним и тем же seed получаются одни и те же данные, поэтому замеры
+    на разных коммитах можно сравнивать.
+    """
+
+    def __init__(self, seed=42):
+        self.rng = random.Random(seed)
+        self.phone_offset = self.rng.randrange(10**9)
+
+    def doctor(self, n):
+        return Doctor(
+            full_name=f"{self.rng.choice(LAST_NAMES)} {self.rng.choice(FIRST_NAMES)} {n}",
+            specialization=self.rng.choice(SPECIALIZATIONS),
+        )
+
+    @staticmethod
+    def owner_count(patients):
+        return max(1, round(patients / PETS_PER_OWNER))
+
+    def owner(self, n):
+        digits = f"{(n * PHONE_STEP + self.phone_offset) % 10**9:09d}"
+        phone = f"+7 (9{digits[:2]}) {digits[2:5]}-{digits[5:7]}-{digits[7:]}"
+        return Owner(
+            name=f"{self.rng.choice(LAST_NAMES)} {self.rng.choice(FIRST_NAMES)} {n}",
+            phone=phone,
+            phone_digits=phone_digits(phone),
+        )
+
+    def patient(self, n, owner_id):
+        return Patient(
+            name=f"{self.rng.choice(PET_NAMES)} {n}",
+            species=self.rng.choice(SPECIES_CHOICES)[0],
+            owner_id=owner_id,
+        )
+
+    @staticmethod
+    def date_range(years):
+        """Дни записей: [years лет назад, сегодня + FUTURE_DAYS)."""
+        today = timezone.localdate()
+        first_day = today - datetime.timedelta(days=round(365 * years))
+        return first_day, today + datetime.timedelta(days=FUTURE_DAYS)
+
+    def appointments(self, doctor_ids, patient_ids, count, years):
+        """count записей по свободным слотам врачей за years лет до сегодня.
+
+        Слоты выбираются без повторов, поэтому уникальный индекс по
+        (врач, время) не нарушается. Последние FUTURE_DAYS дней — будущее.
+        Нехватку слотов проверяет сразу, а не на первой записи генератора.
+        """
+        first_day, last_day = self.date_range(years)
+        days = (last_day - first_day).days
+        capacity = len(doctor_ids) * days * len(SLOT_TIMES)
+        if count > capacity:
+            raise ValueError(
+                f"В {days} днях у {len(doctor_ids)} врачей только {capacity} слотов"
+            )
+        return self._appointments(doctor_ids, patient_ids, count, first_day, capacity)
+
+    def _appointments(self, doctor_ids, patient_ids, count, first_day, capacity):
+        rng = self.rng
+        now = timezone.now()
+        for index in rng.sample(range(capacity), count):
+            index, doctor = divmod(index, len(doctor_ids))
+            day, slot = divmod(index, len(SLOT_TIMES))
+            date_time = timezone.make_aware(
+                datetime.datetime.combine(
+                    first_day + datetime.timedelta(days=day), SLOT_TIMES[slot]
+                )
+            )
+            past = date_time < now
+            status = "planned"
+            if past:
+                status = "canceled" if rng.random() < 0.05 else "completed"
+            yield Appointment(
+                doctor_id=doctor_ids[doctor],
+                patient_id=rng.choice(patient_ids),
+                date_time=date_time,
+                complaint=rng.choice(COMPLAINTS),
+                diagnosis=rng.choice(DIAGNOSES) if status == "completed" else "",
+                prescription=rng.choice(PRESCRIPTIONS) if status == "completed" else "",
+                status=status,
+            )
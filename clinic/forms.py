@@ -1,13 +1,17 @@
-import re
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from django import forms
+from django.utils import timezone
 
 from .constants import SPECIES_CHOICES, TIME_CHOICES
-from .models import Appointment, Doctor, Patient
+from .models import Appointment, Doctor, Owner, Patient
+from .phones import clean_phone
+from .widgets import SearchSelect
 
 
 class AppointmentForm(forms.ModelForm):
+    SLOT_TAKEN_ERROR = "На это время врач уже занят! Пожалуйста, выберите другой час."
+
     owner_name = forms.CharField(
         max_length=50,
         help_text="Введите своё ФИО",
@@ -61,7 +65,11 @@ class AppointmentForm(forms.ModelForm):
         fields = ["doctor", "complaint"]
 
         widgets = {
-            "doctor": forms.Select(attrs={"class": "form-select"}),
+            "doctor": SearchSelect(
+                "doctor_choices",
+                placeholder="Выберите врача",
+                attrs={"class": "form-select"},
+            ),
             "complaint": forms.Textarea(
                 attrs={
                     "class": "form-control",
@@ -73,12 +81,7 @@ class AppointmentForm(forms.ModelForm):
 
     def save(self, commit=True):
         appointment = super().save(commit=False)
-
-        chosen_date = self.cleaned_data["date"]
-        chosen_time_str = self.cleaned_data["time_slot"]
-
-        chosen_time = datetime.strptime(chosen_time_str, "%H:%M").time()
-        appointment.date_time = datetime.combine(chosen_date, chosen_time)
+        appointment.date_time = self.cleaned_data["date_time"]
 
         if commit:
             appointment.save()
@@ -86,27 +89,7 @@ class AppointmentForm(forms.ModelForm):
         return appointment
 
     def clean_owner_phone(self):
-        phone = self.cleaned_data["owner_phone"]
-
-        digits = re.sub(r"\D", "", phone)
-
-        if len(digits) == 11:
-            if digits.startswith("8"):
-                digits = "7" + digits[1:]
-            elif digits.startswith("7"):
-                pass
-            else:
-                self.add_error(
-                    "owner_phone",
-                    "Номер должен начинаться с +7 или 8",
-                )
-        else:
-            self.add_error(
-                "owner_phone",
-                "Номер телефона должен содержать 11 цифр",
-            )
-
-        return f"+{digits}"
+        return clean_phone(self.cleaned_data["owner_phone"])
 
     def clean(self):
         cleaned_data = super().clean()
@@ -117,41 +100,145 @@ class AppointmentForm(forms.ModelForm):
 
         if date and time_str:
             t_obj = datetime.strptime(time_str, "%H:%M").time()
-            date_time = datetime.combine(date, t_obj)
+            date_time = timezone.make_aware(datetime.combine(date, t_obj))
 
         if not doctor or not date_time:
             return
 
-        if date_time < datetime.now():
+        if date_time < timezone.now():
             self.add_error(
                 "date",
                 "Невозможно записаться на прошлую дату!",
             )
 
-        collision = Appointment.objects.filter(
-            doctor=doctor, date_time=date_time
-        ).exists()
+        # Занятость слота проверяет уникальный индекс при вставке, см. HomeView.
+        cleaned_data["date_time"] = date_time
+        return cleaned_data
 
-        if collision:
-            self.add_error(
-                "time_slot",
-                "На это время врач уже занят! Пожалуйста, выберите другой час.",
-            )
 
+class FreeSlotsForm(forms.Form):
+    MAX_DAYS = 31
+
+    doctor = forms.IntegerField(min_value=1)
+    start = forms.DateField()
+    end = forms.DateField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get("start")
+        if not start:
+            return cleaned_data
+
+        end = cleaned_data.get("end") or start
+        if end < start:
+            raise forms.ValidationError("Конец периода раньше начала")
+        if (end - start).days >= self.MAX_DAYS:
+            raise forms.ValidationError(f"Период не длиннее {self.MAX_DAYS} дней")
+        cleaned_data["end"] = end
+        return cleaned_data
+
+
+class CardExportForm(forms.Form):
+    doctor = forms.ModelChoiceField(Doctor.objects.all(), required=False)
+    species = forms.ChoiceField(
+        choices=[("", "Все виды")] + SPECIES_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    start = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={"class": "form-control", "type": "date"}),
+    )
+    end = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={"class": "form-control", "type": "date"}),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get("start")
+        end = cleaned_data.get("end")
+        if bool(start) != bool(end):
+            raise forms.ValidationError("Укажите и начало, и конец периода")
+        if start and end < start:
+            raise forms.ValidationError("Конец периода раньше начала")
+        return cleaned_data
+
+
+class AppointmentReportForm(forms.Form):
+    format = forms.ChoiceField(
+        choices=[("csv", "CSV"), ("xlsx", "Excel (XLSX)")], required=False
+    )
+    doctor = forms.ModelChoiceField(Doctor.objects.all(), required=False)
+    status = forms.ChoiceField(
+        choices=[("", "Все статусы")] + Appointment.STATUS_CHOICES, required=False
+    )
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        cleaned_data["format"] = cleaned_data.get("format") or "csv"
+        start = cleaned_data.get("start")
+        end = cleaned_data.get("end")
+        if start and end and end < start:
+            raise forms.ValidationError("Конец периода раньше начала")
+        return cleaned_data
+
+
+class StatsPeriodForm(forms.Form):
+    start = forms.DateField(
+        label="С", required=False, widget=forms.DateInput(attrs={"type": "date"})
+    )
+    end = forms.DateField(
+        label="По", required=False, widget=forms.DateInput(attrs={"type": "date"})
+    )
+
+    # Период по умолчанию: последние 30 дней.
+    DEFAULT_DAYS = 30
+
+    def clean(self):
+        cleaned_data = super().clean()
+        end = cleaned_data.get("end") or timezone.localdate()
+        start = cleaned_data.get("start") or end - timedelta(days=self.DEFAULT_DAYS - 1)
+        if end < start:
+            raise forms.ValidationError("Конец периода раньше начала")
+        cleaned_data.update(start=start, end=end)
         return cleaned_data
 
 
 class PatientForm(forms.ModelForm):
+    """Питомец и его владелец.
+
+    Владелец хранится отдельно (Owner): ФИО меняется у всех его питомцев,
+    а другой номер переводит питомца к владельцу с этим номером.
+    """
+
+    owner_name = forms.CharField(
+        label="Владелец",
+        max_length=150,
+        widget=forms.TextInput(attrs={"class": "form-control"}),
+    )
+    owner_phone = forms.CharField(
+        label="Телефон",
+        widget=forms.TextInput(
+            attrs={
+                "class": "form-control",
+                "placeholder": "+7 (999) 000-00-00",
+                "type": "tel",
+                "id": "phone-mask",
+            }
+        ),
+    )
+
     class Meta:
         model = Patient
-        fields = ["name", "species", "breed", "birth_date", "owner_name", "owner_phone"]
+        fields = ["name", "species", "breed", "birth_date"]
         labels = {
             "name": "Кличка",
             "species": "Вид",
             "breed": "Порода",
             "birth_date": "Дата рождения",
-            "owner_name": "Владелец",
-            "owner_phone": "Телефон",
         }
         widgets = {
             "name": forms.TextInput(attrs={"class": "form-control"}),
@@ -162,39 +249,25 @@ class PatientForm(forms.ModelForm):
             "birth_date": forms.DateInput(
                 attrs={"class": "form-control", "type": "date"}
             ),
-            "owner_name": forms.TextInput(attrs={"class": "form-control"}),
-            "owner_phone": forms.TextInput(
-                attrs={
-                    "class": "form-control",
-                    "placeholder": "+7 (999) 000-00-00",
-                    "type": "tel",
-                    "id": "phone-mask",
-                }
-            ),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.owner_id:
+            self.initial.setdefault("owner_name", self.instance.owner.name)
+            self.initial.setdefault("owner_phone", self.instance.owner.phone)
+
     def clean_owner_phone(self):
-        phone = self.cleaned_data["owner_phone"]
-
-        digits = re.sub(r"\D", "", phone)
-
-        if len(digits) == 11:
-            if digits.startswith("8"):
-                digits = "7" + digits[1:]
-            elif digits.startswith("7"):
-                pass
-            else:
-                self.add_error(
-                    "owner_phone",
-                    "Номер должен начинаться с +7 или 8",
-                )
-        else:
-            self.add_error(
-                "owner_phone",
-                "Номер телефона должен содержать 11 цифр",
-            )
+        return clean_phone(self.cleaned_data["owner_phone"])
 
-        return f"+{digits}"
+    def save(self, commit=True):
+        name = self.cleaned_data["owner_name"]
+        owner = Owner.objects.resolve(name, self.cleaned_data["owner_phone"])
+        if owner.name != name:
+            owner.name = name
+            owner.save(update_fields=["name", "updated_at"])
+        self.instance.owner = owner
+        return super().save(commit)
 
 
 class DoctorAppointmentForm(forms.ModelForm):
@@ -0,0 +1,78 @@
+from django.core.cache import cache
+from django.db.models import Q
+from django.template.loader import render_to_string
+
+from .models import Appointment
+from .pagination import decode_cursor, encode_cursor
+from .roster import roster_version
+from .versions import bump_version, bump_versions, get_version
+
+HISTORY_PAGE_SIZE = 20
+
+HISTORY_TIMEOUT = 60 * 60 * 24
+
+HISTORY_TEMPLATE = "clinic/includes/patient_history.html"
+
+
+def patient_version_key(patient_id):
+    return f"clinic:patient:{patient_id}:version"
+
+
+def bump_patient_version(patient_id):
+    bump_version(patient_version_key(patient_id))
+
+
+def bump_patient_versions(patient_ids):
+    bump_versions([patient_version_key(patient_id) for patient_id in patient_ids])
+
+
+def history_page(patient_id, before=None):
+    """Страница истории от новых к старым и курсор следующей (или None)."""
+    records = (
+        Appointment.objects.filter(patient_id=patient_id)
+        .select_related("doctor")
+        .order_by("-date_time", "-pk")
+    )
+    cursor = decode_cursor(before)
+    if cursor:
+        date_time, pk = cursor
+        records = records.filter(
+            Q(date_time__lt=date_time) | Q(date_time=date_time, pk__lt=pk)
+        )
+
+    records = list(records[: HISTORY_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(records) > HISTORY_PAGE_SIZE:
+        records = records[:HISTORY_PAGE_SIZE]
+        next_cursor = encode_cursor(records[-1].date_time, records[-1].pk)
+    return records, next_cursor
+
+
+def render_history(patient_id, before=None):
+    """HTML страницы истории, закэшированный до изменения пациента или врачей.
+
+    В ключ входят версия пациента (её поднимают сигналы Patient и
+    Appointment) и версия списка врачей, потому что в карточках видны ФИО.
+    """
+    cursor = decode_cursor(before)
+    before = encode_cursor(*cursor) if cursor else None
+    key = "clinic:patient-history:{}:{}:{}:{}".format(
+        patient_id,
+        get_version(patient_version_key(patient_id)),
+        roster_version(),
+        before or "",
+    )
+    html = cache.get(key)
+    if html is None:
+        records, next_cursor = history_page(patient_id, before)
+        html = render_to_string(
+            HISTORY_TEMPLATE,
+            {
+                "patient_id": patient_id,
+                "records": records,
+                "next_cursor": next_cursor,
+                "is_first_page": not before,
+            },
+        )
+        cache.set(key, html, HISTORY_TIMEOUT)
+    return html
@@ -0,0 +1,232 @@
+import csv
+import json
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .history import bump_patient_versions
+from .models import Appointment, Doctor, Owner, Patient
+from .phones import phone_digits
+from .roster import invalidate_roster
+from .slots import invalidate_busy_days
+from .stats import appointment_days, schedule_refresh
+
+IMPORT_BATCH_SIZE = 1000
+
+# Первый ключ pg_advisory_xact_lock: external_id импортируемых записей.
+IMPORT_LOCK_NAMESPACE = 23
+
+REQUIRED_FIELDS = [
+    "external_id",
+    "date_time",
+    "doctor",
+    "pet_name",
+    "species",
+    "owner_name",
+    "owner_phone",
+]
+
+# Поля, которые повторный импорт той же записи перезаписывает.
+UPDATE_FIELDS = [
+    "doctor",
+    "patient",
+    "date_time",
+    "complaint",
+    "diagnosis",
+    "prescription",
+    "status",
+    "updated_at",
+]
+
+STATUSES = {value for value, _ in Appointment.STATUS_CHOICES}
+
+
+class ImportRowError(ValueError):
+    def __init__(self, number, message):
+        super().__init__(f"Строка {number}: {message}")
+
+
+def read_rows(file, fmt):
+    """Строки файла по одной, в виде словарей."""
+    if fmt == "csv":
+        yield from csv.DictReader(file)
+    elif fmt == "jsonl":
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+
+
+def patient_key(name, owner_phone):
+    """Тот же ключ, что у Patient.objects.matching: номер и кличка."""
+    return (phone_digits(owner_phone), name.strip().upper())
+
+
+class AppointmentImporter:
+    """Загружает записи пачками: владельцы, пациенты и врачи ищутся в памяти.
+
+    Записи сопоставляются по external_id, поэтому повторный импорт того же
+    файла обновляет их, а не дублирует. Уникального индекса по external_id
+    у секционированной таблицы нет: одинаковые номера из параллельных
+    импортов разводит advisory-блокировка.
+    """
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.owners = dict(
+            Owner.objects.exclude(phone_digits="")
+            .values_list("phone_digits", "pk")
+            .iterator(chunk_size=5000)
+        )
+        self.patients = {}
+        # При дублях побеждает старший пациент, как в merge_duplicate_patients.
+        for pk, name, digits in (
+            Patient.objects.order_by("pk")
+            .values_list("pk", "name", "owner__phone_digits")
+            .iterator(chunk_size=5000)
+        ):
+            self.patients.setdefault(patient_key(name, digits), pk)
+        self.doctors = dict(Doctor.objects.values_list("full_name", "pk"))
+
+    def run(self, rows, skip=0, on_batch=None):
+        """Импортирует rows, пропустив первые skip уже загруженных.
+
+        После каждой зафиксированной пачки вызывает on_batch(номер строки).
+        """
+        batch = []
+        number = 0
+        for number, row in enumerate(rows, 1):
+            if number <= skip:
+                continue
+            batch.append(self.clean(number, row))
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+                if on_batch:
+                    on_batch(number)
+        if batch:
+            self.write(batch)
+            if on_batch:
+                on_batch(number)
+        return number
+
+    def clean(self, number, row):
+        row = {name: str(value).strip() for name, value in row.items() if value}
+        missing = [name for name in REQUIRED_FIELDS if not row.get(name)]
+        if missing:
+            raise ImportRowError(number, f"не заполнены {', '.join(missing)}")
+
+        date_time = parse_datetime(row["date_time"])
+        if date_time is None:
+            raise ImportRowError(number, f"неверная дата {row['date_time']!r}")
+        if timezone.is_naive(date_time):
+            date_time = timezone.make_aware(date_time)
+
+        if not phone_digits(row["owner_phone"]):
+            raise ImportRowError(number, f"в телефоне нет цифр {row['owner_phone']!r}")
+
+        status = row.get("status", "completed")
+        if status not in STATUSES:
+            raise ImportRowError(number, f"неизвестный статус {status!r}")
+
+        return {**row, "date_time": date_time, "status": status}
+
+    def write(self, batch):
+        # Повтор external_id внутри пачки: побеждает последняя строка.
+        batch = list({row["external_id"]: row for row in batch}.values())
+        external_ids = [row["external_id"] for row in batch]
+        now = timezone.now()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_advisory_xact_lock(%s, h) FROM "
+                    "(SELECT DISTINCT hashtext(e) AS h FROM unnest(%s::text[]) AS e "
+                    "ORDER BY h) AS keys",
+                    [IMPORT_LOCK_NAMESPACE, external_ids],
+                )
+            self.create_doctors(batch)
+            self.create_owners(batch)
+            self.create_patients(batch)
+            appointments = [
+                Appointment(
+                    external_id=row["external_id"],
+                    doctor_id=self.doctors[row["doctor"]],
+                    patient_id=self.patients[self.row_patient_key(row)],
+                    date_time=row["date_time"],
+                    complaint=row.get("complaint", ""),
+                    diagnosis=row.get("diagnosis", ""),
+                    prescription=row.get("prescription", ""),
+                    status=row["status"],
+                    updated_at=now,
+                )
+                for row in batch
+            ]
+            existing = Appointment.objects.filter(external_id__in=external_ids)
+            # Перезаписанные записи могли стоять в другие дни.
+            days = appointment_days(existing)
+            days.update(timezone.localdate(a.date_time) for a in appointments)
+            known = dict(existing.values_list("external_id", "pk"))
+            for appointment in appointments:
+                appointment.pk = known.get(appointment.external_id)
+            # Смена даты переносит строку в секцию другого месяца сама.
+            Appointment.objects.bulk_update(
+                [a for a in appointments if a.pk], UPDATE_FIELDS
+            )
+            Appointment.objects.bulk_create([a for a in appointments if not a.pk])
+            # bulk_create не шлёт сигналов, кэши и статистику обновляем сами.
+            transaction.on_commit(lambda: self.invalidate(appointments))
+            schedule_refresh(days)
+
+    def create_doctors(self, batch):
+        new = {}
+        for row in batch:
+            if row["doctor"] not in self.doctors:
+                new.setdefault(row["doctor"], row.get("specialization", ""))
+        if not new:
+            return
+        doctors = Doctor.objects.bulk_create(
+            Doctor(full_name=name, specialization=specialization)
+            for name, specialization in new.items()
+        )
+        self.doctors.update((doctor.full_name, doctor.pk) for doctor in doctors)
+        transaction.on_commit(invalidate_roster)
+
+    def create_owners(self, batch):
+        new = {}
+        for row in batch:
+            digits = phone_digits(row["owner_phone"])
+            if digits not in self.owners and digits not in new:
+                new[digits] = Owner(
+                    name=row["owner_name"],
+                    phone=row["owner_phone"],
+                    phone_digits=digits,
+                )
+        if new:
+            Owner.objects.bulk_create(new.values())
+            self.owners.update((digits, owner.pk) for digits, owner in new.items())
+
+    def create_patients(self, batch):
+        new = {}
+        for row in batch:
+            key = self.row_patient_key(row)
+            if key not in self.patients and key not in new:
+                new[key] = Patient(
+                    name=row["pet_name"],
+                    species=row["species"],
+                    breed=row.get("breed", ""),
+                    owner_id=self.owners[key[0]],
+                )
+        if new:
+            Patient.objects.bulk_create(new.values())
+            self.patients.update((key, patient.pk) for key, patient in new.items())
+
+    def row_patient_key(self, row):
+        return patient_key(row["pet_name"], row["owner_phone"])
+
+    def invalidate(self, appointments):
+        bump_patient_versions({a.patient_id for a in appointments})
+        invalidate_busy_days(
+            {(a.doctor_id, timezone.localdate(a.date_time)) for a in appointments}
+        )
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+
+import psycopg
+from django.conf import settings
+from django.db import connection
+from django.template.loader import render_to_string
+from django.utils import timezone
+from psycopg.conninfo import make_conninfo
+
+from .models import Appointment
+
+logger = logging.getLogger(__name__)
+
+# Канал Postgres, через который изменения доходят до всех процессов.
+CHANNEL = "clinic_schedule"
+
+# Сколько событий ждёт медленный экран, прежде чем ему скажут перезагрузиться.
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Как часто поток LISTEN проверяет, остались ли подписчики.
+LISTEN_POLL_SECONDS = 5
+
+# Пауза перед повторным подключением после обрыва.
+RECONNECT_SECONDS = 2
+
+# Комментарий раз в столько секунд не даёт прокси закрыть соединение.
+KEEPALIVE_SECONDS = 15
+
+# Жалоба в событии обрезается: NOTIFY принимает до 8000 байт.
+COMPLAINT_LIMIT = 200
+
+# Событие «данные могли потеряться, перечитайте табло».
+RESYNC = {"type": "resync"}
+
+# Без ASGI потока нет: табло перечитывается раз в столько секунд.
+POLL_SECONDS = 30
+
+
+def appointment_event(pk):
+    """Событие об изменённой записи: строка табло уже отрисована."""
+    appointment = (
+        Appointment.objects.select_related("doctor", "patient__owner")
+        .filter(pk=pk)
+        .first()
+    )
+    if appointment is None:
+        return {"type": "appointment", "id": pk, "deleted": True}
+    appointment.complaint = appointment.complaint[:COMPLAINT_LIMIT]
+    return {
+        "type": "appointment",
+        "id": pk,
+        "day": timezone.localdate(appointment.date_time).isoformat(),
+        "html": render_to_string(
+            "clinic/includes/schedule_row.html", {"appointment": appointment}
+        ),
+    }
+
+
+def notify(event):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_notify(%s, %s)", [CHANNEL, json.dumps(event, ensure_ascii=False)]
+        )
+
+
+def publish_appointment(pk):
+    """Обработчик on_commit: одно событие на изменение, сколько бы ни было экранов.
+
+    Запись к этому моменту уже сохранена: сбой табло пишется в лог, а не
+    превращает успешное сохранение в ошибку 500.
+    """
+    try:
+        notify(appointment_event(pk))
+    except Exception:
+        logger.exception("Не удалось опубликовать запись %s на табло", pk)
+
+
+def listen_conninfo():
+    db = settings.DATABASES["default"]
+    return make_conninfo(
+        dbname=db["NAME"],
+        user=db["USER"] or None,
+        password=db["PASSWORD"] or None,
+        host=db["HOST"] or None,
+        port=db["PORT"] or None,
+    )
+
+
+class ScheduleBroker:
+    """Раздаёт события подписчикам внутри процесса.
+
+    Подписчик — asyncio.Queue в своём цикле событий, publish можно звать из
+    любого потока. Пока есть подписчики, один поток держит LISTEN на базе и
+    пересылает сюда всё, что пришло в CHANNEL.
+    """
+
+    def __init__(self, listen=True):
+        self.listen = listen
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._listener = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+            if self.listen and self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name="schedule-listener", daemon=True
+                )
+                self._listener.start()
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers = {s for s in self._subscribers if s[1] is not queue}
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, event)
+            except RuntimeError:
+                # Цикл событий уже закрыт, подписчик не отписался сам.
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _put(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Экран не успевает читать: выбрасываем очередь, пусть перечитает.
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+
+    def _listen(self):
+        reconnect = False
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    # Проверка под тем же замком, что и в subscribe: новый
+                    # подписчик либо застанет поток, либо запустит свой.
+                    self._listener = None
+                    return
+            try:
+                with psycopg.connect(listen_conninfo(), autocommit=True) as conn:
+                    conn.execute(f"LISTEN {CHANNEL}")
+                    if reconnect:
+                        self.publish(RESYNC)
+                    while self.subscriber_count():
+                        for notice in conn.notifies(timeout=LISTEN_POLL_SECONDS):
+                            self.publish(json.loads(notice.payload))
+            except psycopg.Error:
+                logger.exception("LISTEN %s оборвался, переподключаемся", CHANNEL)
+                time.sleep(RECONNECT_SECONDS)
+            reconnect = True
+
+
+broker = ScheduleBroker()
+
+
+def format_event(event):
+    name = event["type"]
+    return f"event: {name}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def poll_events(seconds=POLL_SECONDS):
+    """Короткий ответ вместо потока для WSGI.
+
+    Браузер переподключится через seconds секунд, и табло перечитается,
+    как после обрыва. Поток воркера при этом не занимается надолго.
+    """
+    return f"retry: {seconds * 1000}\n\n" + format_event(
+        {"type": "poll", "seconds": seconds}
+    )
+
+
+async def event_stream(broker=broker, keepalive=KEEPALIVE_SECONDS):
+    """Server-sent events для табло, пока клиент не отключится."""
+    queue = broker.subscribe()
+    try:
+        yield f"retry: {RECONNECT_SECONDS * 1000}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), keepalive)
+            except TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(queue)
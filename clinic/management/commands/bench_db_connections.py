@@ -0,0 +1,69 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from django.test import Client
+
+MODES = {
+    # Как было: новое соединение (и аутентификация) на каждый запрос.
+    "new": {"CONN_MAX_AGE": 0, "pool": None},
+    "persistent": {"CONN_MAX_AGE": 600, "pool": None},
+    "pool": {"CONN_MAX_AGE": 0, "pool": {"min_size": 1, "max_size": 4}},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает время запроса к странице с новым соединением на каждый "
+        "запрос, с постоянным соединением и с пулом psycopg."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="/patients/")
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+
+    def handle(self, *args, **options):
+        connection = connections["default"]
+        original = {
+            "CONN_MAX_AGE": connection.settings_dict["CONN_MAX_AGE"],
+            "OPTIONS": dict(connection.settings_dict["OPTIONS"]),
+        }
+        client = Client()
+
+        try:
+            for mode in options["modes"]:
+                self.configure(connection, **MODES[mode])
+                # Первый запрос прогревает шаблоны и кэш, его не считаем.
+                self.request(client, options["path"])
+                timings = [
+                    self.request(client, options["path"])
+                    for _ in range(options["requests"])
+                ]
+                timings.sort()
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                self.stdout.write(
+                    f"{mode:<11} p50 {statistics.median(timings):7.2f} мс  "
+                    f"p95 {p95:7.2f} мс"
+                )
+        finally:
+            connection.close()
+            connection.close_pool()
+            connection.settings_dict.update(original)
+
+    def configure(self, connection, CONN_MAX_AGE, pool):
+        connection.close()
+        connection.close_pool()
+        connection.settings_dict["CONN_MAX_AGE"] = CONN_MAX_AGE
+        connection.settings_dict["OPTIONS"].pop("pool", None)
+        if pool:
+            connection.settings_dict["OPTIONS"]["pool"] = pool
+
+    def request(self, client, path):
+        start = time.perf_counter()
+        client.get(path)
+        # Тестовый клиент не закрывает соединение сам, как это делает сервер
+        # по сигналу request_finished.
+        close_old_connections()
+        return (time.perf_counter() - start) * 1000
@@ -0,0 +1,76 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from clinic.fakedata import FakeClinic
+from clinic.models import Owner, Patient
+from clinic.search import search_patients
+
+DEFAULT_QUERIES = ["Барсик", "Петров", "Мар", "999 12", "Несуществующий"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет поиск пациентов на синтетической таблице растущего размера. "
+        "Все данные создаются в транзакции и откатываются в конце."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[10_000, 100_000, 1_000_000],
+            help="Размеры таблицы, на которых делать замеры",
+        )
+        parser.add_argument("--queries", nargs="+", default=DEFAULT_QUERIES)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        fake = FakeClinic(options["seed"])
+
+        with transaction.atomic():
+            total = Patient.objects.count()
+            # Номера продолжают уже созданных владельцев, чтобы телефоны
+            # не совпали с данными generate_clinic_data с тем же --seed.
+            owners_total = Owner.objects.count()
+            for size in sorted(options["sizes"]):
+                while total < size:
+                    count = min(options["batch_size"], size - total)
+                    owner_count = fake.owner_count(count)
+                    owners = Owner.objects.bulk_create(
+                        fake.owner(owners_total + i) for i in range(owner_count)
+                    )
+                    owners_total += owner_count
+                    Patient.objects.bulk_create(
+                        fake.patient(total + i, owners[i * owner_count // count].pk)
+                        for i in range(count)
+                    )
+                    total += count
+
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE clinic_patient")
+
+                self.stdout.write(f"\nПациентов: {total}")
+                for query in options["queries"]:
+                    self.measure(query, options["repeat"])
+
+            transaction.set_rollback(True)
+
+    def measure(self, query, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            found = len(search_patients(query)[:25])
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"  {query!r:<18} найдено {found:>3}  "
+            f"p50 {statistics.median(timings):7.2f} мс  p95 {p95:7.2f} мс"
+        )
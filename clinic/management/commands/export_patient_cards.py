@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic.forms import CardExportForm
+from clinic.pdf import export_cards, export_queryset, pages_per_second, stream_cards_zip
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает PDF-карты пациентов в один ZIP-архив. "
+        "Карты рисуются параллельно на всех ядрах."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Путь к создаваемому ZIP-архиву")
+        parser.add_argument("--doctor", type=int, help="ID врача")
+        parser.add_argument("--species", help="Вид животного")
+        parser.add_argument("--start", help="Начало периода приёмов, ГГГГ-ММ-ДД")
+        parser.add_argument("--end", help="Конец периода приёмов, ГГГГ-ММ-ДД")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Число процессов, по умолчанию PDF_EXPORT_WORKERS",
+        )
+        parser.add_argument("--chunk-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        form = CardExportForm(
+            {
+                name: options[name]
+                for name in ("doctor", "species", "start", "end")
+                if options[name] is not None
+            }
+        )
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+
+        patients = export_queryset(**form.cleaned_data)
+        cards = export_cards(
+            patients, workers=options["workers"], chunk_size=options["chunk_size"]
+        )
+        stats = {}
+        with open(options["output"], "wb") as output:
+            for chunk in stream_cards_zip(cards, stats):
+                output.write(chunk)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Карт: {stats['cards']}, страниц: {stats['pages']} "
+                f"за {stats['seconds']:.1f} с ({pages_per_second(stats):.1f} стр/с)"
+            )
+        )
@@ -0,0 +1,129 @@
+import itertools
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from clinic.fakedata import FakeClinic
+from clinic.models import Appointment, Doctor, Notification, Owner, Patient
+from clinic.partitions import AHEAD_MONTHS, add_months, ensure_partitions, month_start
+from clinic.roster import invalidate_roster
+from clinic.slots import invalidate_busy_days
+from clinic.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими врачами, владельцами, пациентами и "
+        "записями "
+        "за несколько лет. С одинаковым --seed данные одинаковые."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--doctors", type=int, default=20)
+        parser.add_argument("--patients", type=int, default=10_000)
+        parser.add_argument("--appointments", type=int, default=100_000)
+        parser.add_argument("--years", type=float, default=3)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--replace",
+            action="store_true",
+            help=(
+                "Сначала удалить всех врачей, владельцев, пациентов, записи "
+                "и уведомления"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["doctors"] < 1 or options["patients"] < 1:
+            raise CommandError("Нужен хотя бы один врач и один пациент")
+        fake = FakeClinic(options["seed"])
+        batch_size = options["batch_size"]
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            if options["replace"]:
+                for model in (Notification, Appointment, Patient, Owner, Doctor):
+                    model.objects.all().delete()
+
+            doctors = Doctor.objects.bulk_create(
+                fake.doctor(n) for n in range(options["doctors"])
+            )
+            owner_ids = []
+            owner_count = fake.owner_count(options["patients"])
+            try:
+                for start in range(0, owner_count, batch_size):
+                    count = min(batch_size, owner_count - start)
+                    owners = Owner.objects.bulk_create(
+                        fake.owner(start + n) for n in range(count)
+                    )
+                    owner_ids += [owner.pk for owner in owners]
+            except IntegrityError:
+                raise CommandError(
+                    "Владельцы с такими номерами уже есть: "
+                    "нужен --replace или другой --seed"
+                )
+            patient_ids = []
+            for start in range(0, options["patients"], batch_size):
+                count = min(batch_size, options["patients"] - start)
+                # Питомцы раздаются владельцам по порядку, по 1–2 на каждого.
+                patients = Patient.objects.bulk_create(
+                    fake.patient(
+                        start + n,
+                        owner_ids[(start + n) * owner_count // options["patients"]],
+                    )
+                    for n in range(count)
+                )
+                patient_ids += [patient.pk for patient in patients]
+            self.stdout.write(
+                f"Врачей: {len(doctors)}, владельцев: {len(owner_ids)}, "
+                f"пациентов: {len(patient_ids)}"
+            )
+
+            # Секции заранее: записи сразу ложатся по месяцам, а не в секцию
+            # по умолчанию.
+            first_day, last_day = fake.date_range(options["years"])
+            partitions = ensure_partitions(
+                month_start(first_day), add_months(month_start(last_day), AHEAD_MONTHS)
+            )
+            self.stdout.write(f"Новых секций: {len(partitions)}")
+
+            try:
+                appointments = fake.appointments(
+                    [doctor.pk for doctor in doctors],
+                    patient_ids,
+                    options["appointments"],
+                    options["years"],
+                )
+            except ValueError as error:
+                raise CommandError(str(error))
+            now = timezone.now()
+            future_days = set()
+            created = 0
+            while batch := list(itertools.islice(appointments, batch_size)):
+                Appointment.objects.bulk_create(batch)
+                future_days.update(
+                    (a.doctor_id, timezone.localdate(a.date_time))
+                    for a in batch
+                    if a.date_time >= now
+                )
+                created += len(batch)
+                self.stdout.write(f"  записей: {created}")
+
+            rows = rebuild_stats()
+            self.stdout.write(f"Строк статистики: {rows}")
+
+        # bulk_create не шлёт сигналов, поэтому кэши сбрасываем сами.
+        invalidate_roster()
+        invalidate_busy_days(future_days)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Готово за {time.perf_counter() - started:.1f} с: "
+                f"{created} записей"
+            )
+        )
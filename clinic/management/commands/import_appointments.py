@@ -0,0 +1,84 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from clinic.importer import IMPORT_BATCH_SIZE, AppointmentImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует записи на приём из CSV или JSONL пачками. "
+        "Прогресс сохраняется в файл, прерванный импорт продолжается с места сбоя."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл .csv или .jsonl")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Формат, по умолчанию по расширению файла",
+        )
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument(
+            "--checkpoint",
+            help="Файл прогресса, по умолчанию <path>.checkpoint",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Начать с начала, не глядя на сохранённый прогресс",
+        )
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or options["path"].rpartition(".")[2].lower()
+        if fmt not in ("csv", "jsonl"):
+            raise CommandError(f"Не удалось определить формат файла: {fmt}")
+        checkpoint = options["checkpoint"] or options["path"] + ".checkpoint"
+
+        skip = 0 if options["restart"] else self.load_checkpoint(checkpoint)
+        if skip:
+            self.stdout.write(f"Продолжаем после строки {skip}")
+
+        importer = AppointmentImporter(batch_size=options["batch_size"])
+        started = time.perf_counter()
+
+        def on_batch(number):
+            self.save_checkpoint(checkpoint, number)
+            rate = (number - skip) / (time.perf_counter() - started)
+            self.stdout.write(f"  {number} строк, {rate:.0f} строк/с")
+
+        with open(options["path"], newline="", encoding="utf-8-sig") as file:
+            try:
+                total = importer.run(read_rows(file, fmt), skip, on_batch)
+            except (ValueError, IntegrityError) as error:
+                raise CommandError(
+                    f"{error}\nПосле исправления запустите команду снова, "
+                    "импорт продолжится с последней сохранённой пачки."
+                )
+
+        seconds = time.perf_counter() - started
+        imported = max(total - skip, 0)
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Импортировано записей: {imported} за {seconds:.1f} с "
+                f"({imported / seconds if seconds else 0:.0f} строк/с)"
+            )
+        )
+
+    def load_checkpoint(self, path):
+        try:
+            with open(path) as file:
+                return json.load(file)["rows"]
+        except FileNotFoundError:
+            return 0
+
+    def save_checkpoint(self, path, rows):
+        # Через временный файл, чтобы сбой посреди записи не испортил прогресс.
+        with open(path + ".tmp", "w") as file:
+            json.dump({"rows": rows}, file)
+        os.replace(path + ".tmp", path)
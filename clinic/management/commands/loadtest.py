@@ -0,0 +1,99 @@
+import http.client
+import statistics
+import threading
+import time
+import urllib.parse
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ["/", "/doctor/", "/patients/", "/api/free-slots/?doctor=1&start="]
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест уже запущенного сервера: несколько потоков "
+        "с keep-alive соединениями в течение заданного времени. "
+        "Запустите против runserver и против gunicorn, чтобы сравнить RPS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://localhost:8000")
+        parser.add_argument("--paths", nargs="+", default=DEFAULT_PATHS)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--duration", type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        base = urllib.parse.urlsplit(options["url"])
+        if base.scheme not in ("http", "https") or not base.netloc:
+            raise CommandError(f"Некорректный адрес: {options['url']}")
+
+        paths = [self.expand(path) for path in options["paths"]]
+        self.stdout.write(
+            f"{options['url']}: {options['concurrency']} потоков, "
+            f"{options['duration']:.0f} с на каждый путь"
+        )
+        for path in paths:
+            self.report(path, self.run(base, path, options))
+
+    def expand(self, path):
+        # start= без значения удобнее подставлять сегодняшней датой.
+        if path.endswith("start="):
+            path += time.strftime("%Y-%m-%d")
+        return path
+
+    def run(self, base, path, options):
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options["duration"]
+
+        def worker():
+            conn_class = (
+                http.client.HTTPSConnection
+                if base.scheme == "https"
+                else http.client.HTTPConnection
+            )
+            conn = conn_class(base.netloc, timeout=30)
+            local_latencies, local_errors = [], 0
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    conn.request("GET", path)
+                    response = conn.getresponse()
+                    response.read()
+                    if response.status >= 400:
+                        local_errors += 1
+                except (OSError, http.client.HTTPException):
+                    local_errors += 1
+                    conn.close()
+                    continue
+                local_latencies.append(time.perf_counter() - start)
+            conn.close()
+            with lock:
+                latencies.extend(local_latencies)
+                errors.append(local_errors)
+
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=worker) for _ in range(options["concurrency"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return latencies, sum(errors), elapsed
+
+    def report(self, path, result):
+        latencies, errors, elapsed = result
+        if not latencies:
+            self.stdout.write(f"  {path:<40} нет ответов, ошибок {errors}")
+            return
+
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f"  {path:<40} {len(latencies) / elapsed:8.1f} запр/с  "
+            f"p50 {statistics.median(latencies) * 1000:7.1f} мс  "
+            f"p95 {p95 * 1000:7.1f} мс  ошибок {errors}"
+        )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from clinic.dedupe import duplicate_groups, merge_patients
+
+
+class Command(BaseCommand):
+    help = (
+        "Склеивает пациентов с одной кличкой и одним номером владельца: "
+        "история переносится на самого старшего, дубли удаляются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать, сколько дублей найдено",
+        )
+
+    def handle(self, *args, **options):
+        groups = list(duplicate_groups())
+        duplicates = sum(len(ids) - 1 for ids in groups)
+        self.stdout.write(
+            f"Групп дублей: {len(groups)}, лишних пациентов: {duplicates}"
+        )
+        if options["dry_run"] or not groups:
+            return
+
+        moved = 0
+        # Каждая группа в своей транзакции: долгих блокировок не бывает.
+        for ids in groups:
+            moved += merge_patients(ids)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Удалено дублей: {duplicates}, перенесено записей: {moved}"
+            )
+        )
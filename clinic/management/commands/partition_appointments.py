@@ -0,0 +1,72 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.utils import OperationalError
+from django.utils import timezone
+
+from clinic.partitions import (
+    AHEAD_MONTHS,
+    add_months,
+    archive_partitions,
+    default_partition_range,
+    ensure_partitions,
+    month_start,
+)
+
+
+def parse_month(value):
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise CommandError(f"Месяц нужен в виде ГГГГ-ММ, а не {value!r}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт помесячные секции таблицы записей на AHEAD месяцев вперёд "
+        "и отсоединяет в архив секции старых месяцев. Запускать раз в день."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ahead", type=int, default=AHEAD_MONTHS)
+        parser.add_argument(
+            "--from",
+            dest="first_month",
+            type=parse_month,
+            help=(
+                "Создать секции и с этого месяца (ГГГГ-ММ), перенеся записи "
+                "из секции по умолчанию"
+            ),
+        )
+        parser.add_argument(
+            "--keep-months",
+            type=int,
+            help="Отсоединить в архив секции старше этого числа месяцев",
+        )
+
+    def handle(self, *args, **options):
+        this_month = month_start(timezone.localdate())
+        last_month = add_months(this_month, options["ahead"])
+        first_month = min(options["first_month"] or this_month, this_month)
+
+        try:
+            for name, moved in ensure_partitions(first_month, last_month):
+                self.stdout.write(f"Секция {name}: перенесено записей {moved}")
+            if options["keep_months"] is not None:
+                before = add_months(this_month, -options["keep_months"])
+                for name in archive_partitions(before):
+                    self.stdout.write(f"В архиве: {name}")
+        except OperationalError as error:
+            # Чаще всего lock_timeout: таблицу держит долгий запрос.
+            raise CommandError(f"Не удалось изменить секции: {error}")
+
+        left = default_partition_range()
+        if left:
+            first, last = (timezone.localdate(value) for value in left)
+            self.stdout.write(
+                self.style.WARNING(
+                    f"В секции по умолчанию записи с {first} по {last}: "
+                    f"запустите с --from {first:%Y-%m}"
+                )
+            )
+        self.stdout.write(self.style.SUCCESS("Секции в порядке"))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from clinic.stats import REBUILD_BATCH_SIZE, rebuild_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает таблицу статистики по всем записям на приём. "
+        "Нужна после миграции и если записи менялись в обход сигналов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = rebuild_stats(options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Строк статистики: {rows} за {time.perf_counter() - started:.1f} с"
+            )
+        )
@@ -0,0 +1,90 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from clinic.benchmarks import Benchmark
+from clinic.models import Appointment, Doctor, Patient
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогоняет сценарии (дашборд, поиск, карта пациента, запись, PDF) "
+        "на текущих данных и печатает перцентили и число запросов в JSON. "
+        "Все изменения откатываются. Данные: generate_clinic_data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=30)
+        parser.add_argument("--scenarios", nargs="+", help="Только эти сценарии")
+        parser.add_argument("--output", help="Сохранить результат в JSON-файл")
+        parser.add_argument(
+            "--compare", help="JSON прошлого прогона, с которым сравнить"
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            try:
+                benchmark = Benchmark(repeat=options["repeat"])
+            except ValueError as error:
+                raise CommandError(str(error))
+            unknown = set(options["scenarios"] or ()) - set(benchmark.scenarios())
+            if unknown:
+                raise CommandError(f"Нет таких сценариев: {', '.join(sorted(unknown))}")
+
+            report = {
+                "meta": self.meta(options["repeat"]),
+                "scenarios": benchmark.run(options["scenarios"]),
+            }
+            transaction.set_rollback(True)
+
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(text + "\n")
+        self.stdout.write(text)
+
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                self.compare(json.load(file)["scenarios"], report["scenarios"])
+
+    def meta(self, repeat):
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=settings.BASE_DIR,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "date": timezone.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "repeat": repeat,
+            "doctors": Doctor.objects.count(),
+            "patients": Patient.objects.count(),
+            "appointments": Appointment.objects.count(),
+        }
+
+    def compare(self, before, after):
+        self.stdout.write("\nСравнение p50 и числа запросов:")
+        for name, result in after.items():
+            old = before.get(name)
+            if old is None:
+                continue
+            change = (
+                (result["p50_ms"] / old["p50_ms"] - 1) * 100 if old["p50_ms"] else 0
+            )
+            self.stdout.write(
+                f"  {name:<18} p50 {old['p50_ms']:8.2f} -> {result['p50_ms']:8.2f} мс "
+                f"({change:+.0f}%)  SQL {old['queries_p50']} -> {result['queries_p50']}"
+            )
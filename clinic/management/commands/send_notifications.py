@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from clinic.metrics import render_prometheus
+from clinic.notifications import NotificationDispatcher
+
+
+class Command(BaseCommand):
+    help = "Отправляет накопившиеся уведомления врачам в Telegram"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Обработать одну пачку и выйти",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.NOTIFICATION_BATCH_SIZE,
+            help="Сколько уведомлений забирать из очереди за раз",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Пауза в секундах, когда очередь пуста",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            help="Отдавать метрики воркера для Prometheus на этом порту",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.TELEGRAM_BOT_TOKEN:
+            raise CommandError("Не задан TELEGRAM_BOT_TOKEN")
+        if options["metrics_port"]:
+            self.serve_metrics(options["metrics_port"])
+
+        try:
+            asyncio.run(self.run(options))
+        except KeyboardInterrupt:
+            pass
+
+    async def run(self, options):
+        dispatcher = NotificationDispatcher(batch_size=options["batch_size"])
+        try:
+            while True:
+                await sync_to_async(close_old_connections)()
+                stats = await dispatcher.dispatch_batch()
+                if any(stats.values()):
+                    self.stdout.write(
+                        "Отправлено: {sent}, повтор: {retried}, "
+                        "ошибок: {failed}, отложено: {deferred}".format(**stats)
+                    )
+                if options["once"]:
+                    break
+                if sum(stats.values()) < dispatcher.batch_size:
+                    await asyncio.sleep(options["interval"])
+        finally:
+            await dispatcher.client.close()
+
+    def serve_metrics(self, port):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
@@ -0,0 +1,271 @@
+import collections
+import contextvars
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+# Сколько последних запросов каждого view хранить для перцентилей.
+TIMING_WINDOW = 1000
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+# Каждый воркер держит метрики у себя и раз в PUBLISH_SECONDS кладёт снимок
+# в общий кэш: /metrics/ любого воркера отдаёт снимки всех, с меткой worker.
+PUBLISH_SECONDS = 5
+SNAPSHOT_TIMEOUT = 60 * 10
+WORKERS_KEY = "clinic:metrics:workers"
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_counters = collections.defaultdict(float)
+_views = {}
+_published_at = 0.0
+_current = contextvars.ContextVar("clinic_request_timings", default=None)
+
+
+class RequestTimings:
+    """Что успел потратить один запрос: база, шаблоны, внешние HTTP-вызовы."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+        self.http = 0.0
+        self.worst_sql = ""
+        self.worst_sql_time = 0.0
+        self._template_depth = 0
+
+
+class _ViewStats:
+    def __init__(self):
+        self.window = collections.deque(maxlen=TIMING_WINDOW)
+        self.totals = collections.Counter()
+
+
+@contextmanager
+def track_request():
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def measure(kind):
+    """Добавляет время блока к текущему запросу ("template" или "http")."""
+    timings = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            setattr(timings, kind, getattr(timings, kind) + time.perf_counter() - start)
+
+
+def record_query(execute, sql, params, many, context):
+    """execute_wrapper, который считает запросы и время базы текущего запроса."""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        timings.queries += 1
+        timings.db += elapsed
+        if elapsed > timings.worst_sql_time:
+            timings.worst_sql, timings.worst_sql_time = sql, elapsed
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """Обработчик connection_created: вешает record_query на соединение."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def inc(name, value=1, **labels):
+    with _lock:
+        _counters[name, tuple(sorted(labels.items()))] += value
+
+
+def observe_request(view, seconds, timings):
+    with _lock:
+        stats = _views.get(view)
+        if stats is None:
+            stats = _views[view] = _ViewStats()
+        stats.window.append(seconds)
+        stats.totals.update(
+            count=1,
+            seconds=seconds,
+            queries=timings.queries,
+            db=timings.db,
+            template=timings.template,
+            http=timings.http,
+        )
+    if time.monotonic() - _published_at >= PUBLISH_SECONDS:
+        publish()
+
+
+def worker_id():
+    # pid берётся при каждом вызове: воркеры gunicorn форкаются после импорта.
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _snapshot_key(worker):
+    return f"clinic:metrics:{worker}"
+
+
+def snapshot():
+    """Метрики этого процесса: {"counters": ..., "views": ...}."""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "views": {
+                view: (sorted(stats.window), dict(stats.totals))
+                for view, stats in _views.items()
+            },
+        }
+
+
+def publish():
+    """Кладёт снимок процесса в общий кэш и записывает воркер в реестр."""
+    global _published_at
+    _published_at = time.monotonic()
+    worker = worker_id()
+    try:
+        cache.set(_snapshot_key(worker), snapshot(), SNAPSHOT_TIMEOUT)
+        workers = cache.get(WORKERS_KEY, set())
+        # Запись реестра не атомарна: потерянный воркер вернётся сюда
+        # при следующей публикации.
+        if worker not in workers:
+            cache.set(WORKERS_KEY, workers | {worker}, None)
+    except Exception:
+        logger.warning("Не удалось сохранить метрики в кэш", exc_info=True)
+
+
+def shared_snapshots():
+    """Снимки всех живых воркеров; без кэша — только этот процесс."""
+    publish()
+    try:
+        workers = cache.get(WORKERS_KEY, set())
+        found = cache.get_many([_snapshot_key(worker) for worker in workers])
+    except Exception:
+        logger.warning("Не удалось прочитать метрики из кэша", exc_info=True)
+        return {worker_id(): snapshot()}
+    alive = {worker for worker in workers if _snapshot_key(worker) in found}
+    if alive != workers:
+        # Снимки остановленных воркеров истекли — убираем их из реестра.
+        cache.set(WORKERS_KEY, alive, None)
+    return {worker: found[_snapshot_key(worker)] for worker in alive}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+def _quantile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def render_prometheus(snapshots=None):
+    """Метрики в текстовом формате Prometheus, у каждой серии метка worker.
+
+    snapshots — {воркер: снимок}, как из shared_snapshots(); по умолчанию
+    только этот процесс.
+    """
+    if snapshots is None:
+        snapshots = {worker_id(): snapshot()}
+    views = sorted(
+        (view, worker, window, totals)
+        for worker, state in snapshots.items()
+        for view, (window, totals) in state["views"].items()
+    )
+    counters = sorted(
+        (name, labels + (("worker", worker),), value)
+        for worker, state in snapshots.items()
+        for (name, labels), value in state["counters"].items()
+    )
+
+    lines = []
+    if views:
+        lines += [
+            "# HELP clinic_request_seconds Время ответа view.",
+            "# TYPE clinic_request_seconds summary",
+        ]
+        for view, worker, window, totals in views:
+            for q in QUANTILES:
+                labels = _labels([("view", view), ("quantile", q), ("worker", worker)])
+                lines.append(f"clinic_request_seconds{labels} {_quantile(window, q)}")
+            labels = _labels([("view", view), ("worker", worker)])
+            lines.append(f"clinic_request_seconds_sum{labels} {totals['seconds']}")
+            lines.append(f"clinic_request_seconds_count{labels} {totals['count']}")
+
+        for metric, key, help_text in [
+            ("clinic_request_db_queries_total", "queries", "Запросы к базе."),
+            ("clinic_request_db_seconds_total", "db", "Время в базе."),
+            ("clinic_request_template_seconds_total", "template", "Время шаблонов."),
+            ("clinic_request_http_seconds_total", "http", "Время внешних HTTP."),
+        ]:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for view, worker, _, totals in views:
+                labels = _labels([("view", view), ("worker", worker)])
+                lines.append(f"{metric}{labels} {totals[key]}")
+
+    for name in sorted({name for name, _, _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for metric, labels, value in counters:
+            if metric == name:
+                lines.append(f"{name}{_labels(labels)} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    global _published_at
+    with _lock:
+        _counters.clear()
+        _views.clear()
+    _published_at = 0.0
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None or timings._template_depth:
+            return super().render(context, request)
+        # Вложенный render_to_string внутри шаблона не считаем второй раз.
+        timings._template_depth += 1
+        try:
+            with measure("template"):
+                return super().render(context, request)
+        finally:
+            timings._template_depth -= 1
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Обычный бэкенд Django, который засекает время рендера шаблонов."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,96 @@
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from .metrics import observe_request, track_request
+from .roster import roster_doctor
+
+logger = logging.getLogger("clinic.performance")
+
+
+class PerformanceMiddleware:
+    """Время каждого запроса по view: всего, в базе, в шаблонах и во внешних HTTP.
+
+    Итоги попадают в метрики (/metrics/) и в заголовок Server-Timing.
+    Медленные запросы с долей PERF_SLOW_LOG_SAMPLE_RATE пишутся в лог
+    вместе с самым долгим SQL.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with track_request() as timings:
+            response = self.get_response(request)
+        self.finish(request, response, time.perf_counter() - start, timings)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with track_request() as timings:
+            response = await self.get_response(request)
+        self.finish(request, response, time.perf_counter() - start, timings)
+        return response
+
+    def finish(self, request, response, seconds, timings):
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        observe_request(view, seconds, timings)
+
+        if settings.PERF_SERVER_TIMING:
+            response["Server-Timing"] = ", ".join(
+                [
+                    f'db;dur={timings.db * 1000:.1f};desc="{timings.queries} SQL"',
+                    f"tpl;dur={timings.template * 1000:.1f}",
+                    f"http;dur={timings.http * 1000:.1f}",
+                    f"total;dur={seconds * 1000:.1f}",
+                ]
+            )
+
+        if (
+            seconds >= settings.PERF_SLOW_REQUEST_SECONDS
+            and random.random() < settings.PERF_SLOW_LOG_SAMPLE_RATE
+        ):
+            logger.warning(
+                "Медленный запрос %s %s (%s): %.0f мс, SQL %d за %.0f мс, "
+                "шаблоны %.0f мс, HTTP %.0f мс; самый долгий SQL %.0f мс: %s",
+                request.method,
+                request.path,
+                view,
+                seconds * 1000,
+                timings.queries,
+                timings.db * 1000,
+                timings.template * 1000,
+                timings.http * 1000,
+                timings.worst_sql_time * 1000,
+                timings.worst_sql[:1000],
+            )
+
+
+def current_doctor(request):
+    doctor_id = request.session.get("doctor_id")
+    return roster_doctor(doctor_id) if doctor_id else None
+
+
+class CurrentDoctorMiddleware(MiddlewareMixin):
+    """request.doctor — выбранный врач ({"id", "full_name", ...}) или None.
+
+    Считается лениво при первом обращении: id берётся из сессии, остальное
+    из закэшированного списка врачей, без запросов к базе.
+    """
+
+    def process_request(self, request):
+        request.doctor = SimpleLazyObject(lambda: current_doctor(request))
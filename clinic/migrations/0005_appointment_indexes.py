@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции.
+    atomic = False
+
+    dependencies = [
+        ("clinic", "0004_notification"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="appointment",
+            index=models.Index(
+                fields=["doctor", "date_time"], name="appointment_doctor_time_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="appointment",
+            index=models.Index(
+                fields=["patient", "-date_time"], name="appointment_patient_time_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="appointment",
+            index=models.Index(
+                condition=models.Q(("status", "planned")),
+                fields=["date_time"],
+                name="appointment_planned_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индекс строится CONCURRENTLY, это нельзя делать внутри транзакции.
+    atomic = False
+
+    dependencies = [
+        ("clinic", "0005_appointment_indexes"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=[
+                        # Неудачный CREATE INDEX CONCURRENTLY оставляет
+                        # невалидный индекс, убираем его перед повтором.
+                        'DROP INDEX CONCURRENTLY IF EXISTS "appointment_unique_doctor_slot";',
+                        'CREATE UNIQUE INDEX CONCURRENTLY "appointment_unique_doctor_slot" '
+                        'ON "clinic_appointment" ("doctor_id", "date_time") '
+                        "WHERE NOT (\"status\" = 'canceled');",
+                    ],
+                    reverse_sql=(
+                        'DROP INDEX CONCURRENTLY IF EXISTS "appointment_unique_doctor_slot";'
+                    ),
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name="appointment",
+                    constraint=models.UniqueConstraint(
+                        condition=models.Q(("status", "canceled"), _negated=True),
+                        fields=("doctor", "date_time"),
+                        name="appointment_unique_doctor_slot",
+                    ),
+                ),
+            ],
+        ),
+    ]
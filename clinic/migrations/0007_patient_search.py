@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:08
+
+import re
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+
+
+def fill_phone_digits(apps, schema_editor):
+    Patient = apps.get_model("clinic", "Patient")
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Patient.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .only("pk", "owner_phone")[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+            for patient in batch:
+                patient.owner_phone_digits = re.sub(r"\D", "", patient.owner_phone)
+            Patient.objects.bulk_update(batch, ["owner_phone_digits"])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся CONCURRENTLY, а телефоны заполняются пачками,
+    # каждая в своей транзакции.
+    atomic = False
+
+    dependencies = [
+        ("clinic", "0006_appointment_unique_doctor_slot"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="patient",
+            name="owner_phone_digits",
+            field=models.CharField(
+                default="",
+                editable=False,
+                max_length=20,
+                verbose_name="Цифры телефона владельца",
+            ),
+        ),
+        migrations.RunPython(fill_phone_digits, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("name"), name="gin_trgm_ops"
+                ),
+                name="patient_name_trgm_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("owner_name"),
+                    name="gin_trgm_ops",
+                ),
+                name="patient_owner_name_trgm_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["owner_phone_digits"],
+                name="patient_phone_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+    ]
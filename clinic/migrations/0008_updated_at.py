@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("clinic", "0007_patient_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="appointment",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="patient",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("clinic", "0008_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="appointment",
+            name="external_id",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=64,
+                null=True,
+                unique=True,
+                verbose_name="Внешний ID",
+            ),
+        ),
+    ]
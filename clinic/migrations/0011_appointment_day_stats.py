@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("clinic", "0010_appointment_time_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AppointmentDayStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="День")),
+                (
+                    "species",
+                    models.CharField(max_length=50, verbose_name="Вид животного"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("planned", "Запланировано"),
+                            ("completed", "Завершено"),
+                            ("canceled", "Отменено"),
+                        ],
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                ("count", models.PositiveIntegerField(verbose_name="Записей")),
+                (
+                    "doctor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="clinic.doctor",
+                        verbose_name="Врач",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Статистика за день",
+                "verbose_name_plural": "Статистика по дням",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("day", "doctor", "species", "status"),
+                        name="appointment_day_stats_unique",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+
+BATCH_SIZE = 1000
+
+
+def normalize_phone_keys(apps, schema_editor):
+    """8XXXXXXXXXX -> 7XXXXXXXXXX, как теперь считает clinic.phones.phone_digits."""
+    Patient = apps.get_model("clinic", "Patient")
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Patient.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+            Patient.objects.filter(
+                pk__in=batch, owner_phone_digits__regex=r"^8[0-9]{10}$"
+            ).update(
+                owner_phone_digits=Concat(Value("7"), Substr("owner_phone_digits", 2))
+            )
+        last_pk = batch[-1]
+
+
+class Migration(migrations.Migration):
+    # Ключи обновляются пачками, а индекс строится CONCURRENTLY.
+    atomic = False
+
+    dependencies = [
+        ("clinic", "0011_appointment_day_stats"),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_phone_keys, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=models.Index(
+                models.F("owner_phone_digits"),
+                django.db.models.functions.text.Upper("name"),
+                name="patient_phone_name_idx",
+            ),
+        ),
+    ]
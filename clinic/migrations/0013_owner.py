@@ -0,0 +1,144 @@
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+
+# Пока работает старый код, он создаёт пациентов без owner_id: триггер
+# находит или заводит владельца так же, как Owner.objects.resolve.
+# Удаляется в 0015 вместе со старыми столбцами.
+CREATE_TRIGGER = r"""
+CREATE FUNCTION clinic_patient_fill_owner() RETURNS trigger AS $$
+DECLARE
+    digits text := regexp_replace(coalesce(NEW.owner_phone, ''), '\D', '', 'g');
+BEGIN
+    IF NEW.owner_id IS NOT NULL THEN
+        RETURN NEW;
+    END IF;
+    IF length(digits) = 11 AND left(digits, 1) = '8' THEN
+        digits := '7' || substr(digits, 2);
+    END IF;
+    IF digits = '' THEN
+        INSERT INTO clinic_owner (name, phone, phone_digits, created_at, updated_at)
+        VALUES (NEW.owner_name, NEW.owner_phone, '', now(), now())
+        RETURNING id INTO NEW.owner_id;
+    ELSE
+        INSERT INTO clinic_owner (name, phone, phone_digits, created_at, updated_at)
+        VALUES (NEW.owner_name, NEW.owner_phone, digits, now(), now())
+        ON CONFLICT (phone_digits) WHERE NOT (phone_digits = '') DO NOTHING;
+        SELECT id INTO NEW.owner_id FROM clinic_owner WHERE phone_digits = digits;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER clinic_patient_fill_owner BEFORE INSERT ON clinic_patient
+FOR EACH ROW EXECUTE FUNCTION clinic_patient_fill_owner();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER clinic_patient_fill_owner ON clinic_patient;
+DROP FUNCTION clinic_patient_fill_owner();
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("clinic", "0012_patient_phone_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Owner",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(max_length=150, verbose_name="ФИО владельца"),
+                ),
+                ("phone", models.CharField(max_length=20, verbose_name="Телефон")),
+                (
+                    "phone_digits",
+                    models.CharField(
+                        default="",
+                        editable=False,
+                        max_length=20,
+                        verbose_name="Цифры телефона",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Владелец",
+                "verbose_name_plural": "Владельцы",
+                "indexes": [
+                    django.contrib.postgres.indexes.GinIndex(
+                        django.contrib.postgres.indexes.OpClass(
+                            django.db.models.functions.text.Upper("name"),
+                            name="gin_trgm_ops",
+                        ),
+                        name="owner_name_trgm_idx",
+                    ),
+                    django.contrib.postgres.indexes.GinIndex(
+                        fields=["phone_digits"],
+                        name="owner_phone_trgm_idx",
+                        opclasses=["gin_trgm_ops"],
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("phone_digits", ""), _negated=True),
+                        fields=("phone_digits",),
+                        name="owner_unique_phone",
+                    ),
+                ],
+            },
+        ),
+        migrations.AddField(
+            model_name="patient",
+            name="owner",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="pets",
+                to="clinic.owner",
+                verbose_name="Владелец",
+            ),
+        ),
+        # Новый код старые столбцы не заполняет.
+        migrations.AlterField(
+            model_name="patient",
+            name="owner_name",
+            field=models.CharField(
+                max_length=150, null=True, verbose_name="ФИО Владельца"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="patient",
+            name="owner_phone",
+            field=models.CharField(
+                max_length=20, null=True, verbose_name="Телефон владельца"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="patient",
+            name="owner_phone_digits",
+            field=models.CharField(
+                default="",
+                editable=False,
+                max_length=20,
+                null=True,
+                verbose_name="Цифры телефона владельца",
+            ),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
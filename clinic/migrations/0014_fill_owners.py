@@ -0,0 +1,128 @@
+import re
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models, transaction
+from django.db.models.functions import Upper
+
+BATCH_SIZE = 1000
+
+
+def owner_phone_digits(phone):
+    """Как clinic.phones.phone_digits: столбец мог остаться пустым у фикстур."""
+    digits = re.sub(r"\D", "", phone)
+    if len(digits) == 11 and digits.startswith("8"):
+        digits = "7" + digits[1:]
+    return digits
+
+
+def fill_owners(apps, schema_editor):
+    """Владелец для каждого пациента: один на номер, без номера — свой.
+
+    ФИО и номер берутся у самого старого пациента с этим номером.
+    """
+    Owner = apps.get_model("clinic", "Owner")
+    Patient = apps.get_model("clinic", "Patient")
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Patient.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .only("pk", "owner_id", "owner_name", "owner_phone")[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            # Пациентов, созданных после 0013, владелец уже есть от триггера.
+            batch = [patient for patient in batch if patient.owner_id is None]
+            keys = {
+                patient.pk: owner_phone_digits(patient.owner_phone) for patient in batch
+            }
+
+            new = {}
+            for patient in batch:
+                digits = keys[patient.pk]
+                if digits and digits not in new:
+                    new[digits] = Owner(
+                        name=patient.owner_name,
+                        phone=patient.owner_phone,
+                        phone_digits=digits,
+                    )
+            # Номер мог уже появиться: из прошлой пачки или от триггера.
+            Owner.objects.bulk_create(new.values(), ignore_conflicts=True)
+            owners = dict(
+                Owner.objects.filter(phone_digits__in=new).values_list(
+                    "phone_digits", "pk"
+                )
+            )
+
+            orphans = [patient for patient in batch if not keys[patient.pk]]
+            created = Owner.objects.bulk_create(
+                Owner(name=patient.owner_name, phone=patient.owner_phone)
+                for patient in orphans
+            )
+            for patient, owner in zip(orphans, created):
+                patient.owner_id = owner.pk
+            for patient in batch:
+                if keys[patient.pk]:
+                    patient.owner_id = owners[keys[patient.pk]]
+            Patient.objects.bulk_update(batch, ["owner"])
+
+
+class Migration(migrations.Migration):
+    # Владельцы заполняются пачками, каждая в своей транзакции, индекс
+    # строится CONCURRENTLY. NOT NULL ставится через проверку NOT VALID:
+    # VALIDATE не блокирует запись, а SET NOT NULL при проверенном CHECK
+    # не сканирует таблицу.
+    atomic = False
+
+    dependencies = [
+        ("clinic", "0013_owner"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_owners, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=models.Index(
+                models.F("owner"),
+                Upper("name"),
+                name="patient_owner_name_idx",
+            ),
+        ),
+        migrations.RunSQL(
+            "ALTER TABLE clinic_patient ADD CONSTRAINT patient_owner_not_null "
+            "CHECK (owner_id IS NOT NULL) NOT VALID",
+            "ALTER TABLE clinic_patient DROP CONSTRAINT patient_owner_not_null",
+        ),
+        migrations.RunSQL(
+            "ALTER TABLE clinic_patient VALIDATE CONSTRAINT patient_owner_not_null",
+            migrations.RunSQL.noop,
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    "ALTER TABLE clinic_patient ALTER COLUMN owner_id SET NOT NULL",
+                    "ALTER TABLE clinic_patient ALTER COLUMN owner_id DROP NOT NULL",
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name="patient",
+                    name="owner",
+                    field=models.ForeignKey(
+                        db_index=False,
+                        on_delete=models.PROTECT,
+                        related_name="pets",
+                        to="clinic.owner",
+                        verbose_name="Владелец",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            "ALTER TABLE clinic_patient DROP CONSTRAINT patient_owner_not_null",
+            "ALTER TABLE clinic_patient ADD CONSTRAINT patient_owner_not_null "
+            "CHECK (owner_id IS NOT NULL)",
+        ),
+    ]
@@ -0,0 +1,44 @@
+from importlib import import_module
+
+from django.contrib.postgres.operations import RemoveIndexConcurrently
+from django.db import migrations
+
+owner_migration = import_module("clinic.migrations.0013_owner")
+
+
+class Migration(migrations.Migration):
+    # Старые столбцы владельца. При поэтапном выкатывании сначала
+    # migrate clinic 0014, затем новый код, затем эта миграция.
+    atomic = False
+
+    dependencies = [
+        ("clinic", "0014_fill_owners"),
+    ]
+
+    operations = [
+        migrations.RunSQL(owner_migration.DROP_TRIGGER, owner_migration.CREATE_TRIGGER),
+        RemoveIndexConcurrently(
+            model_name="patient",
+            name="patient_owner_name_trgm_idx",
+        ),
+        RemoveIndexConcurrently(
+            model_name="patient",
+            name="patient_phone_trgm_idx",
+        ),
+        RemoveIndexConcurrently(
+            model_name="patient",
+            name="patient_phone_name_idx",
+        ),
+        migrations.RemoveField(
+            model_name="patient",
+            name="owner_name",
+        ),
+        migrations.RemoveField(
+            model_name="patient",
+            name="owner_phone",
+        ),
+        migrations.RemoveField(
+            model_name="patient",
+            name="owner_phone_digits",
+        ),
+    ]
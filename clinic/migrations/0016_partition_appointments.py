@@ -0,0 +1,173 @@
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+TABLE = "clinic_appointment"
+DEFAULT_PARTITION = "clinic_appointment_default"
+
+# Индексы старой таблицы, которые становятся секциями индексов родителя.
+PARTITION_INDEXES = [
+    "appointment_time_idx",
+    "appointment_doctor_time_idx",
+    "appointment_patient_time_idx",
+    "appointment_planned_idx",
+    "appointment_unique_doctor_slot",
+]
+
+PARENT_INDEXES = [
+    "CREATE INDEX appointment_time_idx ON clinic_appointment (date_time)",
+    "CREATE INDEX appointment_doctor_time_idx "
+    "ON clinic_appointment (doctor_id, date_time)",
+    "CREATE INDEX appointment_patient_time_idx "
+    "ON clinic_appointment (patient_id, date_time DESC)",
+    "CREATE INDEX appointment_planned_idx ON clinic_appointment (date_time) "
+    "WHERE status = 'planned'",
+    "CREATE UNIQUE INDEX appointment_unique_doctor_slot "
+    "ON clinic_appointment (doctor_id, date_time) WHERE NOT status = 'canceled'",
+    "CREATE INDEX appointment_external_id_idx ON clinic_appointment (external_id)",
+]
+
+
+def partition_table(apps, schema_editor):
+    """Старая таблица становится секцией по умолчанию нового родителя.
+
+    Все шаги — только каталог: индексы под новый ключ построены заранее
+    CONCURRENTLY, и ATTACH их подхватывает, а секция по умолчанию без
+    соседей не проверяется. ACCESS EXCLUSIVE держится доли секунды.
+    Раскладывает записи по месяцам команда partition_appointments.
+    """
+    connection = schema_editor.connection
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SET LOCAL lock_timeout = '10s'")
+        cursor.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"SELECT pg_get_serial_sequence('{TABLE}', 'id')")
+        cursor.execute(f"SELECT last_value, is_called FROM {cursor.fetchone()[0]}")
+        last_value, is_called = cursor.fetchone()
+
+        # Обычная последовательность вместо IDENTITY: Postgres до 17 не
+        # поддерживает IDENTITY у секционированных таблиц.
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id DROP IDENTITY")
+        cursor.execute(
+            f"CREATE SEQUENCE {TABLE}_id_seq START WITH %s",
+            [last_value + 1 if is_called else last_value],
+        )
+        cursor.execute(
+            f"""
+            CREATE TABLE {TABLE}_partitioned (
+                id bigint NOT NULL DEFAULT nextval('{TABLE}_id_seq'),
+                date_time timestamp with time zone NOT NULL,
+                complaint text NOT NULL,
+                status varchar(20) NOT NULL,
+                doctor_id bigint NOT NULL,
+                patient_id bigint NOT NULL,
+                diagnosis text NOT NULL,
+                prescription text NOT NULL,
+                updated_at timestamp with time zone NOT NULL,
+                external_id varchar(64) NULL,
+                CONSTRAINT {TABLE}_partitioned_pkey PRIMARY KEY (id, date_time)
+            ) PARTITION BY RANGE (date_time)
+            """
+        )
+
+        # Ключи старой таблицы: первичный — на заранее построенный индекс,
+        # уникальность external_id и индексы внешних ключей больше не нужны.
+        cursor.execute(f"ALTER TABLE {TABLE} DROP CONSTRAINT {TABLE}_pkey")
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT {DEFAULT_PARTITION}_pkey "
+            f"PRIMARY KEY USING INDEX {DEFAULT_PARTITION}_pkey"
+        )
+        cursor.execute(
+            f"ALTER TABLE {TABLE} DROP CONSTRAINT IF EXISTS {TABLE}_external_id_key"
+        )
+        for index in [
+            f"{TABLE}_external_id_3088b0b0_like",
+            f"{TABLE}_doctor_id_a005cb8d",
+            f"{TABLE}_patient_id_dd04daf6",
+        ]:
+            cursor.execute(f"DROP INDEX IF EXISTS {index}")
+        for index in PARTITION_INDEXES:
+            cursor.execute(f"ALTER INDEX {index} RENAME TO {DEFAULT_PARTITION}_{index}")
+
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {DEFAULT_PARTITION}")
+        cursor.execute(f"ALTER TABLE {TABLE}_partitioned RENAME TO {TABLE}")
+        cursor.execute(f"ALTER INDEX {TABLE}_partitioned_pkey RENAME TO {TABLE}_pkey")
+        cursor.execute(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+        for sql in PARENT_INDEXES:
+            cursor.execute(sql)
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT "
+            f"{TABLE}_doctor_id_a005cb8d_fk_clinic_doctor_id "
+            "FOREIGN KEY (doctor_id) REFERENCES clinic_doctor (id) "
+            "DEFERRABLE INITIALLY DEFERRED"
+        )
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT "
+            f"{TABLE}_patient_id_dd04daf6_fk_clinic_patient_id "
+            "FOREIGN KEY (patient_id) REFERENCES clinic_patient (id) "
+            "DEFERRABLE INITIALLY DEFERRED"
+        )
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"
+        )
+
+
+class Migration(migrations.Migration):
+    # Индексы под новый первичный ключ строятся CONCURRENTLY.
+    atomic = False
+
+    dependencies = [
+        ("clinic", "0015_remove_patient_owner_fields"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {DEFAULT_PARTITION}_pkey "
+            f"ON {TABLE} (id, date_time)",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+            f"{DEFAULT_PARTITION}_external_id_idx ON {TABLE} (external_id)",
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(partition_table)],
+            state_operations=[
+                migrations.AlterField(
+                    model_name="appointment",
+                    name="doctor",
+                    field=models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="clinic.doctor",
+                        verbose_name="Врач",
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="appointment",
+                    name="external_id",
+                    field=models.CharField(
+                        blank=True,
+                        editable=False,
+                        max_length=64,
+                        null=True,
+                        verbose_name="Внешний ID",
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="appointment",
+                    name="patient",
+                    field=models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="history",
+                        to="clinic.patient",
+                        verbose_name="Пациент",
+                    ),
+                ),
+                migrations.AddIndex(
+                    model_name="appointment",
+                    index=models.Index(
+                        fields=["external_id"], name="appointment_external_id_idx"
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -1,4 +1,11 @@
+import datetime
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
+
+from .phones import phone_digits
 
 
 class Doctor(models.Model):
@@ -20,23 +27,144 @@ class Doctor(models.Model):
         return f"{self.full_name} ({self.specialization})"
 
 
+class OwnerQuerySet(models.QuerySet):
+    def resolve(self, name, phone):
+        """Владелец с этим номером или новый.
+
+        Номер — ключ владельца, поэтому поиск — одна проба уникального
+        индекса owner_unique_phone.
+        """
+        digits = phone_digits(phone)
+        if not digits:
+            return self.create(name=name, phone=phone)
+        owner, created = self.get_or_create(
+            phone_digits=digits, defaults={"name": name, "phone": phone}
+        )
+        return owner
+
+
+class Owner(models.Model):
+    name = models.CharField("ФИО владельца", max_length=150)
+    phone = models.CharField("Телефон", max_length=20)
+    phone_digits = models.CharField(
+        "Цифры телефона", max_length=20, editable=False, default=""
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = OwnerQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Владелец"
+        verbose_name_plural = "Владельцы"
+        indexes = [
+            # icontains в Postgres — это UPPER(col) LIKE UPPER('%q%'),
+            # поэтому триграммный индекс строится по UPPER(col).
+            GinIndex(
+                OpClass(Upper("name"), name="gin_trgm_ops"),
+                name="owner_name_trgm_idx",
+            ),
+            GinIndex(
+                fields=["phone_digits"],
+                opclasses=["gin_trgm_ops"],
+                name="owner_phone_trgm_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["phone_digits"],
+                condition=~models.Q(phone_digits=""),
+                name="owner_unique_phone",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.phone})"
+
+    def save(self, *args, **kwargs):
+        self.phone_digits = phone_digits(self.phone)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "phone" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "phone_digits"}
+        super().save(*args, **kwargs)
+
+
+class PatientQuerySet(models.QuerySet):
+    def matching(self, name, owner_phone):
+        """Пациенты с той же кличкой у владельца с тем же номером.
+
+        Проба owner_unique_phone и patient_owner_name_idx; этим же ключом
+        пациентов склеивают импорт и merge_duplicate_patients.
+        """
+        return self.filter(
+            owner__phone_digits=phone_digits(owner_phone), name__iexact=name.strip()
+        )
+
+
 class Patient(models.Model):
     name = models.CharField("Кличка", max_length=100)
     species = models.CharField("Вид животного", max_length=50)
     breed = models.CharField("Порода", max_length=100, blank=True)
     birth_date = models.DateField("Дата рождения", null=True, blank=True)
-
-    owner_name = models.CharField("ФИО Владельца", max_length=150)
-    owner_phone = models.CharField("Телефон владельца", max_length=20)
+    # Отдельный индекс не нужен: owner_id — первый столбец patient_owner_name_idx.
+    owner = models.ForeignKey(
+        Owner,
+        on_delete=models.PROTECT,
+        related_name="pets",
+        verbose_name="Владелец",
+        db_index=False,
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PatientQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Пациент"
         verbose_name_plural = "Пациенты"
+        indexes = [
+            GinIndex(
+                OpClass(Upper("name"), name="gin_trgm_ops"),
+                name="patient_name_trgm_idx",
+            ),
+            models.Index("owner", Upper("name"), name="patient_owner_name_idx"),
+        ]
 
     def __str__(self):
-        return f"{self.name} ({self.species}) - {self.owner_name}"
+        return f"{self.name} ({self.species}) - {self.owner.name}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Сигналу нужен прежний вид животного, чтобы пересчитать статистику.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+
+def day_bounds(first_day, last_day):
+    """Полуоткрытый интервал [начало first_day, начало следующего за last_day)."""
+    tz = timezone.get_current_timezone()
+    start = datetime.datetime.combine(first_day, datetime.time.min, tzinfo=tz)
+    end = datetime.datetime.combine(
+        last_day + datetime.timedelta(days=1), datetime.time.min, tzinfo=tz
+    )
+    return start, end
+
+
+class AppointmentQuerySet(models.QuerySet):
+    def between_days(self, first_day, last_day):
+        """Записи с first_day по last_day включительно.
+
+        Фильтр строится как полуоткрытый интервал по самому столбцу, а не
+        через date_time__date, поэтому для него подходят индексы.
+        """
+        start, end = day_bounds(first_day, last_day)
+        return self.filter(date_time__gte=start, date_time__lt=end)
+
+    def on_day(self, day):
+        return self.between_days(day, day)
 
 
 class Appointment(models.Model):
@@ -46,13 +174,19 @@ class Appointment(models.Model):
         ("canceled", "Отменено"),
     ]
 
-    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, verbose_name="Врач")
+    # Отдельные индексы по врачу и пациенту не нужны: они первые столбцы
+    # appointment_doctor_time_idx и appointment_patient_time_idx.
+    doctor = models.ForeignKey(
+        Doctor, on_delete=models.CASCADE, verbose_name="Врач", db_index=False
+    )
     patient = models.ForeignKey(
         Patient,
         on_delete=models.CASCADE,
         verbose_name="Пациент",
         related_name="history",
+        db_index=False,
     )
+    # Ключ секционирования таблицы (clinic.partitions).
     date_time = models.DateTimeField("Дата и время приема")
     complaint = models.TextField("Жалоба", blank=True)
     diagnosis = models.TextField("Диагноз", blank=True, default="")
@@ -60,11 +194,112 @@ class Appointment(models.Model):
     status = models.CharField(
         "Статус", max_length=20, choices=STATUS_CHOICES, default="planned"
     )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Номер записи в системе, из которой она импортирована. Уникальность
+    # держит импорт: уникальный индекс секционированной таблицы обязан
+    # включать date_time.
+    external_id = models.CharField(
+        "Внешний ID", max_length=64, null=True, blank=True, editable=False
+    )
+
+    objects = AppointmentQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Запись на прием"
         verbose_name_plural = "Записи на прием"
         ordering = ["-date_time"]
+        indexes = [
+            # Фильтр и сортировка по дате в админке.
+            models.Index(fields=["date_time"], name="appointment_time_idx"),
+            models.Index(
+                fields=["doctor", "date_time"], name="appointment_doctor_time_idx"
+            ),
+            models.Index(
+                fields=["patient", "-date_time"], name="appointment_patient_time_idx"
+            ),
+            models.Index(
+                fields=["date_time"],
+                condition=models.Q(status="planned"),
+                name="appointment_planned_idx",
+            ),
+            models.Index(fields=["external_id"], name="appointment_external_id_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["doctor", "date_time"],
+                condition=~models.Q(status="canceled"),
+                name="appointment_unique_doctor_slot",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.date_time.strftime('%d.%m %H:%M')} - {self.patient.name}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Исходные значения нужны сигналам, чтобы сбросить кэш старого слота.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+
+class AppointmentDayStats(models.Model):
+    """Число записей за день по врачу, виду животного и статусу.
+
+    Поддерживается сигналами через clinic.stats, целиком пересчитывается
+    командой rebuild_clinic_stats.
+    """
+
+    day = models.DateField("День")
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, verbose_name="Врач")
+    species = models.CharField("Вид животного", max_length=50)
+    status = models.CharField(
+        "Статус", max_length=20, choices=Appointment.STATUS_CHOICES
+    )
+    count = models.PositiveIntegerField("Записей")
+
+    class Meta:
+        verbose_name = "Статистика за день"
+        verbose_name_plural = "Статистика по дням"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "doctor", "species", "status"],
+                name="appointment_day_stats_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day}: {self.species}, {self.get_status_display()} — {self.count}"
+
+
+class Notification(models.Model):
+    STATUS_CHOICES = [
+        ("pending", "В очереди"),
+        ("sent", "Отправлено"),
+        ("failed", "Ошибка"),
+    ]
+
+    chat_id = models.CharField("Telegram id получателя", max_length=20)
+    text = models.TextField("Текст")
+    status = models.CharField(
+        "Статус", max_length=20, choices=STATUS_CHOICES, default="pending"
+    )
+    attempts = models.PositiveSmallIntegerField("Попыток отправки", default=0)
+    next_attempt_at = models.DateTimeField("Следующая попытка", default=timezone.now)
+    last_error = models.TextField("Последняя ошибка", blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField("Отправлено", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Уведомление"
+        verbose_name_plural = "Уведомления"
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=models.Q(status="pending"),
+                name="notification_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.chat_id}: {self.get_status_display()}"
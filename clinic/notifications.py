@@ -0,0 +1,184 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import Notification
+
+
+def enqueue_telegram_message(chat_id, message):
+    """Кладёт сообщение в очередь. Вызывать в транзакции вместе с записью."""
+    if not chat_id:
+        return None
+    return Notification.objects.create(chat_id=chat_id, text=message)
+
+
+class TelegramError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TelegramClient:
+    """Асинхронный клиент Bot API с одним пулом keep-alive соединений."""
+
+    def __init__(self, token=None, api_url=None, timeout=None):
+        self.token = token or settings.TELEGRAM_BOT_TOKEN
+        self.api_url = (api_url or settings.TELEGRAM_API_URL).rstrip("/")
+        self.timeout = timeout or settings.TELEGRAM_TIMEOUT
+        self._http = None
+
+    def _get_http(self):
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=self.timeout)
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def send_message(self, chat_id, message):
+        url = f"{self.api_url}/bot{self.token}/sendMessage"
+        data = {"chat_id": chat_id, "text": message}
+
+        start = time.perf_counter()
+        try:
+            with metrics.measure("http"):
+                try:
+                    response = await self._get_http().post(url, data=data)
+                except httpx.RemoteProtocolError:
+                    # Сервер закрыл простаивающее соединение, пробуем заново.
+                    response = await self._get_http().post(url, data=data)
+        except httpx.HTTPError as e:
+            raise TelegramError(f"Ошибка соединения: {e}") from e
+        finally:
+            metrics.inc("clinic_telegram_requests_total")
+            metrics.inc("clinic_telegram_seconds_total", time.perf_counter() - start)
+
+        if response.status_code == 200:
+            return
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        retry_after = data.get("parameters", {}).get("retry_after")
+        description = data.get("description") or response.text[:200]
+        raise TelegramError(
+            f"HTTP {response.status_code}: {description}", retry_after=retry_after
+        )
+
+
+class NotificationDispatcher:
+    """Отправляет уведомления из очереди пачками.
+
+    Пачка забирается через SKIP LOCKED и сразу откладывается на
+    NOTIFICATION_LEASE секунд, поэтому несколько воркеров не возьмут одно
+    сообщение дважды. Разные чаты отправляются параллельно, сообщения одного
+    чата — по очереди с ограничением частоты, которое считается в памяти.
+    """
+
+    def __init__(
+        self, client=None, batch_size=None, chat_interval=None, concurrency=None
+    ):
+        self.client = client or TelegramClient()
+        self.batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+        if chat_interval is None:
+            chat_interval = settings.TELEGRAM_CHAT_INTERVAL
+        self.chat_interval = chat_interval
+        self.concurrency = concurrency or settings.TELEGRAM_CONCURRENCY
+        self._last_sent = {}
+
+    def retry_delay(self, attempts):
+        delay = settings.NOTIFICATION_RETRY_DELAY * 2 ** (attempts - 1)
+        return min(delay, settings.NOTIFICATION_RETRY_MAX_DELAY)
+
+    async def dispatch_batch(self):
+        stats = {"sent": 0, "retried": 0, "failed": 0, "deferred": 0}
+
+        by_chat = {}
+        for notification in await sync_to_async(self._claim_batch)():
+            by_chat.setdefault(notification.chat_id, []).append(notification)
+
+        limit = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *(self._dispatch_chat(batch, limit) for batch in by_chat.values())
+        )
+        for chat_results in results:
+            for result in chat_results:
+                stats[result] += 1
+        for result, count in stats.items():
+            if count:
+                metrics.inc("clinic_notifications_total", count, result=result)
+        return stats
+
+    def _claim_batch(self):
+        with transaction.atomic():
+            batch = list(
+                Notification.objects.select_for_update(skip_locked=True)
+                .filter(status="pending", next_attempt_at__lte=timezone.now())
+                .order_by("next_attempt_at", "id")[: self.batch_size]
+            )
+            lease = timezone.now() + timedelta(seconds=settings.NOTIFICATION_LEASE)
+            Notification.objects.filter(pk__in=[n.pk for n in batch]).update(
+                next_attempt_at=lease
+            )
+        return batch
+
+    async def _dispatch_chat(self, batch, limit):
+        results = []
+        for notification in batch:
+            wait = self._rate_limit_wait(notification.chat_id)
+            if wait > 0:
+                notification.next_attempt_at = timezone.now() + timedelta(seconds=wait)
+                await notification.asave(update_fields=["next_attempt_at"])
+                results.append("deferred")
+                continue
+
+            async with limit:
+                results.append(await self._send(notification))
+        return results
+
+    def _rate_limit_wait(self, chat_id):
+        last_sent = self._last_sent.get(chat_id)
+        if last_sent is None:
+            return 0
+        return self.chat_interval - (time.monotonic() - last_sent)
+
+    async def _send(self, notification):
+        notification.attempts += 1
+        try:
+            await self.client.send_message(notification.chat_id, notification.text)
+        except TelegramError as e:
+            notification.last_error = str(e)
+            if notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+                notification.status = "failed"
+                result = "failed"
+            else:
+                delay = e.retry_after or self.retry_delay(notification.attempts)
+                notification.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+                result = "retried"
+        else:
+            self._last_sent[notification.chat_id] = time.monotonic()
+            notification.status = "sent"
+            notification.sent_at = timezone.now()
+            notification.last_error = ""
+            result = "sent"
+
+        await notification.asave(
+            update_fields=[
+                "attempts",
+                "status",
+                "next_attempt_at",
+                "last_error",
+                "sent_at",
+            ]
+        )
+        return result
@@ -0,0 +1,95 @@
+import datetime
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def encode_cursor(date_time, pk):
+    microseconds = (date_time - EPOCH) // datetime.timedelta(microseconds=1)
+    return f"{microseconds}.{pk}"
+
+
+def decode_cursor(cursor):
+    try:
+        microseconds, pk = cursor.split(".")
+        date_time = EPOCH + datetime.timedelta(microseconds=int(microseconds))
+        return date_time, int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+# Меньше этого числа строк точный COUNT(*) дешёвый, и считаем его.
+EXACT_COUNT_LIMIT = 10000
+
+
+def estimated_count(queryset):
+    """Оценка числа строк от планировщика Postgres или None."""
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, который на больших выборках не делает COUNT(*).
+
+    Число страниц становится приблизительным, зато страница списка не
+    сканирует всю таблицу ради счётчика.
+    """
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, "query"):
+            return super().count
+        estimate = estimated_count(self.object_list)
+        if estimate is None or estimate < EXACT_COUNT_LIMIT:
+            return super().count
+        return estimate
+
+
+class KeysetPaginationMixin:
+    """Постраничный вывод ListView по ключу (date_time, id) вместо OFFSET.
+
+    Следующая страница начинается после курсора из параметра ``after``,
+    поэтому глубокие страницы стоят столько же, сколько первая.
+    """
+
+    cursor_param = "after"
+    cursor_field = "date_time"
+
+    def paginate_queryset(self, queryset, page_size):
+        queryset = queryset.order_by(self.cursor_field, "pk")
+        cursor = decode_cursor(self.request.GET.get(self.cursor_param))
+        if cursor:
+            value, pk = cursor
+            queryset = queryset.filter(
+                Q(**{f"{self.cursor_field}__gt": value})
+                | Q(**{self.cursor_field: value, "pk__gt": pk})
+            )
+
+        rows = list(queryset[: page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+
+        self.next_cursor = None
+        if has_next:
+            last = rows[-1]
+            self.next_cursor = encode_cursor(getattr(last, self.cursor_field), last.pk)
+
+        return None, None, rows, has_next
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["next_cursor"] = getattr(self, "next_cursor", None)
+        return context
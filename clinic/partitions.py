@@ -0,0 +1,158 @@
+import datetime
+import re
+
+from django.db import connection, transaction
+
+from .models import Appointment, day_bounds
+
+TABLE = Appointment._meta.db_table
+
+# Сюда попадают записи, для месяца которых секции ещё нет.
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+# Схема, куда переезжают отсоединённые секции старых месяцев.
+ARCHIVE_SCHEMA = "clinic_archive"
+
+# Сколько месяцев вперёд держать готовые секции.
+AHEAD_MONTHS = 3
+
+# DDL ждёт блокировку не дольше этого, а не копит очередь за собой.
+LOCK_TIMEOUT = "5s"
+
+MONTH_SUFFIX = re.compile(r"_y(\d{4})m(\d{2})$")
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(month, count):
+    year, index = divmod(month.year * 12 + month.month - 1 + count, 12)
+    return datetime.date(year, index + 1, 1)
+
+
+def month_range(first, last):
+    month = month_start(first)
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_y{month.year}m{month.month:02d}"
+
+
+def month_bounds(month):
+    """Границы секции — полночь по времени клиники, как у between_days.
+
+    Поэтому записи одного дня всегда лежат в одной секции.
+    """
+    return day_bounds(month, add_months(month, 1) - datetime.timedelta(days=1))
+
+
+def monthly_partitions():
+    """{первое число месяца: имя секции} для присоединённых помесячных секций."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT inhrelid::regclass::text FROM pg_inherits "
+            "WHERE inhparent = %s::regclass",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = MONTH_SUFFIX.search(name)
+        if match:
+            partitions[datetime.date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def _columns():
+    return ", ".join(
+        connection.ops.quote_name(field.column)
+        for field in Appointment._meta.concrete_fields
+    )
+
+
+def create_partition(month):
+    """Создаёт секцию месяца и переносит в неё записи из секции по умолчанию.
+
+    Таблица создаётся отдельно и присоединяется ATTACH: так родитель
+    блокируется в SHARE UPDATE EXCLUSIVE, и чтение и запись в другие
+    месяцы идут дальше. Секцию по умолчанию ATTACH проверяет целиком,
+    пока она в ACCESS EXCLUSIVE. Возвращает число перенесённых записей.
+    """
+    name = partition_name(month)
+    start, end = month_bounds(month)
+    columns = _columns()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE})")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            f"WHERE date_time >= %s AND date_time < %s RETURNING {columns}) "
+            f"INSERT INTO {name} ({columns}) SELECT {columns} FROM moved",
+            [start, end],
+        )
+        moved = cursor.rowcount
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+            "FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+    return moved
+
+
+def ensure_partitions(first_month, last_month):
+    """Недостающие секции с first_month по last_month: [(имя, перенесено)].
+
+    Создаются от новых месяцев к старым, чтобы ближайшие записи раньше
+    ушли из секции по умолчанию.
+    """
+    existing = monthly_partitions()
+    created = []
+    for month in reversed(list(month_range(first_month, last_month))):
+        if month not in existing:
+            created.append((partition_name(month), create_partition(month)))
+    return created
+
+
+def archive_partition(name):
+    """Отсоединяет секцию и переносит её в ARCHIVE_SCHEMA.
+
+    DETACH без CONCURRENTLY (его не бывает при секции по умолчанию) берёт
+    ACCESS EXCLUSIVE на родителя, но меняет только каталог. Внешние ключи
+    архива снимаются, чтобы он не мешал удалять пациентов и врачей.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+        cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+        cursor.execute(
+            "SELECT conname FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [name],
+        )
+        for (constraint,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"')
+        cursor.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+    return f"{ARCHIVE_SCHEMA}.{name}"
+
+
+def archive_partitions(before_month):
+    """Архивирует секции месяцев раньше before_month, возвращает их имена."""
+    return [
+        archive_partition(name)
+        for month, name in sorted(monthly_partitions().items())
+        if month < before_month
+    ]
+
+
+def default_partition_range():
+    """(первая, последняя) дата записей в секции по умолчанию или None."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT min(date_time), max(date_time) FROM {DEFAULT_PARTITION}"
+        )
+        first, last = cursor.fetchone()
+    return (first, last) if first else None
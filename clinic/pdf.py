@@ -0,0 +1,300 @@
+import collections
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import weasyprint
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Count, Exists, Max, OuterRef, Prefetch
+from django.template.loader import render_to_string
+from django.utils.text import get_valid_filename
+
+from . import metrics
+from .streaming import ZipStream
+
+logger = logging.getLogger(__name__)
+
+# Увеличить при изменении шаблона карты, чтобы старые PDF не отдавались.
+CARD_LAYOUT_VERSION = 1
+
+CARD_TEMPLATE = "clinic/patient_pdf.html"
+
+CARDS_DIR = "patient_cards"
+
+# Сколько секунд после неудачной вёрстки карта не ставится в очередь снова.
+CARD_FAILURE_TIMEOUT = 60
+
+_executor = None
+_pending = {}
+_failed = {}
+_lock = threading.Lock()
+_export_slots = threading.BoundedSemaphore(settings.PDF_EXPORT_CONCURRENCY)
+
+
+def card_version(patient):
+    """Ключ карты, который меняется при любом изменении пациента или истории.
+
+    Удалённая запись уменьшает count, изменённая сдвигает max(updated_at);
+    правка владельца сдвигает его updated_at.
+    """
+    history = patient.history.aggregate(count=Count("pk"), updated=Max("updated_at"))
+    state = (
+        f"{CARD_LAYOUT_VERSION}:{patient.pk}:{patient.updated_at.isoformat()}:"
+        f"{patient.owner.updated_at.isoformat()}:"
+        f"{history['count']}:{history['updated']}"
+    )
+    return hashlib.sha256(state.encode()).hexdigest()[:32]
+
+
+def card_path(version):
+    return f"{CARDS_DIR}/{version}.pdf"
+
+
+def render_card_html(patient, history=None):
+    if history is None:
+        history = patient.history.select_related("doctor").order_by("-date_time")
+    return render_to_string(CARD_TEMPLATE, {"patient": patient, "history": history})
+
+
+def write_pdf(html):
+    """Вёрстка PDF. Выполняется в дочернем процессе пула."""
+    return weasyprint.HTML(string=html).write_pdf()
+
+
+def render_pdf(html):
+    """Как write_pdf, но дополнительно возвращает число страниц."""
+    document = weasyprint.HTML(string=html).render()
+    return document.write_pdf(), len(document.pages)
+
+
+def spawn_executor(workers):
+    # spawn: воркеры не наследуют соединения с базой и потоки сервера.
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = spawn_executor(settings.PDF_RENDER_WORKERS)
+    return _executor
+
+
+def _reset_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def render_card_in_background(patient, version):
+    """Ставит карту в очередь пула процессов, если она ещё не рисуется."""
+    with _lock:
+        future = _pending.get(version)
+    if future is not None:
+        return future
+    # Запросы к базе и шаблон — без блокировки, чтобы не ждать чужие карты.
+    # Два запроса одной версии могут сверстать HTML оба, в очередь попадёт один.
+    html = render_card_html(patient)
+    with _lock:
+        future = _pending.get(version)
+        if future is not None:
+            return future
+        try:
+            future = get_executor().submit(write_pdf, html)
+        except BrokenProcessPool:
+            # Воркер погиб (OOM, падение), и пул больше не принимает задач.
+            _reset_executor()
+            future = get_executor().submit(write_pdf, html)
+        _pending[version] = future
+    # Вне блокировки: у уже выполненной задачи колбэк вызывается сразу.
+    future.add_done_callback(lambda f: _store_card(version, f))
+    return future
+
+
+def _store_card(version, future):
+    failed = False
+    try:
+        error = future.exception()
+        if error is not None:
+            failed = True
+            logger.error("Не удалось сверстать карту %s", version, exc_info=error)
+            metrics.inc("clinic_pdf_failures_total", source="card")
+            return
+        path = card_path(version)
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(future.result()))
+            metrics.inc("clinic_pdf_renders_total", source="card")
+    except Exception:
+        failed = True
+        logger.exception("Не удалось сохранить карту %s", version)
+    finally:
+        with _lock:
+            _pending.pop(version, None)
+            if failed:
+                now = time.monotonic()
+                # Заодно забываем старые неудачи, чтобы словарь не рос.
+                for key, failed_at in list(_failed.items()):
+                    if now - failed_at >= CARD_FAILURE_TIMEOUT:
+                        del _failed[key]
+                _failed[version] = now
+
+
+def card_failed(version):
+    """Вёрстка этой версии карты недавно упала, и повторять её пока рано."""
+    with _lock:
+        failed_at = _failed.get(version)
+        if failed_at is None:
+            return False
+        if time.monotonic() - failed_at < CARD_FAILURE_TIMEOUT:
+            return True
+        del _failed[version]
+        return False
+
+
+def export_queryset(doctor=None, species=None, start=None, end=None):
+    """Пациенты для пакетной выгрузки вместе с историей.
+
+    Фильтр по врачу и датам оставляет пациентов, у которых был приём
+    у этого врача в этот период. История в карте при этом полная.
+    """
+    from .models import Appointment, Patient
+
+    patients = (
+        Patient.objects.select_related("owner")
+        .order_by("pk")
+        .prefetch_related(
+            Prefetch(
+                "history",
+                queryset=Appointment.objects.select_related("doctor").order_by(
+                    "-date_time"
+                ),
+            )
+        )
+    )
+    if species:
+        patients = patients.filter(species=species)
+    if doctor or start:
+        visits = Appointment.objects.filter(patient=OuterRef("pk"))
+        if doctor:
+            visits = visits.filter(doctor=doctor)
+        if start:
+            visits = visits.between_days(start, end)
+        patients = patients.filter(Exists(visits))
+    return patients
+
+
+def card_filename(patient):
+    return get_valid_filename(f"{patient.pk}_{patient.name}.pdf")
+
+
+def export_cards(patients, workers=None, chunk_size=200):
+    """Рендерит карты в пуле процессов, отдаёт (пациент, pdf, страниц) по порядку.
+
+    В работе одновременно не больше двух карт на процесс, поэтому память
+    не растёт вместе с выборкой. История подгружается пачками по chunk_size.
+    """
+    workers = workers or settings.PDF_EXPORT_WORKERS or os.cpu_count()
+    window = workers * 2
+    in_flight = collections.deque()
+    executor = spawn_executor(workers)
+    try:
+        for patient in patients.iterator(chunk_size=chunk_size):
+            html = render_card_html(patient, patient.history.all())
+            in_flight.append((patient, executor.submit(render_pdf, html)))
+            if len(in_flight) >= window:
+                yield _export_result(*in_flight.popleft())
+        while in_flight:
+            yield _export_result(*in_flight.popleft())
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _export_result(patient, future):
+    data, pages = future.result()
+    metrics.inc("clinic_pdf_renders_total", source="export")
+    metrics.inc("clinic_pdf_pages_total", pages)
+    return patient, data, pages
+
+
+class HeldExport:
+    """ZIP карт для потокового ответа, который держит место в _export_slots.
+
+    close() возвращает место. Под WSGI его зовёт Django, закрывая ответ,
+    под ASGI — streaming.aiterate в finally, в том числе при обрыве клиента.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.held = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.chunks)
+
+    def close(self):
+        try:
+            self.chunks.close()
+        finally:
+            if self.held:
+                self.held = False
+                _export_slots.release()
+
+
+def try_export_cards_zip(patients):
+    """ZIP карт для сайта или None, если процесс уже выгружает сколько может.
+
+    Каждой выгрузке свой небольшой пул: PDF_EXPORT_VIEW_WORKERS процессов,
+    а не по числу ядер, как в команде export_patient_cards.
+    """
+    if not _export_slots.acquire(blocking=False):
+        return None
+    try:
+        cards = export_cards(patients, workers=settings.PDF_EXPORT_VIEW_WORKERS)
+        return HeldExport(stream_cards_zip(cards))
+    except BaseException:
+        _export_slots.release()
+        raise
+
+
+def stream_cards_zip(cards, stats=None):
+    """Упаковывает карты в ZIP и отдаёт архив кусками по одной карте.
+
+    В stats (если передан) пишутся число карт, страниц и время работы.
+    """
+    stats = stats if stats is not None else {}
+    stats.update(cards=0, pages=0, seconds=0.0)
+    started = time.perf_counter()
+
+    stream = ZipStream()
+    # PDF уже сжат внутри, поэтому без повторного сжатия.
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as archive:
+        for patient, data, pages in cards:
+            archive.writestr(card_filename(patient), data)
+            stats["cards"] += 1
+            stats["pages"] += pages
+            yield stream.pop()
+    yield stream.pop()
+
+    stats["seconds"] = time.perf_counter() - started
+    logger.info(
+        "Выгружено карт: %d, страниц: %d, %.1f стр/с",
+        stats["cards"],
+        stats["pages"],
+        pages_per_second(stats),
+    )
+
+
+def pages_per_second(stats):
+    return stats["pages"] / stats["seconds"] if stats["seconds"] else 0.0
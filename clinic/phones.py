@@ -0,0 +1,25 @@
+import re
+
+from django.core.exceptions import ValidationError
+
+
+def phone_digits(value):
+    """Ключ номера: только цифры, российская 8 в начале заменяется на 7.
+
+    "+7 (999) 123-45-67" и "8 999 123 45 67" дают одно и то же "79991234567",
+    поэтому по этому ключу ищутся и склеиваются пациенты.
+    """
+    digits = re.sub(r"\D", "", value or "")
+    if len(digits) == 11 and digits.startswith("8"):
+        digits = "7" + digits[1:]
+    return digits
+
+
+def clean_phone(value):
+    """Номер из формы в виде "+79991234567" или ValidationError."""
+    digits = phone_digits(value)
+    if len(digits) != 11:
+        raise ValidationError("Номер телефона должен содержать 11 цифр")
+    if not digits.startswith("7"):
+        raise ValidationError("Номер должен начинаться с +7 или 8")
+    return f"+{digits}"
@@ -0,0 +1,158 @@
+import csv
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from .models import Appointment, day_bounds
+from .streaming import Echo, ZipStream
+
+# Сколько строк забирать с серверного курсора за раз.
+REPORT_CHUNK_SIZE = 2000
+
+# Сколько строк копить перед отправкой очередного куска ответа.
+REPORT_FLUSH_ROWS = 500
+
+REPORT_COLUMNS = [
+    ("ID", "pk"),
+    ("Дата и время", "date_time"),
+    ("Статус", "status"),
+    ("Врач", "doctor__full_name"),
+    ("Специализация", "doctor__specialization"),
+    ("Пациент", "patient__name"),
+    ("Вид", "patient__species"),
+    ("Владелец", "patient__owner__name"),
+    ("Телефон", "patient__owner__phone"),
+    ("Жалоба", "complaint"),
+    ("Диагноз", "diagnosis"),
+    ("Назначения", "prescription"),
+]
+
+STATUS_LABELS = dict(Appointment.STATUS_CHOICES)
+
+
+def report_queryset(start=None, end=None, status="", doctor=None):
+    """Записи для отчёта, уже соединённые с врачом и пациентом.
+
+    Период задаётся датами включительно, по местному времени клиники.
+    """
+    appointments = Appointment.objects.order_by("date_time", "pk")
+    if start and end:
+        appointments = appointments.between_days(start, end)
+    elif start:
+        appointments = appointments.filter(date_time__gte=day_bounds(start, start)[0])
+    elif end:
+        appointments = appointments.filter(date_time__lt=day_bounds(end, end)[1])
+    if status:
+        appointments = appointments.filter(status=status)
+    if doctor:
+        appointments = appointments.filter(doctor=doctor)
+    return appointments.values_list(*(field for _, field in REPORT_COLUMNS))
+
+
+def report_rows(queryset, chunk_size=REPORT_CHUNK_SIZE):
+    """Строки отчёта с серверного курсора, без загрузки всей выборки в память."""
+    for pk, date_time, status, *rest in queryset.iterator(chunk_size=chunk_size):
+        yield [
+            pk,
+            timezone.localtime(date_time).strftime("%d.%m.%Y %H:%M"),
+            STATUS_LABELS.get(status, status),
+            *rest,
+        ]
+
+
+def stream_csv(rows):
+    """CSV в UTF-8 с BOM, чтобы Excel сразу узнал кодировку."""
+    writer = csv.writer(Echo())
+    # Заголовок уходит клиенту до первого запроса к базе.
+    yield ("\ufeff" + writer.writerow([title for title, _ in REPORT_COLUMNS])).encode()
+
+    lines = []
+    for row in rows:
+        lines.append(writer.writerow(row))
+        if len(lines) >= REPORT_FLUSH_ROWS:
+            yield "".join(lines).encode()
+            lines.clear()
+    if lines:
+        yield "".join(lines).encode()
+
+
+_XLSX_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>"""
+
+_XLSX_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+_XLSX_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Записи" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+_XLSX_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>"""
+
+_XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    "<sheetData>"
+)
+
+_XLSX_SHEET_END = "</sheetData></worksheet>"
+
+# Управляющие символы недопустимы в XML, Excel откажется открывать файл.
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _xlsx_cell(value):
+    if isinstance(value, int):
+        return f'<c t="n"><v>{value}</v></c>'
+    text = escape(_XML_INVALID.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return "<row>" + "".join(_xlsx_cell(value) for value in values) + "</row>"
+
+
+def stream_xlsx(rows):
+    """XLSX с одним листом, который пишется построчно прямо в ZIP-поток.
+
+    Строки хранятся inline, без общей таблицы строк, поэтому в памяти
+    держится только текущий кусок листа.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _XLSX_CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _XLSX_RELS)
+        archive.writestr("xl/workbook.xml", _XLSX_WORKBOOK)
+        archive.writestr("xl/_rels/workbook.xml.rels", _XLSX_WORKBOOK_RELS)
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(_XLSX_SHEET_START.encode())
+            sheet.write(_xlsx_row(title for title, _ in REPORT_COLUMNS).encode())
+            yield stream.pop()
+
+            for count, row in enumerate(rows, 1):
+                sheet.write(_xlsx_row(row).encode())
+                if count % REPORT_FLUSH_ROWS == 0:
+                    yield stream.pop()
+            sheet.write(_XLSX_SHEET_END.encode())
+    yield stream.pop()
+
+
+REPORT_FORMATS = {
+    "csv": (stream_csv, "text/csv; charset=utf-8"),
+    "xlsx": (
+        stream_xlsx,
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ),
+}
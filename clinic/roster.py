@@ -0,0 +1,62 @@
+import threading
+
+from django.core.cache import cache
+
+from . import metrics
+from .models import Doctor
+from .versions import bump_version, get_version
+
+# Страховка на случай, если сигнал не дошёл до другого процесса
+# (например, при локальном кэше у каждого воркера свой).
+ROSTER_TIMEOUT = 60 * 5
+
+ROSTER_VERSION_KEY = "clinic:doctor-roster:version"
+
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+    metrics.inc(
+        "clinic_doctor_roster_cache_total", result="hit" if name == "hits" else "miss"
+    )
+
+
+def roster_stats():
+    """Попадания и промахи кэша списка врачей в этом процессе."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def roster_version():
+    return get_version(ROSTER_VERSION_KEY)
+
+
+def doctor_roster():
+    """Список врачей для меню персонала: [{"id", "full_name", "specialization"}]."""
+    key = f"clinic:doctor-roster:{roster_version()}"
+    roster = cache.get(key)
+    if roster is not None:
+        _count("hits")
+        return roster
+
+    _count("misses")
+    roster = list(
+        Doctor.objects.order_by("pk").values("id", "full_name", "specialization")
+    )
+    cache.set(key, roster, ROSTER_TIMEOUT)
+    return roster
+
+
+def roster_doctor(doctor_id):
+    """Врач из закэшированного списка или None."""
+    for doctor in doctor_roster():
+        if doctor["id"] == doctor_id:
+            return doctor
+    return None
+
+
+def invalidate_roster():
+    bump_version(ROSTER_VERSION_KEY)
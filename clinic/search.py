@@ -0,0 +1,55 @@
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import Q
+from django.db.models.functions import Greatest
+
+from .models import Owner, Patient
+from .phones import phone_digits
+
+SEARCH_LIMIT = 100
+
+# Ранжируются только первые найденные строки, иначе частое слово
+# ("Барсик") заставляет считать похожесть для огромной доли таблицы.
+SEARCH_CANDIDATES = 1000
+
+MIN_PHONE_DIGITS = 3
+
+FULL_PHONE_DIGITS = 11
+
+
+def search_patients(query, queryset=None):
+    """Поиск пациентов по кличке, ФИО владельца и телефону.
+
+    Подстроки ищутся через триграммные GIN-индексы, результаты сортируются
+    по похожести и ограничены SEARCH_LIMIT.
+    """
+    if queryset is None:
+        queryset = Patient.objects.all()
+
+    query = query.strip()
+    owners = Q(name__icontains=query)
+    digits = phone_digits(query)
+    if len(digits) == FULL_PHONE_DIGITS:
+        # Полный номер — одна проба уникального индекса owner_unique_phone.
+        owners |= Q(phone_digits=digits)
+    elif len(digits) >= MIN_PHONE_DIGITS:
+        owners |= Q(phone_digits__contains=digits)
+
+    # Владельцы ищутся в своей небольшой таблице, питомцы — по индексу
+    # patient_owner_name_idx; OR через JOIN не попал бы ни в один индекс.
+    owner_ids = Owner.objects.filter(owners).values("pk")[:SEARCH_CANDIDATES]
+    candidates = (
+        queryset.filter(name__icontains=query)
+        .order_by()
+        .values("pk")
+        .union(queryset.filter(owner__in=owner_ids).order_by().values("pk"))
+    )[:SEARCH_CANDIDATES]
+    return (
+        queryset.filter(pk__in=candidates)
+        .annotate(
+            rank=Greatest(
+                TrigramWordSimilarity(query, "name"),
+                TrigramWordSimilarity(query, "owner__name"),
+            )
+        )
+        .order_by("-rank", "name", "pk")[:SEARCH_LIMIT]
+    )
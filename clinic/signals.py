@@ -0,0 +1,60 @@
+import datetime
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .history import bump_patient_version
+from .live import publish_appointment
+from .models import Appointment, Doctor, Patient
+from .roster import invalidate_roster
+from .slots import invalidate_busy_slots
+from .stats import appointment_days, schedule_refresh
+
+
+def _slots(instance):
+    """Слот записи сейчас и на момент загрузки из базы."""
+    slots = {(instance.doctor_id, instance.date_time)}
+    loaded = getattr(instance, "_loaded_values", {})
+    if isinstance(loaded.get("date_time"), datetime.datetime):
+        slots.add((loaded.get("doctor_id", instance.doctor_id), loaded["date_time"]))
+    return slots
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def appointment_changed(sender, instance, **kwargs):
+    for doctor_id, date_time in _slots(instance):
+        transaction.on_commit(
+            lambda d=doctor_id, t=date_time: invalidate_busy_slots(d, t)
+        )
+
+    # Запись могли перенести к другому пациенту: сбрасываем историю обоих.
+    loaded = getattr(instance, "_loaded_values", {})
+    for patient_id in {instance.patient_id, loaded.get("patient_id")} - {None}:
+        transaction.on_commit(lambda p=patient_id: bump_patient_version(p))
+
+    schedule_refresh(
+        {timezone.localdate(date_time) for _, date_time in _slots(instance)}
+    )
+
+    # Табло расписания получает одно событие на изменение записи.
+    transaction.on_commit(lambda pk=instance.pk: publish_appointment(pk))
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def patient_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda pk=instance.pk: bump_patient_version(pk))
+
+    # Статистика разбита по виду животного: смена вида меняет все дни визитов.
+    loaded = getattr(instance, "_loaded_values", {})
+    if "species" in loaded and loaded["species"] != instance.species:
+        schedule_refresh(appointment_days(instance.history.all()))
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def doctor_changed(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_roster)
@@ -0,0 +1,90 @@
+import datetime
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .constants import TIME_CHOICES
+from .models import Appointment
+from .versions import aget_versions, bump_version, bump_versions
+
+BUSY_SLOTS_TIMEOUT = 60 * 60 * 24
+
+SLOT_TIMES = [(value, datetime.time.fromisoformat(value)) for value, _ in TIME_CHOICES]
+
+
+def busy_slots_version_key(doctor_id, day):
+    return f"clinic:busy-slots:{doctor_id}:{day.isoformat()}:version"
+
+
+def busy_slots_key(doctor_id, day, version):
+    return f"clinic:busy-slots:{doctor_id}:{day.isoformat()}:{version}"
+
+
+async def abusy_slots(doctor_id, days):
+    """Занятое время врача по дням: {date: {"08:30", ...}}.
+
+    Каждый день кэшируется отдельно, а дни, которых нет в кэше, достаются
+    из базы одним запросом. Версия дня читается до запроса к базе: если
+    запись изменится, пока мы читаем, данные лягут под старую версию и
+    никому не попадутся.
+    """
+    version_keys = {busy_slots_version_key(doctor_id, day): day for day in days}
+    versions = await aget_versions(list(version_keys))
+    keys = {
+        busy_slots_key(doctor_id, day, versions[key]): day
+        for key, day in version_keys.items()
+    }
+    cached = await cache.aget_many(keys)
+    result = {keys[key]: set(times) for key, times in cached.items()}
+
+    missing = [day for day in days if day not in result]
+    if missing:
+        fetched = {day: set() for day in missing}
+        rows = (
+            Appointment.objects.filter(doctor_id=doctor_id)
+            .exclude(status="canceled")
+            .between_days(min(missing), max(missing))
+            .values_list("date_time", flat=True)
+        )
+        async for date_time in rows:
+            local = timezone.localtime(date_time)
+            if local.date() in fetched:
+                fetched[local.date()].add(local.strftime("%H:%M"))
+
+        await cache.aset_many(
+            {key: sorted(fetched[day]) for key, day in keys.items() if day in fetched},
+            BUSY_SLOTS_TIMEOUT,
+        )
+        result.update(fetched)
+
+    return result
+
+
+async def afree_slots(doctor_id, first_day, last_day):
+    """Свободные слоты из TIME_CHOICES по дням, прошедшее время не включается."""
+    days = [
+        first_day + datetime.timedelta(days=n)
+        for n in range((last_day - first_day).days + 1)
+    ]
+    busy = await abusy_slots(doctor_id, days)
+    now = timezone.localtime()
+
+    result = {}
+    for day in days:
+        result[day] = [
+            value
+            for value, time in SLOT_TIMES
+            if value not in busy[day]
+            and timezone.make_aware(datetime.datetime.combine(day, time)) > now
+        ]
+    return result
+
+
+def invalidate_busy_slots(doctor_id, date_time):
+    day = timezone.localtime(date_time).date()
+    bump_version(busy_slots_version_key(doctor_id, day))
+
+
+def invalidate_busy_days(days):
+    """Сбрасывает кэш для пар (doctor_id, день) одним обращением к кэшу."""
+    bump_versions([busy_slots_version_key(doctor_id, day) for doctor_id, day in days])
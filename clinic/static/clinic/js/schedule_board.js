@@ -0,0 +1,51 @@
+// Табло расписания (clinic/live.py): сервер присылает только изменённые
+// записи, строки заменяются на месте без перезагрузки страницы.
+document.addEventListener("DOMContentLoaded", function () {
+    const board = document.getElementById("schedule-board");
+    const body = board.querySelector("tbody");
+    const status = document.getElementById("schedule-status");
+    const source = new EventSource(board.dataset.stream);
+    let connected = false;
+    let polling = false;
+
+    source.addEventListener("open", function () {
+        // После обрыва события могли потеряться: перечитываем табло целиком.
+        if (connected) location.reload();
+        connected = true;
+        status.className = "badge bg-success";
+        status.textContent = "Онлайн";
+    });
+
+    source.addEventListener("error", function () {
+        // Под WSGI сервер закрывает ответ сам, это не обрыв.
+        if (polling) return;
+        status.className = "badge bg-danger";
+        status.textContent = "Нет связи";
+    });
+
+    source.addEventListener("poll", function (message) {
+        polling = true;
+        status.className = "badge bg-warning text-dark";
+        status.textContent = "Обновление раз в " + JSON.parse(message.data).seconds + " с";
+    });
+
+    source.addEventListener("resync", function () {
+        location.reload();
+    });
+
+    source.addEventListener("appointment", function (message) {
+        const event = JSON.parse(message.data);
+        const old = document.getElementById("appointment-" + event.id);
+        if (old) old.remove();
+        if (event.deleted || event.day !== board.dataset.day) return;
+
+        const template = document.createElement("template");
+        template.innerHTML = event.html.trim();
+        const row = template.content.firstElementChild;
+        const next = Array.from(body.rows).find(r => r.dataset.time > row.dataset.time);
+        body.insertBefore(row, next || null);
+
+        row.classList.add("table-info");
+        setTimeout(() => row.classList.remove("table-info"), 3000);
+    });
+});
@@ -0,0 +1,36 @@
+// Варианты для SearchSelect (clinic/widgets.py): сервер отдаёт только
+// выбранное значение, остальное подгружается поиском.
+document.addEventListener("DOMContentLoaded", function () {
+    document.querySelectorAll(".search-select").forEach(function (box) {
+        const input = box.querySelector("input[type=search]");
+        const select = box.querySelector("select");
+        let timer = null;
+        let controller = null;
+
+        function load() {
+            if (controller) controller.abort();
+            controller = new AbortController();
+            const params = new URLSearchParams({ q: input.value });
+            fetch(box.dataset.url + "?" + params, { signal: controller.signal })
+                .then(response => response.json())
+                .then(data => {
+                    const current = select.value;
+                    select.querySelectorAll("option").forEach(option => {
+                        if (option.value && option.value !== current) option.remove();
+                    });
+                    data.results.forEach(item => {
+                        if (String(item.id) !== current) {
+                            select.add(new Option(item.text, item.id));
+                        }
+                    });
+                })
+                .catch(() => {});
+        }
+
+        input.addEventListener("input", function () {
+            clearTimeout(timer);
+            timer = setTimeout(load, 250);
+        });
+        load();
+    });
+});
@@ -0,0 +1,151 @@
+import datetime
+import itertools
+import threading
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Appointment, AppointmentDayStats, day_bounds
+
+# Сколько дней пересчитывается в одной транзакции.
+REFRESH_CHUNK_DAYS = 100
+
+REBUILD_BATCH_SIZE = 5000
+
+# Первый ключ pg_advisory_xact_lock: блокировки дней статистики.
+STATS_LOCK_NAMESPACE = 22
+
+_pending = threading.local()
+
+
+def day_counts(appointments):
+    """Строки статистики, посчитанные прямо по записям."""
+    return (
+        appointments.order_by()
+        .annotate(day=TruncDate("date_time"))
+        .values("day", "doctor_id", "patient__species", "status")
+        .annotate(count=Count("pk"))
+    )
+
+
+def _stats_rows(counts):
+    for row in counts:
+        yield AppointmentDayStats(
+            day=row["day"],
+            doctor_id=row["doctor_id"],
+            species=row["patient__species"],
+            status=row["status"],
+            count=row["count"],
+        )
+
+
+def _day_ranges(days):
+    """Подряд идущие дни склеиваются в интервалы (первый, последний)."""
+    ranges = []
+    for day in sorted(days):
+        if ranges and day - ranges[-1][1] == datetime.timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return ranges
+
+
+def refresh_days(days):
+    """Пересчитывает статистику за days по самим записям.
+
+    Дни блокируются по возрастанию, поэтому пересчёты одного дня идут по
+    очереди, и последний видит все записи, закоммиченные до него.
+    """
+    days = sorted(set(days))
+    for i in range(0, len(days), REFRESH_CHUNK_DAYS):
+        chunk = days[i : i + REFRESH_CHUNK_DAYS]
+        q = Q()
+        for first, last in _day_ranges(chunk):
+            start, end = day_bounds(first, last)
+            q |= Q(date_time__gte=start, date_time__lt=end)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_advisory_xact_lock(%s, d) FROM unnest(%s::int[]) AS d",
+                    [STATS_LOCK_NAMESPACE, [day.toordinal() for day in chunk]],
+                )
+            AppointmentDayStats.objects.filter(day__in=chunk).delete()
+            AppointmentDayStats.objects.bulk_create(
+                _stats_rows(day_counts(Appointment.objects.filter(q)))
+            )
+
+
+def _flush_pending():
+    days = _pending.__dict__.pop("days", None)
+    if days:
+        refresh_days(days)
+
+
+def schedule_refresh(days):
+    """Пересчитать дни после коммита.
+
+    Все дни одной транзакции копятся вместе и пересчитываются первым же
+    обработчиком, остальные ничего не делают. Дни от откатившейся
+    транзакции пересчитаются с очередной — это безвредно.
+    """
+    _pending.__dict__.setdefault("days", set()).update(days)
+    transaction.on_commit(_flush_pending)
+
+
+def appointment_days(appointments):
+    return set(appointments.dates("date_time", "day"))
+
+
+def rebuild_stats(batch_size=REBUILD_BATCH_SIZE):
+    """Пересчитывает всю таблицу статистики заново, возвращает число строк."""
+    _pending.__dict__.pop("days", None)
+    table = connection.ops.quote_name(AppointmentDayStats._meta.db_table)
+    created = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Пересчёты отдельных дней ждут конца пересборки и потом
+            # досчитывают то, что закоммитили параллельно.
+            cursor.execute(f"LOCK TABLE {table} IN EXCLUSIVE MODE")
+            cursor.execute(f"DELETE FROM {table}")
+        rows = _stats_rows(day_counts(Appointment.objects.all()).iterator())
+        while batch := list(itertools.islice(rows, batch_size)):
+            AppointmentDayStats.objects.bulk_create(batch)
+            created += len(batch)
+    return created
+
+
+def clinic_stats(start, end):
+    """Сводка за период только по таблице статистики.
+
+    Неявки — прошедшие записи, которые отменили или так и не провели.
+    """
+    rows = AppointmentDayStats.objects.filter(day__range=(start, end))
+    past = Q(day__lt=timezone.localdate())
+
+    doctors = list(
+        rows.values("doctor_id")
+        .annotate(
+            total=Sum("count"),
+            planned=Sum("count", filter=Q(status="planned")),
+            completed=Sum("count", filter=Q(status="completed")),
+            canceled=Sum("count", filter=Q(status="canceled")),
+            past=Sum("count", filter=past),
+            no_show=Sum("count", filter=past & Q(status__in=["planned", "canceled"])),
+        )
+        .order_by("-total")
+    )
+    for doctor in doctors:
+        if doctor["past"]:
+            doctor["no_show_rate"] = (doctor["no_show"] or 0) / doctor["past"]
+
+    species = list(
+        rows.values("species").annotate(total=Sum("count")).order_by("-total")
+    )
+    total = sum(row["total"] for row in species)
+    for row in species:
+        row["share"] = row["total"] / total
+
+    days = list(rows.values("day").annotate(total=Sum("count")).order_by("day"))
+    return {"doctors": doctors, "species": species, "days": days, "total": total}
@@ -0,0 +1,56 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+_DONE = object()
+
+
+class Echo:
+    """Буфер для csv.writer: строка сразу возвращается, а не копится."""
+
+    def write(self, value):
+        return value
+
+
+class ZipStream:
+    """Файл только для записи: zipfile пишет в него, а мы отдаём куски дальше."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def aiterate(chunks):
+    """Синхронный поток кусков как асинхронный, для ответа под ASGI.
+
+    Синхронный итератор Django под ASGI сначала собирает в список целиком.
+    Здесь каждый кусок достаётся отдельно через sync_to_async, в том же
+    потоке, что и ORM, поэтому серверный курсор живёт в одном соединении.
+    Исходный итератор закрывается и при обрыве клиента.
+    """
+    chunks = iter(chunks)
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, _DONE)) is not _DONE:
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def streaming_body(request, chunks):
+    """Тело StreamingHttpResponse в том виде, который сервер отдаёт по кускам."""
+    if isinstance(request, ASGIRequest):
+        return aiterate(chunks)
+    return chunks
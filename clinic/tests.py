@@ -1,3 +1,1754 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+import warnings
+import zipfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, connection
+from django.test import (
+    AsyncClient,
+    Client,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import live, metrics, pdf
+from . import urls as clinic_urls
+from .constants import TIME_CHOICES
+from .db import ReadReplicaRouter, use_replica
+from .dedupe import duplicate_groups
+from .forms import AppointmentForm
+from .history import HISTORY_PAGE_SIZE, render_history
+from .models import (
+    Appointment,
+    AppointmentDayStats,
+    Doctor,
+    Notification,
+    Owner,
+    Patient,
+)
+from .notifications import NotificationDispatcher, TelegramClient
+from .pagination import EstimatedCountPaginator
+from .partitions import (
+    DEFAULT_PARTITION,
+    add_months,
+    default_partition_range,
+    month_start,
+    partition_name,
+)
+from .phones import clean_phone, phone_digits
+from .roster import doctor_roster, invalidate_roster, roster_stats
+from .search import search_patients
+from .slots import invalidate_busy_slots
+from .stats import day_counts, rebuild_stats
+from .views import DoctorDashboardView
+
+
+class TelegramStub:
+    """Локальный HTTP-сервер, который притворяется Bot API."""
+
+    def __init__(self, status=200, response=None):
+        self.status = status
+        self.response = response or {"ok": True}
+        self.requests = []
+        self.peers = set()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                body = urllib.parse.parse_qs(self.rfile.read(length).decode())
+                stub.requests.append((self.path, body))
+                stub.peers.add(self.client_address)
+
+                payload = json.dumps(stub.response).encode()
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="test-token")
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        self.doctor = Doctor.objects.create(
+            full_name="Айболит", specialization="Терапевт", telegram_id="111"
+        )
+
+    def dispatch(self, stub, **kwargs):
+        async def run():
+            client = TelegramClient(api_url=stub.url)
+            try:
+                dispatcher = NotificationDispatcher(client=client, **kwargs)
+                return await dispatcher.dispatch_batch()
+            finally:
+                await client.close()
+
+        return async_to_sync(run)()
+
+    def test_booking_enqueues_notification_without_http(self):
+        tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+        response = self.client.post(
+            reverse("home"),
+            {
+                "owner_name": "Иван Петров",
+                "owner_phone": "8 (999) 123-45-67",
+                "pet_name": "Барсик",
+                "pet_species": "Кошка",
+                "doctor": self.doctor.pk,
+                "date": tomorrow.isoformat(),
+                "time_slot": "10:30",
+                "complaint": "Не ест",
+            },
+        )
+
+        self.assertRedirects(response, reverse("home"))
+        notification = Notification.objects.get()
+        self.assertEqual(notification.chat_id, "111")
+        self.assertEqual(notification.status, "pending")
+        self.assertIn("Барсик", notification.text)
+
+    def test_dispatch_reuses_connection_and_limits_chat_rate(self):
+        Notification.objects.create(chat_id="111", text="первое")
+        Notification.objects.create(chat_id="111", text="второе")
+        Notification.objects.create(chat_id="222", text="третье")
+
+        with TelegramStub() as stub:
+            stats = self.dispatch(stub, chat_interval=60)
+
+        self.assertEqual(stats["sent"], 2)
+        self.assertEqual(stats["deferred"], 1)
+        self.assertEqual(len(stub.requests), 2)
+        # Чаты отправляются параллельно, но соединений не больше, чем чатов.
+        self.assertLessEqual(len(stub.peers), 2)
+        path, body = min(stub.requests, key=lambda request: request[1]["chat_id"])
+        self.assertEqual(path, "/bottest-token/sendMessage")
+        self.assertEqual(body, {"chat_id": ["111"], "text": ["первое"]})
+
+        deferred = Notification.objects.get(text="второе")
+        self.assertEqual(deferred.status, "pending")
+        self.assertGreater(deferred.next_attempt_at, timezone.now())
+
+    def test_dispatch_reuses_connection_within_a_chat(self):
+        for i in range(3):
+            Notification.objects.create(chat_id="111", text=f"сообщение {i}")
+
+        metrics.reset()
+        with TelegramStub() as stub:
+            stats = self.dispatch(stub, chat_interval=0)
+
+        self.assertEqual(stats["sent"], 3)
+        self.assertEqual(len(stub.peers), 1)
+        text = metrics.render_prometheus()
+        worker = metrics.worker_id()
+        self.assertIn(
+            f'clinic_notifications_total{{result="sent",worker="{worker}"}} 3', text
+        )
+        self.assertIn(f'clinic_telegram_requests_total{{worker="{worker}"}} 3', text)
+
+    def test_claimed_batch_is_hidden_from_other_workers(self):
+        Notification.objects.create(chat_id="111", text="привет")
+        dispatcher = NotificationDispatcher(client=mock.Mock())
+
+        self.assertEqual(len(dispatcher._claim_batch()), 1)
+        self.assertEqual(dispatcher._claim_batch(), [])
+
+    def test_failed_send_is_retried_with_backoff(self):
+        notification = Notification.objects.create(chat_id="111", text="привет")
+
+        with TelegramStub(
+            status=429,
+            response={"ok": False, "parameters": {"retry_after": 30}},
+        ) as stub:
+            stats = self.dispatch(stub)
+
+        self.assertEqual(stats["retried"], 1)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, "pending")
+        self.assertEqual(notification.attempts, 1)
+        self.assertIn("429", notification.last_error)
+        self.assertGreater(
+            notification.next_attempt_at,
+            timezone.now() + datetime.timedelta(seconds=20),
+        )
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=1)
+    def test_gives_up_after_max_attempts(self):
+        notification = Notification.objects.create(chat_id="111", text="привет")
+
+        with TelegramStub(status=500) as stub:
+            stats = self.dispatch(stub)
+
+        self.assertEqual(stats["failed"], 1)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, "failed")
+
+
+class TempMediaMixin:
+    @classmethod
+    def setUpClass(cls):
+        media_root = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root))
+        super().setUpClass()
+
+
+class QueryBudgetTests(TempMediaMixin, TestCase):
+    """Число SQL-запросов каждой страницы не должно зависеть от объёма данных.
+
+    Новая страница в clinic/urls.py должна получить свой лимит в QUERY_BUDGETS.
+    """
+
+    QUERY_BUDGETS = {
+        "home": 0,
+        "free_slots": 1,
+        "doctor_choices": 0,
+        "cache_stats": 0,
+        "metrics": 0,
+        "doctor_dashboard": 1,
+        "schedule_board": 1,
+        "schedule_stream": 0,
+        "clinic_stats": 3,
+        "doctor_add": 1,
+        "set_doctor": 3,
+        "patient_list": 2,
+        "patient_detail": 2,
+        "patient_edit": 1,
+        "patient_history": 0,
+        "patient_pdf": 3,
+        "patient_export": 3,
+        "appointment_edit": 1,
+        "appointment_report": 2,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctors = [
+            Doctor.objects.create(full_name=f"Врач {i}", specialization="Терапевт")
+            for i in range(3)
+        ]
+        cls.patients = [
+            Patient.objects.create(
+                name=f"Питомец {i}",
+                species="Кошка",
+                owner=Owner.objects.resolve(f"Владелец {i}", f"+7999000000{i}"),
+            )
+            for i in range(5)
+        ]
+        start = timezone.now().replace(hour=9, minute=30, second=0, microsecond=0)
+        Appointment.objects.bulk_create(
+            Appointment(
+                doctor=cls.doctors[i % 3],
+                patient=cls.patients[i % 5],
+                date_time=start + datetime.timedelta(hours=i),
+                complaint="Осмотр",
+            )
+            for i in range(30)
+        )
+        cls.appointment = Appointment.objects.first()
+
+    def setUp(self):
+        # Бюджеты считаются для прогретого кэша: список врачей в меню
+        # и сессия (cached_db) берутся из кэша бесплатно.
+        cache.clear()
+        doctor_roster()
+        session = self.client.session
+        session["doctor_id"] = self.doctors[0].pk
+        session.save()
+
+    def budget_requests(self):
+        patient = self.patients[0].pk
+        return {
+            "home": ("get", reverse("home"), None),
+            "free_slots": (
+                "get",
+                reverse("free_slots"),
+                {
+                    "doctor": self.doctors[0].pk,
+                    "start": "2030-01-01",
+                    "end": "2030-01-31",
+                },
+            ),
+            "cache_stats": ("get", reverse("cache_stats"), None),
+            "metrics": ("get", reverse("metrics"), None),
+            "doctor_choices": ("get", reverse("doctor_choices"), {"q": "врач"}),
+            "doctor_dashboard": ("get", reverse("doctor_dashboard"), None),
+            "schedule_board": ("get", reverse("schedule_board"), None),
+            "schedule_stream": ("get", reverse("schedule_stream"), None),
+            "clinic_stats": ("get", reverse("clinic_stats"), None),
+            "doctor_add": (
+                "post",
+                reverse("doctor_add"),
+                {"full_name": "Новый", "specialization": "Хирург"},
+            ),
+            "set_doctor": (
+                "get",
+                reverse("set_doctor", args=[self.doctors[1].pk]),
+                None,
+            ),
+            "patient_list": ("get", reverse("patient_list") + "?q=Питомец", None),
+            "patient_detail": ("get", reverse("patient_detail", args=[patient]), None),
+            "patient_edit": ("get", reverse("patient_edit", args=[patient]), None),
+            "patient_history": (
+                "get",
+                reverse("patient_history", args=[patient]),
+                None,
+            ),
+            "patient_pdf": ("get", reverse("patient_pdf", args=[patient]), None),
+            "patient_export": (
+                "get",
+                reverse("patient_export"),
+                {"doctor": self.doctors[0].pk},
+            ),
+            "appointment_edit": (
+                "get",
+                reverse("appointment_edit", args=[self.appointment.pk]),
+                None,
+            ),
+            "appointment_report": (
+                "get",
+                reverse("appointment_report"),
+                {"doctor": self.doctors[0].pk},
+            ),
+        }
+
+    def test_every_view_has_a_budget(self):
+        names = {pattern.name for pattern in clinic_urls.urlpatterns}
+        self.assertEqual(names - set(self.QUERY_BUDGETS), set())
+        self.assertEqual(names - set(self.budget_requests()), set())
+
+    def test_views_stay_within_query_budget(self):
+        for name, (method, url, data) in self.budget_requests().items():
+            with self.subTest(view=name):
+                with CaptureQueriesContext(connection) as queries:
+                    response = getattr(self.client, method)(url, data)
+                    # Потоковые ответы делают основную работу, пока их читают.
+                    if response.streaming:
+                        b"".join(response.streaming_content)
+                self.assertLess(response.status_code, 400)
+                self.assertLessEqual(
+                    len(queries),
+                    self.QUERY_BUDGETS[name],
+                    "\n".join(query["sql"] for query in queries),
+                )
+
+    def test_dashboard_keyset_pagination(self):
+        session = self.client.session
+        del session["doctor_id"]
+        session.save()
+        url = reverse("doctor_dashboard")
+
+        with mock.patch.object(DoctorDashboardView, "paginate_by", 20):
+            first = self.client.get(url)
+            second = self.client.get(url, {"after": first.context["next_cursor"]})
+
+        self.assertIsNone(second.context["next_cursor"])
+        seen = [a.pk for a in first.context["appointments"]]
+        seen += [a.pk for a in second.context["appointments"]]
+        expected = Appointment.objects.order_by("date_time", "pk")
+        self.assertEqual(seen, list(expected.values_list("pk", flat=True)))
+
+
+class DoctorRosterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = Doctor.objects.create(full_name="Врач", specialization="Хирург")
+
+    def test_roster_is_cached_until_doctor_changes(self):
+        before = roster_stats()
+        self.assertEqual([d["full_name"] for d in doctor_roster()], ["Врач"])
+        with self.assertNumQueries(0):
+            doctor_roster()
+        after = roster_stats()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.full_name = "Новый врач"
+            self.doctor.save()
+        self.assertEqual([d["full_name"] for d in doctor_roster()], ["Новый врач"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.delete()
+        self.assertEqual(doctor_roster(), [])
+
+    def test_switching_doctor_keeps_only_id_in_session(self):
+        doctor_roster()
+        response = self.client.get(reverse("set_doctor", args=[self.doctor.pk]))
+        self.assertRedirects(response, reverse("doctor_dashboard"))
+        self.assertEqual(dict(self.client.session), {"doctor_id": self.doctor.pk})
+        self.assertEqual(
+            self.client.get(
+                reverse("set_doctor", args=[self.doctor.pk + 1])
+            ).status_code,
+            404,
+        )
+
+        # Сессия и ФИО врача берутся из кэша; переименование видно сразу.
+        with self.captureOnCommitCallbacks(execute=True):
+            Doctor.objects.filter(pk=self.doctor.pk).update(full_name="Другой")
+            invalidate_roster()
+        doctor_roster()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("doctor_dashboard"))
+        self.assertEqual(response.wsgi_request.doctor["full_name"], "Другой")
+        self.assertContains(response, "Другой")
+
+    def test_stats_endpoint(self):
+        doctor_roster()
+        stats = self.client.get(reverse("cache_stats")).json()["doctor_roster"]
+        self.assertGreaterEqual(stats["misses"], 1)
+
+
+class SearchSelectTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctors = [
+            Doctor.objects.create(full_name=f"Врач {i}", specialization="Терапевт")
+            for i in range(30)
+        ]
+        Doctor.objects.create(full_name="Айболит", specialization="Хирург")
+
+    def test_form_renders_only_selected_doctor(self):
+        with self.assertNumQueries(0):
+            html = AppointmentForm().as_p()
+        self.assertNotIn("Врач 1", html)
+        self.assertIn(reverse("doctor_choices"), html)
+
+        form = AppointmentForm({"doctor": self.doctors[3].pk})
+        self.assertFalse(form.is_valid())
+        with self.assertNumQueries(1):
+            html = str(form["doctor"])
+        self.assertIn(f'value="{self.doctors[3].pk}" selected', html)
+        self.assertNotIn("Врач 4", html)
+
+    def test_choices_are_searched_and_limited(self):
+        url = reverse("doctor_choices")
+        results = self.client.get(url, {"q": "хирург"}).json()["results"]
+        self.assertEqual([r["text"] for r in results], ["Айболит (Хирург)"])
+
+        self.assertEqual(len(self.client.get(url).json()["results"]), 20)
+
+
+class ScheduleBoardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = Doctor.objects.create(full_name="Врач", specialization="Хирург")
+        owner = Owner.objects.resolve("Иван", "+79990000000")
+        cls.today = Appointment.objects.create(
+            doctor=cls.doctor,
+            patient=Patient.objects.create(
+                name="Сегодняшний", species="Кошка", owner=owner
+            ),
+            date_time=timezone.now().replace(hour=10, minute=30),
+        )
+        Appointment.objects.create(
+            doctor=cls.doctor,
+            patient=Patient.objects.create(
+                name="Завтрашний", species="Кошка", owner=owner
+            ),
+            date_time=cls.today.date_time + datetime.timedelta(days=1),
+        )
+
+    def test_board_shows_today(self):
+        response = self.client.get(reverse("schedule_board"))
+        self.assertContains(response, 'id="appointment-%d"' % self.today.pk)
+        self.assertContains(response, "Сегодняшний")
+        self.assertNotContains(response, "Завтрашний")
+
+    def test_change_is_published_once_with_rendered_row(self):
+        with mock.patch("clinic.live.notify") as notify:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.today.status = "completed"
+                self.today.save()
+
+        notify.assert_called_once()
+        event = notify.call_args.args[0]
+        self.assertEqual(event["id"], self.today.pk)
+        self.assertEqual(event["day"], timezone.localdate().isoformat())
+        self.assertIn("Завершен", event["html"])
+
+        with mock.patch("clinic.live.notify") as notify:
+            with self.captureOnCommitCallbacks(execute=True):
+                pk = self.today.pk
+                self.today.delete()
+        notify.assert_called_once_with(
+            {"type": "appointment", "id": pk, "deleted": True}
+        )
+
+    def test_publish_failure_does_not_break_saved_change(self):
+        with mock.patch("clinic.live.notify", side_effect=DatabaseError("down")):
+            with self.assertLogs("clinic.live", "ERROR") as logs:
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.today.status = "completed"
+                    self.today.save()
+
+        self.assertIn(str(self.today.pk), logs.output[0])
+        self.today.refresh_from_db()
+        self.assertEqual(self.today.status, "completed")
+
+    def test_stream_falls_back_to_polling_under_wsgi(self):
+        response = self.client.get(reverse("schedule_stream"))
+        self.assertFalse(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response.content.decode(), live.poll_events())
+        self.assertIn("event: poll\n", live.poll_events())
+
+        response = async_to_sync(AsyncClient().get)(reverse("schedule_stream"))
+        self.assertTrue(response.streaming)
+
+    def test_stream_fans_out_to_every_subscriber(self):
+        broker = live.ScheduleBroker(listen=False)
+        event = {"type": "appointment", "id": 1, "day": "2030-01-01", "html": "<tr>"}
+
+        async def run():
+            streams = [live.event_stream(broker), live.event_stream(broker)]
+            for stream in streams:
+                self.assertTrue((await anext(stream)).startswith("retry:"))
+            # publish зовётся из потока LISTEN, а не из цикла событий.
+            publisher = threading.Thread(target=broker.publish, args=[event])
+            publisher.start()
+            publisher.join()
+            received = [await anext(stream) for stream in streams]
+            for stream in streams:
+                await stream.aclose()
+            return received
+
+        received = async_to_sync(run)()
+        self.assertEqual(received, [live.format_event(event)] * 2)
+        self.assertIn("event: appointment\n", received[0])
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    def test_slow_subscriber_is_told_to_resync(self):
+        broker = live.ScheduleBroker(listen=False)
+
+        async def run():
+            queue = broker.subscribe()
+            for i in range(live.SUBSCRIBER_QUEUE_SIZE + 1):
+                broker.publish({"type": "appointment", "id": i})
+            await asyncio.sleep(0)
+            return [queue.get_nowait() for _ in range(queue.qsize())]
+
+        self.assertEqual(async_to_sync(run)(), [live.RESYNC])
+
+
+class ScheduleListenTests(TransactionTestCase):
+    @mock.patch.object(live, "LISTEN_POLL_SECONDS", 0.1)
+    def test_committed_change_reaches_subscriber_through_listen(self):
+        doctor = Doctor.objects.create(full_name="Врач", specialization="Хирург")
+        patient = Patient.objects.create(
+            name="Барсик",
+            species="Кошка",
+            owner=Owner.objects.resolve("Иван", "+79990000000"),
+        )
+        broker = live.ScheduleBroker()
+
+        async def next_event(queue):
+            try:
+                return await asyncio.wait_for(queue.get(), 0.5)
+            except TimeoutError:
+                return None
+
+        async def run():
+            queue = broker.subscribe()
+            # Поток LISTEN подключается не сразу: ждём, пока дойдёт пробное событие.
+            for _ in range(20):
+                await sync_to_async(live.notify)({"type": "ping"})
+                if await next_event(queue):
+                    break
+            appointment = await Appointment.objects.acreate(
+                doctor=doctor, patient=patient, date_time=timezone.now()
+            )
+            event = await next_event(queue)
+            while event and event["type"] == "ping":
+                event = await next_event(queue)
+            broker.unsubscribe(queue)
+            return appointment, event
+
+        appointment, event = async_to_sync(run)()
+        listener = broker._listener
+        if listener:
+            listener.join(timeout=5)
+        self.assertEqual(event["id"], appointment.pk)
+        self.assertIn("Барсик", event["html"])
+
+
+class ClinicStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctors = [
+            Doctor.objects.create(full_name=f"Врач {i}", specialization="Хирург")
+            for i in range(2)
+        ]
+        cls.cat = Patient.objects.create(
+            name="Барсик", species="Кошка", owner=Owner.objects.resolve("Иван", "+7999")
+        )
+        cls.dog = Patient.objects.create(
+            name="Шарик", species="Собака", owner=Owner.objects.resolve("Пётр", "+7998")
+        )
+        cls.start = timezone.now().replace(hour=10, minute=30) - datetime.timedelta(
+            days=5
+        )
+
+    def assertStatsMatchRecompute(self):
+        stored = set(
+            AppointmentDayStats.objects.filter(count__gt=0).values_list(
+                "day", "doctor_id", "species", "status", "count"
+            )
+        )
+        recomputed = {
+            (r["day"], r["doctor_id"], r["patient__species"], r["status"], r["count"])
+            for r in day_counts(Appointment.objects.all())
+        }
+        self.assertEqual(stored, recomputed)
+        return stored
+
+    def book(self, doctor, patient, days, status="planned"):
+        return Appointment.objects.create(
+            doctor=doctor,
+            patient=patient,
+            date_time=self.start + datetime.timedelta(days=days),
+            status=status,
+        )
+
+    def test_incremental_updates_match_full_recompute(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.book(self.doctors[0], self.cat, 0)
+            self.book(self.doctors[0], self.dog, 0.1, "completed")
+            moved = self.book(self.doctors[1], self.dog, 1)
+            self.book(self.doctors[1], self.cat, 2, "canceled")
+        self.assertEqual(len(self.assertStatsMatchRecompute()), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.status = "completed"
+            first.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = Appointment.objects.get(pk=moved.pk)
+            moved.doctor = self.doctors[0]
+            moved.date_time += datetime.timedelta(days=2)
+            moved.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            cat = Patient.objects.get(pk=self.cat.pk)
+            cat.species = "Кролик"
+            cat.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertStatsMatchRecompute()
+
+        AppointmentDayStats.objects.update(count=99)
+        call_command("rebuild_clinic_stats", stdout=io.StringIO())
+        self.assertEqual(len(self.assertStatsMatchRecompute()), 3)
+
+    def test_view_reads_only_summaries(self):
+        self.book(self.doctors[0], self.cat, 0, "completed")
+        self.book(self.doctors[0], self.dog, 1, "canceled")
+        self.book(self.doctors[1], self.dog, 30)
+        rebuild_stats()
+        cache.clear()
+        doctor_roster()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("clinic_stats"))
+        self.assertFalse(
+            [q["sql"] for q in queries if '"clinic_appointment"' in q["sql"]]
+        )
+        stats = response.context["stats"]
+        self.assertEqual(stats["total"], 2)
+        self.assertEqual(
+            [(row["name"], row["no_show_rate"]) for row in stats["doctors"]],
+            [("Врач 0", 0.5)],
+        )
+        self.assertEqual(
+            {row["species"]: row["share"] for row in stats["species"]},
+            {"Кошка": 0.5, "Собака": 0.5},
+        )
+
+
+class PatientHistoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = Doctor.objects.create(full_name="Врач", specialization="Хирург")
+        self.patient = Patient.objects.create(
+            name="Барсик",
+            species="Кошка",
+            owner=Owner.objects.resolve("Иван", "+79990000000"),
+        )
+        start = timezone.now() - datetime.timedelta(days=HISTORY_PAGE_SIZE + 5)
+        self.appointments = [
+            Appointment.objects.create(
+                doctor=self.doctor,
+                patient=self.patient,
+                date_time=start + datetime.timedelta(days=i),
+                complaint=f"Жалоба {i}",
+            )
+            for i in range(HISTORY_PAGE_SIZE + 5)
+        ]
+
+    def test_history_is_cached_until_appointment_changes(self):
+        self.assertIn("Жалоба 24", render_history(self.patient.pk))
+        with self.assertNumQueries(0):
+            render_history(self.patient.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointments[-1].complaint = "Хромает"
+            self.appointments[-1].save()
+        self.assertIn("Хромает", render_history(self.patient.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.full_name = "Новый врач"
+            self.doctor.save()
+        self.assertIn("Новый врач", render_history(self.patient.pk))
+
+    def test_older_visits_are_loaded_on_demand(self):
+        detail = self.client.get(reverse("patient_detail", args=[self.patient.pk]))
+        self.assertContains(detail, "Жалоба 5")
+        self.assertNotContains(detail, "Жалоба 4<")
+        more = reverse("patient_history", args=[self.patient.pk])
+        self.assertContains(detail, more + "?before=")
+
+        cursor = detail.content.decode().split(more + "?before=")[1].split('"')[0]
+        older = self.client.get(more, {"before": cursor})
+        for i in range(5):
+            self.assertContains(older, f"Жалоба {i}<")
+        self.assertNotContains(older, "Жалоба 5<")
+        self.assertNotContains(older, "?before=")
+
+
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        cache.clear()
+        Patient.objects.create(
+            name="Барсик",
+            species="Кошка",
+            owner=Owner.objects.resolve("Иван", "+79990000000"),
+        )
+
+    def test_request_timings_reach_header_and_metrics(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("patient_list"))
+        count = len(queries)
+        timing = response["Server-Timing"]
+        self.assertIn(f'desc="{count} SQL"', timing)
+        self.assertRegex(timing, r"tpl;dur=\d+\.\d")
+        self.assertIn("total;dur=", timing)
+
+        text = self.client.get(reverse("metrics")).content.decode()
+        worker = metrics.worker_id()
+        self.assertIn(
+            'clinic_request_seconds{view="patient_list",quantile="0.99",'
+            f'worker="{worker}"}}',
+            text,
+        )
+        self.assertIn(
+            "clinic_request_db_queries_total"
+            f'{{view="patient_list",worker="{worker}"}} {count}',
+            text,
+        )
+        self.assertIn("clinic_doctor_roster_cache_total{result=", text)
+
+    def test_metrics_include_other_workers_from_cache(self):
+        other = {
+            "counters": {("clinic_pdf_renders_total", (("source", "card"),)): 2.0},
+            "views": {
+                "patient_list": (
+                    [0.5],
+                    dict(count=1, seconds=0.5, queries=3, db=0.1, template=0, http=0),
+                )
+            },
+        }
+        cache.set("clinic:metrics:other:1", other)
+        cache.set(metrics.WORKERS_KEY, {"other:1", "gone:2"})
+        self.client.get(reverse("patient_list"))
+
+        text = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn(
+            'clinic_pdf_renders_total{source="card",worker="other:1"} 2', text
+        )
+        self.assertIn(
+            'clinic_request_seconds_count{view="patient_list",worker="other:1"} 1',
+            text,
+        )
+        self.assertIn(f'view="patient_list",worker="{metrics.worker_id()}"', text)
+        # Снимок gone:2 истёк — воркер выпадает из реестра.
+        self.assertEqual(
+            cache.get(metrics.WORKERS_KEY), {"other:1", metrics.worker_id()}
+        )
+
+    @override_settings(PERF_SLOW_REQUEST_SECONDS=0, PERF_SLOW_LOG_SAMPLE_RATE=1)
+    def test_slow_request_is_logged_with_worst_sql(self):
+        with self.assertLogs("clinic.performance", "WARNING") as logs:
+            self.client.get(reverse("patient_list"))
+        self.assertIn("patient_list", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+    @override_settings(PERF_SLOW_REQUEST_SECONDS=0, PERF_SLOW_LOG_SAMPLE_RATE=0)
+    def test_slow_log_is_sampled(self):
+        with self.assertNoLogs("clinic.performance", "WARNING"):
+            self.client.get(reverse("patient_list"))
+
+
+class ReadReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = ReadReplicaRouter()
+
+    def test_reads_go_to_replica_only_inside_use_replica(self):
+        replica = {"replica": settings.DATABASES["default"]}
+        with mock.patch.dict(settings.DATABASES, replica):
+            self.assertIsNone(self.router.db_for_read(Patient))
+            with use_replica():
+                self.assertEqual(self.router.db_for_read(Patient), "replica")
+                self.assertEqual(self.router.db_for_write(Patient), "default")
+        with use_replica():
+            self.assertIsNone(self.router.db_for_read(Patient))
+
+    def test_read_only_view_is_rendered_on_replica_until_a_write(self):
+        patient = Patient.objects.create(
+            name="Барсик",
+            species="Кошка",
+            owner=Owner.objects.resolve("Иван", "+79990000000"),
+        )
+        seen = []
+        real = ReadReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            seen.append(real(router, model, **hints))
+            return None
+
+        replica = {"replica": settings.DATABASES["default"]}
+        with mock.patch.dict(settings.DATABASES, replica), mock.patch.object(
+            ReadReplicaRouter, "db_for_read", spy
+        ):
+            self.client.get(reverse("patient_detail", args=[patient.pk]))
+            self.assertIn("replica", seen)
+
+            self.client.post(
+                reverse("patient_edit", args=[patient.pk]),
+                {
+                    "name": "Барсик",
+                    "species": "Кошка",
+                    "owner_name": "Иван",
+                    "owner_phone": "+7 (999) 000-00-00",
+                },
+            )
+            seen.clear()
+            self.client.get(reverse("patient_detail", args=[patient.pk]))
+            self.assertNotIn("replica", seen)
+
+
+class AppointmentQuerySetTests(TestCase):
+    def test_on_day_is_half_open(self):
+        doctor = Doctor.objects.create(full_name="Врач", specialization="Терапевт")
+        patient = Patient.objects.create(
+            name="Шарик", species="Собака", owner=Owner.objects.resolve("Иван", "+7999")
+        )
+        day = datetime.date(2030, 5, 10)
+        midnight = datetime.datetime.combine(
+            day, datetime.time.min, tzinfo=timezone.get_current_timezone()
+        )
+        one_day = datetime.timedelta(days=1)
+        second = datetime.timedelta(seconds=1)
+        for date_time in (midnight - second, midnight, midnight + one_day - second):
+            Appointment.objects.create(
+                doctor=doctor, patient=patient, date_time=date_time
+            )
+        Appointment.objects.create(
+            doctor=doctor, patient=patient, date_time=midnight + one_day
+        )
+
+        times = Appointment.objects.on_day(day).values_list("date_time", flat=True)
+        self.assertEqual(sorted(times), [midnight, midnight + one_day - second])
+
+
+class AppointmentPartitionTests(TestCase):
+    def setUp(self):
+        doctor = Doctor.objects.create(full_name="Врач", specialization="Терапевт")
+        patient = Patient.objects.create(
+            name="Шарик", species="Собака", owner=Owner.objects.resolve("Иван", "+7999")
+        )
+        self.month = add_months(month_start(timezone.localdate()), -2)
+        self.day = self.month.replace(day=15)
+        self.appointment = Appointment.objects.create(
+            doctor=doctor,
+            patient=patient,
+            date_time=timezone.make_aware(
+                datetime.datetime.combine(self.day, datetime.time(10, 30))
+            ),
+        )
+
+    def partition_of(self, appointment):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tableoid::regclass::text FROM clinic_appointment WHERE id = %s",
+                [appointment.pk],
+            )
+            return cursor.fetchone()[0]
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command("partition_appointments", *args, stdout=out)
+        return out.getvalue()
+
+    def test_rows_move_out_of_default_and_queries_are_pruned(self):
+        self.assertEqual(self.partition_of(self.appointment), DEFAULT_PARTITION)
+        output = self.run_command()
+        self.assertIn(f"с {self.day} по {self.day}", output)
+
+        output = self.run_command(f"--from={self.month:%Y-%m}")
+        name = partition_name(self.month)
+        self.assertIn(f"Секция {name}: перенесено записей 1", output)
+        self.assertNotIn("В секции по умолчанию", output)
+        self.assertEqual(self.partition_of(self.appointment), name)
+
+        plan = Appointment.objects.on_day(self.day).explain()
+        self.assertIn(name, plan)
+        self.assertNotIn(DEFAULT_PARTITION, plan)
+        self.assertNotIn(partition_name(add_months(self.month, 1)), plan)
+
+        # Перенос даты в другой месяц переносит и строку.
+        self.appointment.date_time += datetime.timedelta(days=31)
+        self.appointment.save()
+        self.assertEqual(
+            self.partition_of(self.appointment),
+            partition_name(add_months(self.month, 1)),
+        )
+
+    def test_old_partitions_are_archived(self):
+        self.run_command(f"--from={self.month:%Y-%m}")
+        # Тест идёт в одной транзакции: отложенные проверки внешних ключей
+        # не дали бы снять сами ключи.
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        output = self.run_command("--keep-months=1")
+        self.assertIn(f"В архиве: clinic_archive.{partition_name(self.month)}", output)
+        self.assertFalse(Appointment.objects.exists())
+        # Архив не держит пациента.
+        self.appointment.patient.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*) FROM clinic_archive.{partition_name(self.month)}"
+            )
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    THREADS = 10
+
+    def test_only_one_booking_wins_a_slot(self):
+        doctor = Doctor.objects.create(full_name="Врач", specialization="Хирург")
+        day = timezone.localdate() + datetime.timedelta(days=3)
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def book(i):
+            try:
+                barrier.wait()
+                response = Client().post(
+                    reverse("home"),
+                    {
+                        "owner_name": f"Клиент {i}",
+                        "owner_phone": f"+7 (999) 000-00-{i:02d}",
+                        "pet_name": f"Кот {i}",
+                        "pet_species": "Кошка",
+                        "doctor": doctor.pk,
+                        "date": day.isoformat(),
+                        "time_slot": "12:30",
+                    },
+                )
+                results.append(response)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=book, args=(i,)) for i in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), self.THREADS)
+        winners = [r for r in results if r.status_code == 302]
+        losers = [r for r in results if r.status_code == 200]
+        self.assertEqual(len(winners), 1)
+        self.assertEqual(len(losers), self.THREADS - 1)
+        for response in losers:
+            self.assertEqual(
+                response.context["form"].errors["time_slot"],
+                [AppointmentForm.SLOT_TAKEN_ERROR],
+            )
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(Patient.objects.count(), 1)
+
+    def test_canceled_appointment_frees_the_slot(self):
+        doctor = Doctor.objects.create(full_name="Врач", specialization="Хирург")
+        patient = Patient.objects.create(
+            name="Шарик", species="Собака", owner=Owner.objects.resolve("Иван", "+7999")
+        )
+        date_time = timezone.now() + datetime.timedelta(days=1)
+        Appointment.objects.create(
+            doctor=doctor, patient=patient, date_time=date_time, status="canceled"
+        )
+        Appointment.objects.create(doctor=doctor, patient=patient, date_time=date_time)
+
+        with self.assertRaises(IntegrityError):
+            Appointment.objects.create(
+                doctor=doctor, patient=patient, date_time=date_time
+            )
+
+
+class FreeSlotsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = Doctor.objects.create(full_name="Врач", specialization="Хирург")
+        self.patient = Patient.objects.create(
+            name="Шарик", species="Собака", owner=Owner.objects.resolve("Иван", "+7999")
+        )
+        self.day = timezone.localdate() + datetime.timedelta(days=2)
+
+    def book(self, time_str, **kwargs):
+        return Appointment.objects.create(
+            doctor=self.doctor,
+            patient=self.patient,
+            date_time=timezone.make_aware(
+                datetime.datetime.combine(
+                    self.day, datetime.time.fromisoformat(time_str)
+                )
+            ),
+            **kwargs,
+        )
+
+    def get_slots(self):
+        response = self.client.get(
+            reverse("free_slots"),
+            {"doctor": self.doctor.pk, "start": self.day.isoformat()},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["slots"][self.day.isoformat()]
+
+    def test_booked_and_canceled_slots(self):
+        self.book("08:30")
+        self.book("09:30", status="canceled")
+
+        slots = self.get_slots()
+        self.assertNotIn("08:30", slots)
+        self.assertIn("09:30", slots)
+        self.assertEqual(len(slots), len(TIME_CHOICES) - 1)
+
+    def test_cache_is_invalidated_on_save_and_delete(self):
+        self.get_slots()
+        with self.assertNumQueries(0):
+            self.get_slots()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = self.book("10:30")
+        self.assertNotIn("10:30", self.get_slots())
+
+        appointment = Appointment.objects.get(pk=appointment.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.date_time += datetime.timedelta(days=1)
+            appointment.save()
+        self.assertIn("10:30", self.get_slots())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book("11:30").delete()
+        self.assertIn("11:30", self.get_slots())
+
+    def test_fill_racing_with_a_booking_is_not_served(self):
+        aset_many = cache.aset_many
+
+        async def booking_commits_first(*args, **kwargs):
+            # Запись коммитится между чтением базы и записью в кэш.
+            appointment = await sync_to_async(self.book)("12:30")
+            await sync_to_async(invalidate_busy_slots)(
+                self.doctor.pk, appointment.date_time
+            )
+            await aset_many(*args, **kwargs)
+
+        with mock.patch.object(cache, "aset_many", booking_commits_first):
+            self.assertIn("12:30", self.get_slots())
+        self.assertNotIn("12:30", self.get_slots())
+
+    def test_rejects_too_long_range(self):
+        response = self.client.get(
+            reverse("free_slots"),
+            {"doctor": self.doctor.pk, "start": "2030-01-01", "end": "2030-03-01"},
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class PatientSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name, owner, phone in [
+            ("Барсик", "Иван Петров", "+7 (999) 123-45-67"),
+            ("Мурка", "Мария Барсукова", "+7 (912) 000-11-22"),
+            ("Шарик", "Олег Смирнов", "+7 (921) 555-66-77"),
+        ]:
+            Patient.objects.create(
+                name=name, species="Кошка", owner=Owner.objects.resolve(owner, phone)
+            )
+
+    def names(self, query):
+        return [patient.name for patient in search_patients(query)]
+
+    def test_phone_is_matched_by_digits(self):
+        self.assertEqual(
+            Patient.objects.get(name="Барсик").owner.phone_digits, "79991234567"
+        )
+        self.assertEqual(self.names("123-45"), ["Барсик"])
+        self.assertEqual(self.names("912 000"), ["Мурка"])
+
+    def test_results_are_ranked_and_case_insensitive(self):
+        self.assertEqual(self.names("барс"), ["Барсик", "Мурка"])
+        self.assertEqual(self.names("смирнов"), ["Шарик"])
+        self.assertEqual(self.names("нет такого"), [])
+
+    def test_list_view_uses_search(self):
+        response = self.client.get(reverse("patient_list"), {"q": "барс"})
+        self.assertEqual(
+            [patient.name for patient in response.context["patients"]],
+            ["Барсик", "Мурка"],
+        )
+
+
+class OwnerTests(TestCase):
+    def setUp(self):
+        self.doctor = Doctor.objects.create(full_name="Врач", specialization="Хирург")
+        self.owner = Owner.objects.resolve("Иван Петров", "+7 (999) 123-45-67")
+        self.cat = Patient.objects.create(
+            name="Барсик", species="Кошка", owner=self.owner
+        )
+
+    def test_pets_of_one_phone_share_owner(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                Owner.objects.resolve("Петров", "8 999 123 45 67"), self.owner
+            )
+
+        response = self.client.post(
+            reverse("home"),
+            {
+                "owner_name": "Петров Иван",
+                "owner_phone": "8 (999) 123-45-67",
+                "pet_name": "Шарик",
+                "pet_species": "Собака",
+                "doctor": self.doctor.pk,
+                "date": (timezone.localdate() + datetime.timedelta(days=1)).isoformat(),
+                "time_slot": "10:30",
+            },
+        )
+        self.assertRedirects(response, reverse("home"))
+        self.assertEqual(Owner.objects.count(), 1)
+        self.assertEqual(
+            sorted(self.owner.pets.values_list("name", flat=True)), ["Барсик", "Шарик"]
+        )
+        self.assertEqual(
+            [patient.name for patient in search_patients("+7 999 123-45-67")],
+            ["Барсик", "Шарик"],
+        )
+
+    def test_edit_renames_owner_of_all_pets(self):
+        dog = Patient.objects.create(name="Шарик", species="Собака", owner=self.owner)
+        response = self.client.post(
+            reverse("patient_edit", args=[self.cat.pk]),
+            {
+                "name": "Барсик",
+                "species": "Кошка",
+                "owner_name": "Пётр Иванов",
+                "owner_phone": "+7 (999) 123-45-67",
+            },
+        )
+        self.assertRedirects(response, reverse("patient_detail", args=[self.cat.pk]))
+        dog.owner.refresh_from_db()
+        self.assertEqual(dog.owner.name, "Пётр Иванов")
+        self.assertEqual(Owner.objects.count(), 1)
+
+
+class PatientDedupeTests(TestCase):
+    def setUp(self):
+        self.doctor = Doctor.objects.create(full_name="Врач", specialization="Хирург")
+        self.patient = Patient.objects.create(
+            name="Барсик",
+            species="Кошка",
+            owner=Owner.objects.resolve("Иван Петров", "+7 (999) 123-45-67"),
+        )
+
+    def test_phone_key_is_canonical(self):
+        self.assertEqual(phone_digits("8 (999) 123-45-67"), "79991234567")
+        self.assertEqual(phone_digits("+7 999 1234567"), "79991234567")
+        self.assertEqual(phone_digits("8-800"), "8800")
+        self.assertEqual(clean_phone("8 (999) 123-45-67"), "+79991234567")
+        with self.assertRaisesMessage(ValidationError, "начинаться с +7 или 8"):
+            clean_phone("1 (999) 123-45-67")
+
+    def test_booking_reuses_patient_by_phone_and_pet_name(self):
+        tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+        with self.assertNumQueries(1):
+            found = Patient.objects.matching(" барсик ", "8 999 123 45 67").first()
+        self.assertEqual(found, self.patient)
+
+        response = self.client.post(
+            reverse("home"),
+            {
+                "owner_name": "Петров Иван",
+                "owner_phone": "8 (999) 123-45-67",
+                "pet_name": "БАРСИК",
+                "pet_species": "Кошка",
+                "doctor": self.doctor.pk,
+                "date": tomorrow.isoformat(),
+                "time_slot": "10:30",
+            },
+        )
+        self.assertRedirects(response, reverse("home"))
+        self.assertEqual(Patient.objects.count(), 1)
+        self.assertEqual(self.patient.history.count(), 1)
+
+    def test_merge_moves_history_to_oldest_patient(self):
+        duplicate = Patient.objects.create(
+            name="барсик",
+            species="Кошка",
+            breed="Сиамская",
+            owner=Owner.objects.resolve("Петров И.", "8 999 123 45 67"),
+        )
+        other = Patient.objects.create(
+            name="Мурка",
+            species="Кошка",
+            owner=Owner.objects.resolve("Иван", "89991234567"),
+        )
+        start = timezone.now().replace(hour=10, minute=30)
+        for i, patient in enumerate([self.patient, duplicate, duplicate, other]):
+            Appointment.objects.create(
+                doctor=self.doctor,
+                patient=patient,
+                date_time=start + datetime.timedelta(days=i),
+            )
+
+        self.assertEqual(list(duplicate_groups()), [[self.patient.pk, duplicate.pk]])
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("merge_duplicate_patients", stdout=out)
+        self.assertIn("перенесено записей: 2", out.getvalue())
+
+        self.assertFalse(Patient.objects.filter(pk=duplicate.pk).exists())
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.breed, "Сиамская")
+        self.assertEqual(self.patient.history.count(), 3)
+        self.assertEqual(other.history.count(), 1)
+        self.assertEqual(list(duplicate_groups()), [])
+
+
+class PatientPdfTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        self.doctor = Doctor.objects.create(full_name="Врач", specialization="Терапевт")
+        self.patient = Patient.objects.create(
+            name="Барсик",
+            species="Кошка",
+            owner=Owner.objects.resolve("Иван", "+79990000000"),
+        )
+        self.appointment = Appointment.objects.create(
+            doctor=self.doctor,
+            patient=self.patient,
+            date_time=timezone.now(),
+            complaint="Осмотр",
+        )
+        self.url = reverse("patient_pdf", args=[self.patient.pk])
+
+    def wait_for_card(self):
+        path = pdf.card_path(pdf.card_version(self.patient))
+        deadline = time.monotonic() + 30
+        while not default_storage.exists(path):
+            self.assertLess(time.monotonic(), deadline, "PDF не отрисовался")
+            time.sleep(0.05)
+
+    def test_card_is_rendered_in_background_and_cached(self):
+        pending = self.client.get(self.url)
+        self.assertEqual(pending.status_code, 202)
+        self.assertIn("Retry-After", pending)
+        self.assertIn("no-store", pending["Cache-Control"])
+
+        self.wait_for_card()
+        ready = self.client.get(self.url)
+        self.assertEqual(ready.status_code, 200)
+        self.assertEqual(ready["Content-Type"], "application/pdf")
+        self.assertTrue(b"".join(ready.streaming_content).startswith(b"%PDF"))
+
+        etag = ready["ETag"]
+        cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+
+        self.appointment.diagnosis = "Здоров"
+        self.appointment.save()
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 202)
+        self.wait_for_card()
+        updated = self.client.get(self.url)
+        b"".join(updated.streaming_content)
+        self.assertNotEqual(updated["ETag"], etag)
+
+    def test_failed_render_is_logged_and_not_resubmitted(self):
+        class FailingExecutor:
+            submitted = 0
+
+            def submit(self, fn, *args):
+                FailingExecutor.submitted += 1
+                future = Future()
+                future.set_exception(RuntimeError("weasyprint упал"))
+                return future
+
+            def shutdown(self, wait=True):
+                pass
+
+        class BrokenExecutor(FailingExecutor):
+            def submit(self, fn, *args):
+                raise BrokenProcessPool("воркер погиб")
+
+        self.enterContext(mock.patch.object(pdf, "_executor", BrokenExecutor()))
+        self.enterContext(mock.patch.dict(pdf._failed, clear=True))
+        self.enterContext(
+            mock.patch.object(pdf, "spawn_executor", return_value=FailingExecutor())
+        )
+
+        with self.assertLogs("clinic.pdf", "ERROR"):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        # Сломанный пул заменён новым.
+        self.assertIsInstance(pdf._executor, FailingExecutor)
+
+        for _ in range(2):
+            failed = self.client.get(self.url)
+            self.assertEqual(failed.status_code, 503)
+            self.assertEqual(failed["Retry-After"], str(pdf.CARD_FAILURE_TIMEOUT))
+        self.assertEqual(FailingExecutor.submitted, 1)
+
+    def test_card_html_is_rendered_outside_the_lock(self):
+        executor = mock.Mock()
+        executor.submit.return_value = Future()
+        self.enterContext(mock.patch.object(pdf, "_executor", executor))
+        self.enterContext(mock.patch.dict(pdf._pending, clear=True))
+        locked = []
+        render = pdf.render_card_html
+
+        def render_card_html(patient):
+            locked.append(pdf._lock.locked())
+            return render(patient)
+
+        self.enterContext(mock.patch.object(pdf, "render_card_html", render_card_html))
+        version = pdf.card_version(self.patient)
+        future = pdf.render_card_in_background(self.patient, version)
+        self.assertIs(pdf.render_card_in_background(self.patient, version), future)
+        self.assertEqual(locked, [False])
+        executor.submit.assert_called_once()
+
+
+class PatientCardExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctors = [
+            Doctor.objects.create(full_name=f"Врач {i}", specialization="Терапевт")
+            for i in range(2)
+        ]
+        start = timezone.make_aware(datetime.datetime(2025, 12, 1, 9, 30))
+        for i, species in enumerate(["Кошка", "Собака", "Кошка", "Кошка"]):
+            patient = Patient.objects.create(
+                name=f"Питомец {i}",
+                species=species,
+                owner=Owner.objects.resolve(f"Владелец {i}", f"+7999000000{i}"),
+            )
+            Appointment.objects.create(
+                doctor=cls.doctors[i % 2],
+                patient=patient,
+                date_time=start + datetime.timedelta(days=i),
+                complaint="Осмотр",
+            )
+
+    def archive_names(self, data):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            return sorted(info.filename for info in archive.infolist())
+
+    def test_view_streams_filtered_cards_in_few_queries(self):
+        response = self.client.get(
+            reverse("patient_export"),
+            {"doctor": self.doctors[0].pk, "species": "Кошка"},
+        )
+        self.assertEqual(response["Content-Type"], "application/zip")
+        with CaptureQueriesContext(connection) as queries:
+            data = b"".join(response.streaming_content)
+
+        self.assertEqual(len(queries), 2)
+        names = self.archive_names(data)
+        self.assertEqual(len(names), 2)
+        self.assertTrue(all("Питомец" in name for name in names))
+
+    def test_concurrent_export_is_rejected(self):
+        url = reverse("patient_export")
+        first = self.client.get(url, {"species": "Собака"})
+        busy = self.client.get(url, {"species": "Собака"})
+        self.assertEqual(busy.status_code, 429)
+        self.assertIn("Retry-After", busy)
+
+        # Дочитанный ответ закрывается и освобождает место.
+        self.assertEqual(len(self.archive_names(b"".join(first.streaming_content))), 1)
+        again = self.client.get(url, {"species": "Собака"})
+        self.assertEqual(again.status_code, 200)
+        b"".join(again.streaming_content)
+
+    def test_export_is_streamed_under_asgi_and_frees_the_slot(self):
+        async def fetch():
+            response = await AsyncClient().get(reverse("patient_export"))
+            self.assertTrue(response.is_async)
+            return [chunk async for chunk in response.streaming_content]
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            chunks = async_to_sync(fetch)()
+
+        # По куску на карту и конец архива.
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(len(self.archive_names(b"".join(chunks))), 4)
+        again = self.client.get(reverse("patient_export"), {"species": "Собака"})
+        self.assertEqual(again.status_code, 200)
+        b"".join(again.streaming_content)
+
+    def test_rejects_half_open_period(self):
+        response = self.client.get(reverse("patient_export"), {"start": "2025-12-01"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_command_writes_archive_and_reports_throughput(self):
+        out = io.StringIO()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/cards.zip"
+            call_command(
+                "export_patient_cards",
+                path,
+                "--start=2025-12-02",
+                "--end=2025-12-03",
+                "--workers=2",
+                stdout=out,
+            )
+            with open(path, "rb") as archive:
+                self.assertEqual(len(self.archive_names(archive.read())), 2)
+        self.assertIn("стр/с", out.getvalue())
+
+
+class AppointmentReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctors = [
+            Doctor.objects.create(full_name=f"Врач {i}", specialization="Терапевт")
+            for i in range(2)
+        ]
+        patient = Patient.objects.create(
+            name="Барсик",
+            species="Кошка",
+            owner=Owner.objects.resolve("Иван", "+79990000000"),
+        )
+        start = timezone.make_aware(datetime.datetime(2025, 12, 1, 9, 30))
+        for i, status in enumerate(["planned", "completed", "completed", "canceled"]):
+            Appointment.objects.create(
+                doctor=cls.doctors[i % 2],
+                patient=patient,
+                date_time=start + datetime.timedelta(days=i),
+                complaint=f'Жалоба {i}, "срочно"',
+                status=status,
+            )
+
+    def test_csv_is_streamed_with_filters(self):
+        response = self.client.get(
+            reverse("appointment_report"),
+            {"status": "completed", "start": "2025-12-02", "end": "2025-12-02"},
+        )
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        with CaptureQueriesContext(connection) as queries:
+            content = b"".join(response.streaming_content).decode("utf-8-sig")
+
+        self.assertEqual(len(queries), 1)
+        self.assertIn("JOIN", queries[0]["sql"])
+        header, *rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(header[:3], ["ID", "Дата и время", "Статус"])
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0][1], "02.12.2025 09:30")
+        self.assertEqual(rows[0][2], "Завершено")
+        self.assertEqual(rows[0][3], "Врач 1")
+        self.assertEqual(rows[0][9], 'Жалоба 1, "срочно"')
+
+    def test_report_is_streamed_under_asgi(self):
+        async def fetch():
+            response = await AsyncClient().get(
+                reverse("appointment_report"), {"format": "xlsx"}
+            )
+            self.assertTrue(response.is_async)
+            return [chunk async for chunk in response.streaming_content]
+
+        with (
+            mock.patch("clinic.reports.REPORT_FLUSH_ROWS", 1),
+            warnings.catch_warnings(),
+        ):
+            # Django предупреждает, когда собирает синхронный поток в список.
+            warnings.simplefilter("error")
+            chunks = async_to_sync(fetch)()
+
+        self.assertGreater(len(chunks), 2)
+        with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+            sheet = archive.read("xl/worksheets/sheet1.xml").decode()
+        self.assertEqual(sheet.count("<row>"), 5)
+
+    def test_xlsx_is_a_valid_workbook(self):
+        response = self.client.get(
+            reverse("appointment_report"),
+            {"format": "xlsx", "doctor": self.doctors[0].pk},
+        )
+        data = b"".join(response.streaming_content)
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertIn("xl/workbook.xml", archive.namelist())
+            sheet = archive.read("xl/worksheets/sheet1.xml").decode()
+        self.assertEqual(sheet.count("<row>"), 3)
+        self.assertIn('Жалоба 2, "срочно"', sheet)
+
+    def test_command_writes_file_and_reports_throughput(self):
+        out = io.StringIO()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/appointments.csv"
+            call_command("export_appointments", path, "--status=completed", stdout=out)
+            with open(path, encoding="utf-8-sig") as report:
+                self.assertEqual(len(list(csv.reader(report))), 3)
+        self.assertIn("Записей: 2", out.getvalue())
+
+
+class AppointmentImportTests(TestCase):
+    HEADER = "external_id,date_time,doctor,pet_name,species,owner_name,owner_phone,status,diagnosis\n"
+
+    def setUp(self):
+        self.tmp = self.enterContext(tempfile.TemporaryDirectory())
+        self.path = f"{self.tmp}/visits.csv"
+        self.doctor = Doctor.objects.create(full_name="Врач", specialization="Хирург")
+        self.existing = Patient.objects.create(
+            name="Барсик",
+            species="Кошка",
+            owner=Owner.objects.resolve("Иван", "+7 (999) 000-00-00"),
+        )
+
+    def write(self, lines):
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(self.HEADER + "".join(lines))
+
+    def run_import(self, *args):
+        out = io.StringIO()
+        call_command("import_appointments", self.path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_dedupes_patients_and_upserts_by_external_id(self):
+        self.write(
+            [
+                "p-1,2024-01-10T10:00,Врач,барсик,Кошка,Иван,79990000000,,\n",
+                "p-2,2024-01-11T10:00,Новый врач,Шарик,Собака,Пётр,+79991112233,,\n",
+                "p-3,2024-01-12T10:00,Новый врач,шарик,Собака,Пётр,+7 (999) 111-22-33,,\n",
+            ]
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            output = self.run_import("--batch-size=2")
+        self.assertIn("Импортировано записей: 3", output)
+        self.assertEqual(Patient.objects.count(), 2)
+        self.assertEqual(self.existing.history.get().external_id, "p-1")
+        self.assertEqual(Doctor.objects.filter(full_name="Новый врач").count(), 1)
+        self.assertEqual(
+            sum(AppointmentDayStats.objects.values_list("count", flat=True)), 3
+        )
+
+        self.write(["p-1,2024-01-10T10:00,Врач,Барсик,Кошка,Иван,79990000000,,Ушиб\n"])
+        self.run_import()
+        self.assertEqual(Appointment.objects.count(), 3)
+        self.assertEqual(self.existing.history.get().diagnosis, "Ушиб")
+
+    def test_failed_import_resumes_from_checkpoint(self):
+        rows = [
+            f"r-{i},2024-02-0{i}T10:00,Врач,Барсик,Кошка,Иван,79990000000,,\n"
+            for i in range(1, 5)
+        ]
+        self.write(
+            rows[:2] + ["r-bad,вчера,Врач,Барсик,Кошка,Иван,7999,,\n"] + rows[2:]
+        )
+        with self.assertRaisesMessage(CommandError, "Строка 3"):
+            self.run_import("--batch-size=2")
+        self.assertEqual(Appointment.objects.count(), 2)
+
+        self.write(
+            rows[:2]
+            + ["r-fixed,2024-02-09T10:00,Врач,Барсик,Кошка,Иван,7999,,\n"]
+            + rows[2:]
+        )
+        output = self.run_import("--batch-size=2")
+        self.assertIn("Продолжаем после строки 2", output)
+        self.assertIn("Импортировано записей: 3", output)
+        self.assertEqual(Appointment.objects.count(), 5)
+        self.assertFalse(os.path.exists(self.path + ".checkpoint"))
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        cls.doctor = Doctor.objects.create(full_name="Врач", specialization="Хирург")
+        cls.patient = Patient.objects.create(
+            name="Барсик",
+            species="Кошка",
+            owner=Owner.objects.resolve("Иван Петров", "+79990000000"),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_appointments(self, count):
+        start = timezone.now() - datetime.timedelta(days=365)
+        patient = Patient.objects.create(
+            name="Шарик", species="Собака", owner=Owner.objects.resolve("Пётр", "+7999")
+        )
+        for i in range(count):
+            Appointment.objects.create(
+                doctor=self.doctor,
+                patient=patient,
+                date_time=start
+                + datetime.timedelta(hours=i + Appointment.objects.count()),
+            )
+
+    def changelist_queries(self):
+        url = reverse("admin:clinic_appointment_changelist")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"status__exact": "planned"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("всего", response.content.decode().lower())
+        return len(queries)
+
+    def test_appointment_changelist_queries_do_not_grow_with_rows(self):
+        self.add_appointments(2)
+        few = self.changelist_queries()
+        self.add_appointments(20)
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_patient_autocomplete_uses_trigram_search(self):
+        response = self.client.get(
+            reverse("admin:autocomplete"),
+            {
+                "term": "петро",
+                "app_label": "clinic",
+                "model_name": "appointment",
+                "field_name": "patient",
+            },
+        )
+        results = response.json()["results"]
+        self.assertEqual([r["id"] for r in results], [str(self.patient.pk)])
+
+    def test_estimated_paginator_falls_back_to_exact_count(self):
+        self.add_appointments(3)
+        appointments = Appointment.objects.order_by("pk")
+        self.assertEqual(EstimatedCountPaginator(appointments, 2).count, 3)
+        with mock.patch("clinic.pagination.EXACT_COUNT_LIMIT", 0):
+            with self.assertNumQueries(1):
+                estimate = EstimatedCountPaginator(appointments, 2).count
+        self.assertGreaterEqual(estimate, 0)
+
+
+class BenchmarkSuiteTests(TempMediaMixin, TestCase):
+    def test_generated_data_is_reproducible_and_benchmarked(self):
+        call_command(
+            "generate_clinic_data",
+            "--doctors=3",
+            "--patients=30",
+            "--appointments=200",
+            "--years=0.5",
+            stdout=io.StringIO(),
+        )
+        self.assertEqual(Appointment.objects.count(), 200)
+        self.assertIsNone(default_partition_range())
+        self.assertFalse(
+            Appointment.objects.filter(date_time__gt=timezone.now())
+            .exclude(status="planned")
+            .exists()
+        )
+        first = list(Patient.objects.order_by("pk").values_list("name", "owner__phone"))
+
+        call_command(
+            "generate_clinic_data",
+            "--doctors=3",
+            "--patients=30",
+            "--appointments=200",
+            "--years=0.5",
+            "--replace",
+            stdout=io.StringIO(),
+        )
+        again = list(Patient.objects.order_by("pk").values_list("name", "owner__phone"))
+        self.assertEqual(again, first)
+
+        out = io.StringIO()
+        call_command("run_benchmarks", "--repeat=3", stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["meta"]["appointments"], 200)
+        for name, result in report["scenarios"].items():
+            self.assertEqual(result["errors"], 0, name)
+            self.assertGreater(result["queries_p50"], 0, name)
+        self.assertEqual(Appointment.objects.count(), 200)
+
+    def test_patient_search_benchmark_rolls_back_its_data(self):
+        out = io.StringIO()
+        call_command(
+            "bench_patient_search",
+            "--sizes=50",
+            "--repeat=1",
+            "--queries",
+            "Барсик",
+            stdout=out,
+        )
+        self.assertIn("Пациентов: 50", out.getvalue())
+        self.assertFalse(Patient.objects.exists())
+        self.assertFalse(Owner.objects.exists())
+
+    def test_generate_clinic_data_reports_missing_slots(self):
+        with self.assertRaisesMessage(CommandError, "слотов"):
+            call_command(
+                "generate_clinic_data",
+                "--doctors=1",
+                "--patients=1",
+                "--appointments=100000",
+                "--years=0.1",
+                stdout=io.StringIO(),
+            )
+        self.assertFalse(Patient.objects.exists())
@@ -4,14 +4,32 @@ from . import views
 
 urlpatterns = [
     path("", views.HomeView.as_view(), name="home"),
+    path("api/free-slots/", views.free_slots_view, name="free_slots"),
+    path("api/doctors/", views.doctor_choices_view, name="doctor_choices"),
+    path("metrics/", views.metrics_view, name="metrics"),
+    path("api/cache-stats/", views.cache_stats_view, name="cache_stats"),
     path("doctor/", views.DoctorDashboardView.as_view(), name="doctor_dashboard"),
+    path("schedule/", views.ScheduleBoardView.as_view(), name="schedule_board"),
+    path("schedule/stream/", views.schedule_stream_view, name="schedule_stream"),
+    path("stats/", views.ClinicStatsView.as_view(), name="clinic_stats"),
     path("doctor/add/", views.DoctorCreateView.as_view(), name="doctor_add"),
     path("set-doctor/<int:doctor_id>/", views.set_doctor_session, name="set_doctor"),
     path("patients/", views.PatientListView.as_view(), name="patient_list"),
+    path("patients/export/", views.patient_cards_export_view, name="patient_export"),
+    path(
+        "reports/appointments/",
+        views.appointment_report_view,
+        name="appointment_report",
+    ),
     path("patient/<int:pk>/", views.PatientDetailView.as_view(), name="patient_detail"),
     path(
         "patient/<int:pk>/edit/", views.PatientUpdateView.as_view(), name="patient_edit"
     ),
+    path(
+        "patient/<int:pk>/history/",
+        views.patient_history_view,
+        name="patient_history",
+    ),
     path("patient/<int:pk>/pdf/", views.patient_pdf_view, name="patient_pdf"),
     path(
         "appointment/<int:pk>/examine/",
@@ -0,0 +1,44 @@
+import time
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    """Текущая версия набора закэшированных данных.
+
+    Начинается с текущего времени, а не с 1, чтобы после вытеснения ключа
+    версии не подхватить старые данные, оставшиеся в кэше.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        get_version(key)
+
+
+def bump_versions(keys):
+    """Поднимает сразу много версий одним обращением к кэшу.
+
+    Удалённая версия при следующем чтении начнётся с текущего времени,
+    то есть заведомо больше прежней.
+    """
+    cache.delete_many(keys)
+
+
+async def aget_versions(keys):
+    """Как get_version, но для многих ключей сразу и из асинхронного кода."""
+    versions = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        version = time.time_ns()
+        for key in missing:
+            await cache.aadd(key, version, None)
+        versions.update(await cache.aget_many(missing))
+    return versions
@@ -1,49 +1,123 @@
 import datetime
-import os
-import urllib.parse
-import urllib.request
 
-import weasyprint
+from asgiref.sync import sync_to_async
 from django.contrib import messages
-from django.db.models import Q
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404, redirect
-from django.template.loader import render_to_string
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404, redirect, render
+from django.template.response import TemplateResponse
 from django.urls import reverse_lazy
-from django.views.generic import CreateView, DetailView, ListView, UpdateView
-
-from .forms import AppointmentForm, DoctorAppointmentForm, DoctorForm, PatientForm
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import quote_etag
+from django.views.generic import (
+    CreateView,
+    DetailView,
+    ListView,
+    TemplateView,
+    UpdateView,
+    View,
+)
+
+from .booking import book_appointment
+from .db import ReplicaMixin, pin_primary, use_replica
+from .forms import (
+    AppointmentForm,
+    AppointmentReportForm,
+    CardExportForm,
+    DoctorAppointmentForm,
+    DoctorForm,
+    FreeSlotsForm,
+    PatientForm,
+    StatsPeriodForm,
+)
+from .history import render_history
+from .live import event_stream, poll_events
+from .metrics import render_prometheus, shared_snapshots
 from .models import Appointment, Doctor, Patient
+from .pagination import KeysetPaginationMixin
+from .pdf import (
+    CARD_FAILURE_TIMEOUT,
+    card_failed,
+    card_path,
+    card_version,
+    export_queryset,
+    render_card_in_background,
+    try_export_cards_zip,
+)
+from .reports import REPORT_FORMATS, report_queryset, report_rows
+from .roster import doctor_roster, roster_doctor, roster_stats
+from .search import search_patients
+from .slots import afree_slots
+from .stats import clinic_stats
+from .streaming import streaming_body
+
+# Через сколько секунд обновлять страницу ожидания PDF.
+PDF_RETRY_AFTER = 2
+
+# Через сколько секунд повторить выгрузку карт, если сервер занят другой.
+CARD_EXPORT_RETRY_AFTER = 30
+
+# Сколько вариантов отдаёт поиск для SearchSelect и сколько секунд
+# браузер может их кэшировать.
+CHOICES_LIMIT = 20
+
+CHOICES_MAX_AGE = 60
 
 
 class DoctorsContext:
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["doctors_list"] = Doctor.objects.all()
-        context["doctor_form"] = DoctorForm()
+        context["doctors_list"] = doctor_roster()
+        # Форма нужна только модальному окну, строим её при первом обращении.
+        context["doctor_form"] = SimpleLazyObject(DoctorForm)
         return context
 
 
-class DoctorDashboardView(DoctorsContext, ListView):
+class DoctorDashboardView(
+    ReplicaMixin, DoctorsContext, KeysetPaginationMixin, ListView
+):
     model = Appointment
     template_name = "clinic/doctor_dashboard.html"
     context_object_name = "appointments"
-    ordering = ["date_time"]
+    paginate_by = 50
 
     def get_queryset(self):
-        qs = super().get_queryset()
-        doctor_id = self.request.session.get("doctor_id")
-        if doctor_id:
-            qs = qs.filter(doctor_id=doctor_id)
+        qs = (
+            super()
+            .get_queryset()
+            .select_related("patient__owner")
+            .only(
+                "date_time",
+                "complaint",
+                "status",
+                "patient__name",
+                "patient__species",
+                "patient__owner__name",
+                "patient__owner__phone",
+            )
+        )
+        if self.request.doctor:
+            qs = qs.filter(doctor_id=self.request.doctor["id"])
 
         filter_param = self.request.GET.get("filter")
-        today = datetime.date.today()
+        today = timezone.localdate()
 
         if filter_param == "today":
-            qs = qs.filter(date_time__date=today)
+            qs = qs.on_day(today)
         elif filter_param == "tomorrow":
             tomorrow = today + datetime.timedelta(days=1)
-            qs = qs.filter(date_time__date=tomorrow)
+            qs = qs.on_day(tomorrow)
 
         return qs
 
@@ -53,10 +127,72 @@ class DoctorDashboardView(DoctorsContext, ListView):
         return context
 
 
+class ScheduleBoardView(ReplicaMixin, DoctorsContext, ListView):
+    """Все записи на сегодня; дальше изменения приходят через schedule_stream."""
+
+    model = Appointment
+    template_name = "clinic/schedule_board.html"
+    context_object_name = "appointments"
+
+    def get_queryset(self):
+        return (
+            Appointment.objects.on_day(timezone.localdate())
+            .select_related("doctor", "patient__owner")
+            .order_by("date_time", "doctor__full_name")
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["day"] = timezone.localdate()
+        return context
+
+
+async def schedule_stream_view(request):
+    """Поток server-sent events для табло.
+
+    Сколько бы экранов ни было открыто, изменение записи стоит одного
+    NOTIFY в базе, а не опроса от каждого экрана. Под WSGI Django сначала
+    дочитал бы бесконечный поток до конца, поэтому там табло опрашивает
+    сервер (poll_events).
+    """
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(
+            event_stream(), content_type="text/event-stream"
+        )
+    else:
+        response = HttpResponse(poll_events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+class ClinicStatsView(ReplicaMixin, DoctorsContext, TemplateView):
+    """Нагрузка врачей, виды животных и неявки за период.
+
+    Читает только AppointmentDayStats, сами записи не трогает.
+    """
+
+    template_name = "clinic/stats.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = StatsPeriodForm(self.request.GET)
+        context["form"] = form
+        if form.is_valid():
+            stats = clinic_stats(form.cleaned_data["start"], form.cleaned_data["end"])
+            names = {doctor["id"]: doctor["full_name"] for doctor in doctor_roster()}
+            for row in stats["doctors"]:
+                row["name"] = names.get(row["doctor_id"], "—")
+            context["stats"] = stats
+        return context
+
+
 def set_doctor_session(request, doctor_id):
-    doctor = get_object_or_404(Doctor, pk=doctor_id)
-    request.session["doctor_id"] = doctor.id
-    request.session["doctor_name"] = doctor.full_name
+    # ФИО в сессию не кладём: request.doctor берёт его из списка врачей,
+    # поэтому переименование сразу видно.
+    if roster_doctor(doctor_id) is None:
+        raise Http404("Нет такого врача")
+    request.session["doctor_id"] = doctor_id
     return redirect("doctor_dashboard")
 
 
@@ -66,115 +202,221 @@ class DoctorCreateView(CreateView):
     success_url = reverse_lazy("doctor_dashboard")
 
 
-class PatientDetailView(DoctorsContext, DetailView):
+class PatientDetailView(ReplicaMixin, DoctorsContext, DetailView):
     model = Patient
+    queryset = Patient.objects.select_related("owner")
     template_name = "clinic/patient_detail.html"
     context_object_name = "patient"
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["history_html"] = render_history(self.object.pk)
+        return context
+
+
+def patient_history_view(request, pk):
+    """Следующая страница истории для кнопки «Показать более ранние визиты»."""
+    with use_replica():
+        return HttpResponse(render_history(pk, request.GET.get("before")))
+
 
 class PatientUpdateView(DoctorsContext, UpdateView):
     model = Patient
+    queryset = Patient.objects.select_related("owner")
     form_class = PatientForm
     template_name = "clinic/patient_form.html"
 
+    def form_valid(self, form):
+        pin_primary(self.request)
+        return super().form_valid(form)
+
     def get_success_url(self):
         return reverse_lazy("patient_detail", kwargs={"pk": self.object.pk})
 
 
 def patient_pdf_view(request, pk):
-    patient = get_object_or_404(Patient, pk=pk)
-    history = Appointment.objects.filter(patient=patient).order_by("-date_time")
-    html_string = render_to_string(
-        "clinic/patient_pdf.html",
-        {
-            "patient": patient,
-            "history": history,
-        },
+    patient = get_object_or_404(Patient.objects.select_related("owner"), pk=pk)
+    version = card_version(patient)
+    etag = quote_etag(version)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response["ETag"] = etag
+        return response
+
+    path = card_path(version)
+    if not default_storage.exists(path):
+        # После неудачной вёрстки не ставим ту же карту в очередь снова.
+        failed = card_failed(version)
+        if not failed:
+            render_card_in_background(patient, version)
+        retry_after = CARD_FAILURE_TIMEOUT if failed else PDF_RETRY_AFTER
+        response = render(
+            request,
+            "clinic/patient_pdf_pending.html",
+            {"patient": patient, "retry_after": retry_after, "failed": failed},
+            status=503 if failed else 202,
+        )
+        response["Retry-After"] = retry_after
+        patch_cache_control(response, no_store=True)
+        return response
+
+    response = FileResponse(
+        default_storage.open(path),
+        content_type="application/pdf",
+        filename=f"card_{patient.name}.pdf",
+    )
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def patient_cards_export_view(request):
+    form = CardExportForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+
+    archive = try_export_cards_zip(export_queryset(**form.cleaned_data))
+    if archive is None:
+        response = JsonResponse(
+            {"errors": "Уже идёт другая выгрузка карт, попробуйте позже"}, status=429
+        )
+        response["Retry-After"] = CARD_EXPORT_RETRY_AFTER
+        return response
+    # Под ASGI архив отдаётся по одной карте, а не собирается в память.
+    response = StreamingHttpResponse(
+        streaming_body(request, archive), content_type="application/zip"
     )
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = f'inline; filename="card_{patient.name}.pdf"'
+    response["Content-Disposition"] = 'attachment; filename="patient_cards.zip"'
+    return response
+
 
-    weasyprint.HTML(string=html_string).write_pdf(response)
+def appointment_report_view(request):
+    form = AppointmentReportForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
 
+    filters = dict(form.cleaned_data)
+    stream, content_type = REPORT_FORMATS[filters.pop("format")]
+    rows = report_rows(report_queryset(**filters))
+    response = StreamingHttpResponse(
+        streaming_body(request, stream(rows)), content_type=content_type
+    )
+    response[
+        "Content-Disposition"
+    ] = f'attachment; filename="appointments.{form.cleaned_data["format"]}"'
     return response
 
 
 class AppointmentUpdateView(DoctorsContext, UpdateView):
     model = Appointment
+    queryset = Appointment.objects.select_related("patient__owner")
     form_class = DoctorAppointmentForm
     template_name = "clinic/appointment_form.html"
 
+    def form_valid(self, form):
+        pin_primary(self.request)
+        return super().form_valid(form)
+
     def get_success_url(self):
         return reverse_lazy("doctor_dashboard")
 
 
-class PatientListView(DoctorsContext, ListView):
+class PatientListView(ReplicaMixin, DoctorsContext, ListView):
     model = Patient
-    template_name = "clinic/patient_list"
+    template_name = "clinic/patient_list.html"
     context_object_name = "patients"
+    ordering = ["-pk"]
+    paginate_by = 25
 
     def get_queryset(self):
-        qs = super().get_queryset()
-        query = self.request.GET.get("q")
+        qs = super().get_queryset().select_related("owner")
+        query = self.request.GET.get("q", "").strip()
         if query:
-            qs = Patient.objects.filter(
-                Q(name__icontains=query)
-                | Q(owner_name__icontains=query)
-                | Q(owner_phone__icontains=query)
-            )
+            qs = search_patients(query, qs)
         return qs
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["export_form"] = CardExportForm()
+        return context
+
+
+class HomeView(View):
+    """Публичная запись на приём.
+
+    Представление асинхронное: пока запрос ждёт базу, воркер ASGI
+    обслуживает других посетителей. Валидация формы и запись идут в базу
+    через sync_to_async: ModelChoiceField и транзакция синхронные.
+    """
 
-class HomeView(CreateView):
     template_name = "clinic/home.html"
     success_url = reverse_lazy("home")
 
-    form_class = AppointmentForm
+    async def get(self, request):
+        return self.render_form(AppointmentForm())
 
-    def form_valid(self, form):
-        owner_name = form.cleaned_data["owner_name"]
-        owner_phone = form.cleaned_data["owner_phone"]
-        pet_species = form.cleaned_data["pet_species"]
-        pet_name = form.cleaned_data["pet_name"]
+    async def post(self, request):
+        form = AppointmentForm(request.POST)
+        if not await sync_to_async(form.is_valid)():
+            return self.render_form(form)
 
-        patient, created = Patient.objects.get_or_create(
-            name=pet_name,
-            owner_name=owner_name,
-            owner_phone=owner_phone,
-            defaults={"owner_phone": owner_phone, "species": pet_species},
-        )
+        try:
+            await sync_to_async(book_appointment)(form)
+        except IntegrityError:
+            # Слот уже занят: сработал appointment_unique_doctor_slot.
+            form.add_error("time_slot", AppointmentForm.SLOT_TAKEN_ERROR)
+            return self.render_form(form)
 
-        appointment = form.save(commit=False)
-        appointment.patient = patient
-        appointment.save()
+        pet_name = form.cleaned_data["pet_name"]
+        messages.success(request, f"Вы успешно записаны! Ждем Вас и {pet_name} :)")
+        return HttpResponseRedirect(self.success_url)
 
-        doctor = appointment.doctor
+    def render_form(self, form):
+        return TemplateResponse(self.request, self.template_name, {"form": form})
 
-        tg_msg = (
-            f"⚡ Новая запись к Вам!\n"
-            f"📅 {appointment.date_time.strftime('%d.%m %H:%M')}\n"
-            f"👤 {owner_name} ({owner_phone})\n"
-            f"🐾 {pet_name} ({pet_species})"
-        )
 
-        send_telegram_message(doctor.telegram_id, tg_msg)
+async def free_slots_view(request):
+    form = FreeSlotsForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
 
-        messages.success(self.request, f"Вы успешно записаны! Ждем Вас и {pet_name} :)")
-        return super().form_valid(form)
+    slots = await afree_slots(
+        form.cleaned_data["doctor"],
+        form.cleaned_data["start"],
+        form.cleaned_data["end"],
+    )
+    return JsonResponse(
+        {
+            "doctor": form.cleaned_data["doctor"],
+            "slots": {day.isoformat(): times for day, times in slots.items()},
+        }
+    )
 
 
-def send_telegram_message(chat_id, message):
-    bot_token = os.environ.get("TELEGRAM_BOT_TOKEN")
+def doctor_choices_view(request):
+    """Врачи для SearchSelect: поиск по закэшированному списку, без запросов."""
+    query = request.GET.get("q", "").strip().lower()
+    results = [
+        {
+            "id": doctor["id"],
+            "text": f"{doctor['full_name']} ({doctor['specialization']})",
+        }
+        for doctor in doctor_roster()
+        if query in doctor["full_name"].lower()
+        or query in doctor["specialization"].lower()
+    ]
+    response = JsonResponse({"results": results[:CHOICES_LIMIT]})
+    patch_cache_control(response, max_age=CHOICES_MAX_AGE)
+    return response
 
-    if not bot_token or not chat_id:
-        print("⚠️ Ошибка: Нет токена телеграм или ID врача")
-        return
 
-    base_url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    params = urllib.parse.urlencode({"chat_id": chat_id, "text": message})
-    url = f"{base_url}?{params}"
+def metrics_view(request):
+    return HttpResponse(
+        render_prometheus(shared_snapshots()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
 
-    try:
-        urllib.request.urlopen(url)
-    except Exception as e:
-        print(f"Ошибка отправки: {e}")
+def cache_stats_view(request):
+    return JsonResponse({"doctor_roster": roster_stats()})
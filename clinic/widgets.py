@@ -0,0 +1,40 @@
+from django import forms
+from django.urls import reverse
+
+
+class SearchSelect(forms.Select):
+    """Выпадающий список, варианты которого подгружаются поиском с сервера.
+
+    При рендере в HTML попадает только выбранное значение, поэтому форма
+    не читает всю таблицу, сколько бы в ней ни было строк. Остальное
+    приходит из url_name (JSON {"results": [{"id", "text"}]}) по мере ввода.
+    """
+
+    template_name = "clinic/widgets/search_select.html"
+
+    class Media:
+        js = ["clinic/js/search_select.js"]
+
+    def __init__(self, url_name, placeholder="", attrs=None):
+        super().__init__(attrs)
+        self.url_name = url_name
+        self.placeholder = placeholder
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context["widget"]["url"] = reverse(self.url_name)
+        context["widget"]["placeholder"] = self.placeholder
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [v for v in value if str(v).isdigit()]
+        options = [self.create_option(name, "", self.placeholder, not selected, 0)]
+        if selected:
+            field = self.choices.field
+            for index, obj in enumerate(field.queryset.filter(pk__in=selected), 1):
+                options.append(
+                    self.create_option(
+                        name, obj.pk, field.label_from_instance(obj), True, index
+                    )
+                )
+        return [(None, options, 0)]
@@ -0,0 +1,243 @@
+"""
+Django settings for config project.
+
+Общие настройки. Запускать с config.settings.development (manage.py)
+или config.settings.production (gunicorn, wsgi.py, asgi.py).
+
+Generated by 'django-admin startproject' using Django 6.0.1.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/6.0/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/6.0/ref/settings/
+"""
+import os
+from pathlib import Path
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+# See https://docs.djangoproject.com/en/6.0/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = os.environ.get("SECRET_KEY")
+
+DEBUG = False
+
+ALLOWED_HOSTS = []
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    "clinic",
+    "django.contrib.admin",
+    "django.contrib.auth",
+    "django.contrib.contenttypes",
+    "django.contrib.sessions",
+    "django.contrib.messages",
+    "django.contrib.staticfiles",
+    "django.contrib.postgres",
+]
+
+MIDDLEWARE = [
+    "django.middleware.security.SecurityMiddleware",
+    "clinic.middleware.PerformanceMiddleware",
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.middleware.common.CommonMiddleware",
+    "django.middleware.csrf.CsrfViewMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "clinic.middleware.CurrentDoctorMiddleware",
+    "django.contrib.messages.middleware.MessageMiddleware",
+    "django.middleware.clickjacking.XFrameOptionsMiddleware",
+]
+
+ROOT_URLCONF = "config.urls"
+
+TEMPLATES = [
+    {
+        # DjangoTemplates, который засекает время рендера для метрик.
+        "BACKEND": "clinic.metrics.TimedDjangoTemplates",
+        "DIRS": [],
+        "APP_DIRS": True,
+        "OPTIONS": {
+            "context_processors": [
+                "django.template.context_processors.request",
+                "django.contrib.auth.context_processors.auth",
+                "django.contrib.messages.context_processors.messages",
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = "config.wsgi.application"
+
+
+# Database
+# https://docs.djangoproject.com/en/6.0/ref/settings/#databases
+
+# Соединения не открываются заново на каждый запрос.
+# DB_POOL_MAX_SIZE > 0 включает пул psycopg 3 внутри процесса (размер — не
+# меньше числа потоков воркера). Иначе соединение живёт DB_CONN_MAX_AGE секунд
+# и проверяется перед повторным использованием.
+
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 1))
+
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 0))
+
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+
+DB_CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE", 60))
+
+
+def database(host):
+    config = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("DB_NAME", "vetclinic_db"),
+        "USER": os.environ.get("DB_USER", "postgres"),
+        "PASSWORD": os.environ.get("DB_PASSWORD", "postgres"),
+        "HOST": host,
+        "PORT": os.environ.get("DB_PORT", "5432"),
+    }
+    if DB_POOL_MAX_SIZE:
+        config["OPTIONS"] = {
+            "pool": {
+                "min_size": DB_POOL_MIN_SIZE,
+                "max_size": DB_POOL_MAX_SIZE,
+                "timeout": DB_POOL_TIMEOUT,
+            }
+        }
+    else:
+        config["CONN_MAX_AGE"] = DB_CONN_MAX_AGE
+    # С пулом проверку перед выдачей соединения делает сам psycopg_pool.
+    config["CONN_HEALTH_CHECKS"] = True
+    return config
+
+
+DATABASES = {"default": database(os.environ.get("DB_HOST", "db"))}
+
+# Реплика для страниц только на чтение (см. clinic.db.ReplicaMixin).
+if os.environ.get("DB_REPLICA_HOST"):
+    DATABASES["replica"] = database(os.environ["DB_REPLICA_HOST"])
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+
+DATABASE_ROUTERS = ["clinic.db.ReadReplicaRouter"]
+
+
+# Password validation
+# https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
+    },
+    {
+        "NAME": "django.contrib.auth.password_validation.MinimumLengthValidator",
+    },
+    {
+        "NAME": "django.contrib.auth.password_validation.CommonPasswordValidator",
+    },
+    {
+        "NAME": "django.contrib.auth.password_validation.NumericPasswordValidator",
+    },
+]
+
+
+# Cache
+# В продакшене общий Redis (REDIS_URL=redis://host:6379/0), иначе память процесса.
+
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+
+# Сессии читаются из кэша, база нужна только при записи и промахе кэша.
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/6.0/topics/i18n/
+
+LANGUAGE_CODE = "en-us"
+
+TIME_ZONE = "UTC"
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/6.0/howto/static-files/
+
+STATIC_URL = "static/"
+
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+MEDIA_URL = "media/"
+
+MEDIA_ROOT = BASE_DIR / "media"
+
+
+# Telegram notifications
+# Отправка идёт из очереди командой `manage.py send_notifications`.
+
+TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
+
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
+
+TELEGRAM_TIMEOUT = 10
+
+TELEGRAM_CHAT_INTERVAL = 1.0
+
+# Сколько сообщений в разные чаты отправляется одновременно.
+TELEGRAM_CONCURRENCY = 10
+
+NOTIFICATION_BATCH_SIZE = 50
+
+NOTIFICATION_MAX_ATTEMPTS = 8
+
+# На сколько секунд взятая воркером пачка скрывается от других воркеров.
+NOTIFICATION_LEASE = 60
+
+NOTIFICATION_RETRY_DELAY = 5
+
+NOTIFICATION_RETRY_MAX_DELAY = 3600
+
+
+# Метрики запросов (clinic.middleware.PerformanceMiddleware, /metrics/)
+
+PERF_SERVER_TIMING = True
+
+# Запросы дольше этого порога пишутся в лог clinic.performance,
+# но только указанная доля из них, чтобы не засыпать лог при нагрузке.
+PERF_SLOW_REQUEST_SECONDS = float(os.environ.get("PERF_SLOW_REQUEST_SECONDS", 0.5))
+
+PERF_SLOW_LOG_SAMPLE_RATE = float(os.environ.get("PERF_SLOW_LOG_SAMPLE_RATE", 0.1))
+
+
+# PDF-карты пациентов
+# Рендерятся в пуле процессов и хранятся в MEDIA_ROOT/patient_cards.
+
+PDF_RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", 2))
+
+# Процессы для пакетной выгрузки карт, 0 — по числу ядер.
+PDF_EXPORT_WORKERS = int(os.environ.get("PDF_EXPORT_WORKERS", 0))
+
+# Выгрузка через сайт: сколько выгрузок разом идёт в одном процессе сервера
+# (остальные получают 429) и сколько процессов рисует карты для каждой.
+PDF_EXPORT_CONCURRENCY = int(os.environ.get("PDF_EXPORT_CONCURRENCY", 1))
+
+PDF_EXPORT_VIEW_WORKERS = int(os.environ.get("PDF_EXPORT_VIEW_WORKERS", 2))
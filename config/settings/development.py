@@ -0,0 +1,5 @@
+from .base import *  # noqa: F401,F403
+
+DEBUG = True
+
+ALLOWED_HOSTS = ["0.0.0.0", "localhost", "127.0.0.1", "*"]
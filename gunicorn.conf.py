@@ -0,0 +1,31 @@
+"""Настройки gunicorn для продакшена: `gunicorn -c gunicorn.conf.py`.
+
+По умолчанию WSGI (config/wsgi.py) с потоковыми воркерами. С SERVER_MODE=asgi
+приложение берётся из config/asgi.py и обслуживается воркерами uvicorn.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+
+# Классическая формула gunicorn: два процесса на ядро плюс один.
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+if os.environ.get("SERVER_MODE") == "asgi":
+    wsgi_app = "config.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "config.wsgi:application"
+    worker_class = "gthread"
+    threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# Перезапуск воркеров ограничивает рост памяти (WeasyPrint, крупные выгрузки).
+max_requests = 1000
+max_requests_jitter = 100
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"